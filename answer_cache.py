@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from metrics import metrics
+
+class AnswerCache:
+    """Persistent SQLite cache of LLM answers.
+
+    The exact tier is keyed by model, temperature and a hash of the
+    prompt, which for grounded answers includes the retrieved context. The
+    optional semantic tier reuses a grounded answer for a different
+    question when retrieval returned the same chunks, in the same order,
+    and the questions' embeddings have a cosine similarity of at least
+    ``semantic_threshold``.
+
+    Grounded answers are recorded with the knowledge base version they
+    were generated from and only served for that version; ``invalidate``
+    drops the answers of every other version. Entries expire ``ttl``
+    seconds after they are stored, and the least recently used entries are
+    evicted beyond ``max_entries``.
+    """
+
+    # Puts between checks of the entry count
+    EVICT_EVERY = 64
+
+    def __init__(self, db_path: str, ttl: float = None, max_entries: int = None,
+                 semantic_threshold: float = None):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.semantic_threshold = semantic_threshold
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._puts = 0
+
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, kb_version TEXT, "
+            "retrieval_key TEXT, embedding BLOB, created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS answers_retrieval ON answers (retrieval_key)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used)")
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(model: str, temperature: float, prompt: str) -> str:
+        """Exact-tier key of an LLM request."""
+        payload = f"{model}\0{temperature}\0{prompt}".encode('utf-8')
+        return hashlib.sha256(payload).hexdigest()
+
+    @staticmethod
+    def make_retrieval_key(model: str, temperature: float, kb_version: str, chunk_ids: List) -> str:
+        """Semantic-tier key: the same model and settings answering from the same retrieved chunks."""
+        payload = json.dumps([model, temperature, kb_version, chunk_ids]).encode('utf-8')
+        return hashlib.sha256(payload).hexdigest()
+
+    def _oldest_valid(self) -> float:
+        return time.time() - self.ttl if self.ttl else float('-inf')
+
+    def get(self, key: str, kb_version: str = None, retrieval_key: str = None,
+            embedding: np.ndarray = None) -> Tuple[Optional[str], Optional[str]]:
+        """Look up an answer, returning it and the tier that matched ('exact' or 'semantic').
+
+        ``kb_version`` is None for answers that do not depend on the
+        knowledge base. The semantic tier is only consulted with a
+        ``retrieval_key``, a question ``embedding`` and a threshold.
+        """
+        oldest_valid = self._oldest_valid()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT response, kb_version, created FROM answers WHERE key = ?", (key,)
+            ).fetchone()
+            match, tier = None, None
+            if row is not None and row[1] == kb_version and row[2] >= oldest_valid:
+                match, tier = key, 'exact'
+            elif retrieval_key is not None and embedding is not None and self.semantic_threshold is not None:
+                rows = self.conn.execute(
+                    "SELECT key, response, embedding FROM answers "
+                    "WHERE retrieval_key = ? AND created >= ?",
+                    (retrieval_key, oldest_valid)
+                ).fetchall()
+                if rows:
+                    query = np.asarray(embedding, dtype='float32')
+                    query = query / np.linalg.norm(query)
+                    similarities = [float(np.frombuffer(blob, dtype='float32') @ query) for _, _, blob in rows]
+                    best = int(np.argmax(similarities))
+                    if similarities[best] >= self.semantic_threshold:
+                        row = rows[best][1:]
+                        match, tier = rows[best][0], 'semantic'
+
+            if match is not None:
+                self.conn.execute("UPDATE answers SET last_used = ? WHERE key = ?", (time.time(), match))
+                self.conn.commit()
+
+        if tier == 'exact':
+            self.hits += 1
+            metrics.increment('answer_cache_hits')
+        elif tier == 'semantic':
+            self.semantic_hits += 1
+            metrics.increment('answer_cache_semantic_hits')
+        else:
+            self.misses += 1
+            metrics.increment('answer_cache_misses')
+            return None, None
+        return row[0], tier
+
+    def put(self, key: str, response: str, kb_version: str = None, retrieval_key: str = None,
+            embedding: np.ndarray = None):
+        """Store an answer, with its retrieval key and question embedding for the semantic tier."""
+        blob = None
+        if embedding is not None:
+            vector = np.asarray(embedding, dtype='float32')
+            blob = (vector / np.linalg.norm(vector)).tobytes()
+        now = time.time()
+
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO answers "
+                "(key, response, kb_version, retrieval_key, embedding, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, response, kb_version, retrieval_key, blob, now, now)
+            )
+            self._puts += 1
+            if self._puts % self.EVICT_EVERY == 0:
+                self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        """Drop expired entries and the least recently used ones beyond max_entries."""
+        if self.ttl:
+            self.conn.execute("DELETE FROM answers WHERE created < ?", (self._oldest_valid(),))
+        if self.max_entries:
+            self.conn.execute(
+                "DELETE FROM answers WHERE key IN "
+                "(SELECT key FROM answers ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def invalidate(self, kb_version: Optional[str]):
+        """Drop the grounded answers of every knowledge base version except kb_version."""
+        with self.lock:
+            self.conn.execute(
+                "DELETE FROM answers WHERE kb_version IS NOT NULL AND kb_version != ?",
+                (kb_version or '',)
+            )
+            self._evict()
+            self.conn.commit()
+
+    @property
+    def hit_rate(self) -> float:
+        """Share of lookups by this process answered from either tier."""
+        lookups = self.hits + self.semantic_hits + self.misses
+        return (self.hits + self.semantic_hits) / lookups if lookups else 0.0
+
+    def stats(self) -> Dict:
+        """Hit counts of this process and the number of stored answers."""
+        return {
+            'hits': self.hits,
+            'semantic_hits': self.semantic_hits,
+            'misses': self.misses,
+            'hit_rate': self.hit_rate,
+            'entries': len(self)
+        }
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+    def close(self):
+        """Close the underlying database connection."""
+        with self.lock:
+            self.conn.close()
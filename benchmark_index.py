@@ -0,0 +1,140 @@
+import argparse
+import json
+import time
+import numpy as np
+from typing import List, Dict, Tuple
+from vector_store import VectorStore
+from config import Config
+
+def generate_vectors(num_vectors: int, dim: int, num_clusters: int = 100, seed: int = 0) -> np.ndarray:
+    """Generate clustered vectors that resemble sentence embeddings."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((num_clusters, dim)).astype('float32')
+    assignments = rng.integers(0, num_clusters, num_vectors)
+    noise = rng.standard_normal((num_vectors, dim)).astype('float32') * 0.5
+    return centers[assignments] + noise
+
+def build_store(index_type: str, vectors: np.ndarray, storage: str = 'float32') -> VectorStore:
+    """Build a vector store of the given type over the vectors."""
+    store = VectorStore(
+        vectors.shape[1],
+        index_type=index_type,
+        hnsw_m=Config.HNSW_M,
+        ef_construction=Config.HNSW_EF_CONSTRUCTION,
+        ef_search=Config.HNSW_EF_SEARCH,
+        nlist=Config.IVF_NLIST,
+        nprobe=Config.IVF_NPROBE,
+        pq_m=Config.PQ_M,
+        pq_nbits=Config.PQ_NBITS,
+        storage=storage,
+        rerank_factor=Config.RERANK_FACTOR
+    )
+    metadata = [{'content': '', 'source': '', 'title': '', 'chunk_id': i} for i in range(len(vectors))]
+    store.add_embeddings(vectors, metadata)
+    return store
+
+def recall_at_k(approx_ids: np.ndarray, exact_ids: np.ndarray) -> float:
+    """Fraction of the exact top-k neighbours found by the approximate search."""
+    k = exact_ids.shape[1]
+    hits = sum(len(set(a) & set(e)) for a, e in zip(approx_ids, exact_ids))
+    return hits / (len(exact_ids) * k)
+
+def measure(store: VectorStore, queries: np.ndarray, k: int, exact_ids: np.ndarray) -> Dict:
+    """Measure recall@k and single-query latency for a store."""
+    latencies = []
+    approx_ids = []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = store.search_ids(query.reshape(1, -1), k)
+        latencies.append(time.perf_counter() - start)
+        approx_ids.append(ids[0])
+    
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'recall_at_k': recall_at_k(np.array(approx_ids), exact_ids),
+        'latency_ms_p50': float(np.percentile(latencies_ms, 50)),
+        'latency_ms_p95': float(np.percentile(latencies_ms, 95)),
+        'latency_ms_mean': float(latencies_ms.mean())
+    }
+
+def load_store_vectors(filepath: str, num_queries: int, seed: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    """Load the vectors of a saved store and derive perturbed queries from them."""
+    num_shards = VectorStore.read_settings(filepath).get('num_shards', 1)
+    if num_shards > 1:
+        from sharded_store import ShardedVectorStore
+        store = ShardedVectorStore(384, num_shards=num_shards)
+    else:
+        store = VectorStore(384)
+    store.load(filepath)
+    vectors = store.reconstruct(np.arange(store.num_vectors))
+    
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(vectors), num_queries)
+    queries = vectors[picks] + rng.standard_normal((num_queries, vectors.shape[1])).astype('float32') * 0.02
+    return vectors, queries
+
+def run_benchmark(vectors: np.ndarray, queries: np.ndarray, k: int,
+                  index_types: List[str], ef_search_values: List[int], nprobe_values: List[int]) -> List[Dict]:
+    """Compare approximate index types against the exact flat index."""
+    print(f"Building exact flat index over {len(vectors)} vectors...")
+    flat_store = build_store('flat', vectors)
+    _, exact_ids = flat_store.search_ids(queries, k)
+    
+    results = [dict(index_type='flat', knob=None, build_seconds=None,
+                    **measure(flat_store, queries, k, exact_ids))]
+    
+    for index_type in index_types:
+        print(f"Building {index_type} index...")
+        start = time.perf_counter()
+        store = build_store(index_type, vectors)
+        build_seconds = time.perf_counter() - start
+        
+        if index_type == 'hnsw':
+            knobs = [('efSearch', value) for value in ef_search_values]
+        else:
+            knobs = [('nprobe', value) for value in nprobe_values]
+        
+        for knob_name, value in knobs:
+            if knob_name == 'efSearch':
+                store.set_search_params(ef_search=value)
+            else:
+                store.set_search_params(nprobe=value)
+            results.append(dict(index_type=index_type, knob=f"{knob_name}={value}",
+                                build_seconds=build_seconds,
+                                **measure(store, queries, k, exact_ids)))
+    
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Report recall@k and query latency of ANN index types against the exact flat index.")
+    parser.add_argument('--vectors', type=int, default=100000, help="Number of indexed vectors")
+    parser.add_argument('--queries', type=int, default=500, help="Number of queries")
+    parser.add_argument('--dim', type=int, default=384, help="Embedding dimension")
+    parser.add_argument('--store', help="Benchmark the vectors of a saved vector store (path without extension) instead of synthetic ones")
+    parser.add_argument('--k', type=int, default=Config.TOP_K_RETRIEVAL, help="Neighbours per query")
+    parser.add_argument('--index-types', nargs='+', default=['hnsw', 'ivf_flat', 'ivf_pq'])
+    parser.add_argument('--ef-search', nargs='+', type=int, default=[16, 32, 64, 128])
+    parser.add_argument('--nprobe', nargs='+', type=int, default=[1, 4, 16, 64])
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args()
+    
+    if args.store:
+        vectors, queries = load_store_vectors(args.store, args.queries)
+    else:
+        vectors = generate_vectors(args.vectors, args.dim)
+        queries = generate_vectors(args.queries, args.dim, seed=1)
+    
+    results = run_benchmark(vectors, queries, args.k, args.index_types, args.ef_search, args.nprobe)
+    
+    print(f"\n{'index':<10} {'knob':<14} {'recall@' + str(args.k):<10} {'p50 ms':>8} {'p95 ms':>8}")
+    for result in results:
+        print(f"{result['index_type']:<10} {result['knob'] or '-':<14} "
+              f"{result['recall_at_k']:<10.3f} {result['latency_ms_p50']:>8.3f} {result['latency_ms_p95']:>8.3f}")
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+if __name__ == "__main__":
+    main()
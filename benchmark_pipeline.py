@@ -0,0 +1,309 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import zlib
+import numpy as np
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Dict, Iterator, Optional
+from llm_interface import LLMInterface, AsyncLLMInterface
+from rag_pipeline import RAGPipeline
+from metrics import InMemoryCollector, metrics
+from config import Config
+
+TOPICS = {
+    'energy': "solar wind turbine battery grid storage hydro geothermal panel efficiency capacity".split(),
+    'climate': "emissions carbon temperature warming ocean glacier drought policy adaptation sea".split(),
+    'space': "orbit rocket satellite mission lunar mars telescope astronaut launch probe".split(),
+    'learning': "model training neural network dataset gradient feature label inference accuracy".split(),
+    'health': "patient clinical trial vaccine diagnosis therapy dosage symptom hospital outcome".split()
+}
+STUB_ANSWER = "Stub answer."
+
+FILLER = "the a of in and to with for on by from is are was were this that these new".split()
+
+def generate_sentence(rng: random.Random, topic: str) -> str:
+    words = [rng.choice(TOPICS[topic]) if rng.random() < 0.4 else rng.choice(FILLER)
+             for _ in range(rng.randint(8, 16))]
+    return ' '.join(words).capitalize() + '.'
+
+def generate_corpus(directory: str, num_documents: int, sentences_per_document: int, seed: int = 0) -> List[Path]:
+    """Write synthetic text documents, each about one topic."""
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    topics = list(TOPICS)
+    paths = []
+    for i in range(num_documents):
+        topic = topics[i % len(topics)]
+        path = Path(directory) / f"{topic}_{i:07d}.txt"
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(' '.join(generate_sentence(rng, topic) for _ in range(sentences_per_document)))
+        paths.append(path)
+    return paths
+
+def generate_questions(num_questions: int, seed: int = 1) -> List[str]:
+    rng = random.Random(seed)
+    topics = list(TOPICS)
+    return [f"What is said about {' and '.join(rng.sample(TOPICS[rng.choice(topics)], 2))}?"
+            for _ in range(num_questions)]
+
+class HashingEncoder:
+    """Deterministic bag-of-words hashing encoder standing in for the embedding model.
+    
+    Lets indexing and search be benchmarked at millions of chunks without
+    paying for transformer inference.
+    """
+    
+    tokenizer = None
+    max_seq_length = 256
+    
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+    
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+    
+    def encode(self, texts: List[str], batch_size: int = 32, show_progress_bar: bool = False) -> np.ndarray:
+        embeddings = np.full((len(texts), self.dim), 1e-3, dtype='float32')
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                embeddings[row, zlib.crc32(word.encode('utf-8')) % self.dim] += 1.0
+        return embeddings
+
+class StubLLMInterface(LLMInterface):
+    """LLMInterface that answers after a fixed latency instead of calling the API."""
+    
+    def __init__(self, latency: float):
+        self.model = Config.LLM_MODEL
+        self.latency = latency
+    
+    def generate_response(self, prompt: str) -> str:
+        time.sleep(self.latency)
+        return STUB_ANSWER
+    
+    def stream_response(self, prompt: str, status: Dict = None) -> Iterator[str]:
+        time.sleep(self.latency)
+        yield STUB_ANSWER
+
+class StubAsyncLLMInterface(AsyncLLMInterface):
+    """AsyncLLMInterface that answers after a fixed latency instead of calling the API."""
+    
+    def __init__(self, latency: float):
+        super().__init__()
+        self.latency = latency
+    
+    async def generate_response(self, prompt: str) -> str:
+        await asyncio.sleep(self.latency)
+        return STUB_ANSWER
+
+class BenchmarkPipeline(RAGPipeline):
+    """RAG pipeline with a stub LLM and, optionally, a hashing encoder instead of the embedding model."""
+    
+    def __init__(self, llm_latency: float, hashing_encoder: bool):
+        super().__init__()
+        self.llm_latency = llm_latency
+        self.hashing_encoder = hashing_encoder
+    
+    def _create_embedding_generator(self):
+        generator = super()._create_embedding_generator()
+        if self.hashing_encoder:
+            generator._model = HashingEncoder()
+        return generator
+    
+    @property
+    def llm_interface(self):
+        if self._llm_interface is None:
+            self._llm_interface = StubLLMInterface(self.llm_latency)
+        return self._llm_interface
+    
+    @property
+    def async_llm_interface(self):
+        if self._async_llm_interface is None:
+            self._async_llm_interface = StubAsyncLLMInterface(self.llm_latency)
+        return self._async_llm_interface
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process so far."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes
+        return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+    except ImportError:
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset / 2 ** 20
+        except (ImportError, AttributeError):
+            return None
+
+def benchmark_ingestion(rag: RAGPipeline, corpus_dir: str, num_documents: int) -> Dict:
+    """Run a streaming build of the corpus and collect the time spent in each stage.
+    
+    Streaming stages overlap on their worker threads, so the stage times
+    can add up to more than the wall-clock time of the build.
+    """
+    rag.embedding_generator.warmup()  # time encoding, not loading the model
+    collector = metrics.add_sink(InMemoryCollector())
+    try:
+        start = time.perf_counter()
+        num_chunks = rag.build_knowledge_base(corpus_dir, incremental=False, streaming=True)
+        seconds = time.perf_counter() - start
+    finally:
+        metrics.remove_sink(collector)
+    
+    stages = {
+        name[:-len('_seconds')]: sum(values) for name, values in collector.observations.items()
+        if name.endswith('_seconds') and name != 'build_knowledge_base_seconds'
+    }
+    for stage, stage_seconds in stages.items():
+        print(f"{stage:<16} {stage_seconds:>9.2f} s")
+    print(f"{'build':<16} {seconds:>9.2f} s  {num_chunks:>10} chunks")
+    return {
+        'seconds': seconds,
+        'stages': stages,
+        'num_documents': num_documents,
+        'num_chunks': num_chunks,
+        'documents_per_second': num_documents / seconds if seconds else None,
+        'chunks_per_second': num_chunks / seconds if seconds else None
+    }
+
+def latency_summary(seconds: List[float]) -> Dict:
+    milliseconds = np.array(seconds) * 1000
+    return {
+        'count': len(milliseconds),
+        'ms_mean': float(milliseconds.mean()),
+        'ms_p50': float(np.percentile(milliseconds, 50)),
+        'ms_p95': float(np.percentile(milliseconds, 95)),
+        'ms_p99': float(np.percentile(milliseconds, 99))
+    }
+
+def benchmark_queries(rag: RAGPipeline, questions: List[str], top_k: int, concurrency: int) -> Dict:
+    """Measure retrieval-only and end-to-end query latency, and async throughput."""
+    retrieval, end_to_end = [], []
+    stages = {}
+    for question in questions:
+        start = time.perf_counter()
+        rag._retrieve(question, top_k)
+        retrieval.append(time.perf_counter() - start)
+        
+        start = time.perf_counter()
+        result = rag.query(question, top_k=top_k)
+        end_to_end.append(time.perf_counter() - start)
+        for stage, seconds in result['timings'].items():
+            stages.setdefault(stage, []).append(seconds)
+    
+    async def run_concurrently():
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def one(question):
+            async with semaphore:
+                return await rag.aquery(question, top_k=top_k)
+        
+        return await asyncio.gather(*(one(question) for question in questions))
+    
+    start = time.perf_counter()
+    asyncio.run(run_concurrently())
+    async_seconds = time.perf_counter() - start
+    
+    return {
+        'retrieval': latency_summary(retrieval),
+        'query': latency_summary(end_to_end),
+        'query_stages': {stage: latency_summary(seconds) for stage, seconds in stages.items()},
+        'async_queries_per_second': len(questions) / async_seconds,
+        'async_concurrency': concurrency
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of ingestion and querying on a synthetic corpus with a stub LLM.")
+    parser.add_argument('--documents', type=int, default=1000, help="Synthetic documents to generate")
+    parser.add_argument('--sentences', type=int, default=40, help="Sentences per document")
+    parser.add_argument('--corpus-dir', help="Reuse or create the corpus here instead of a temporary directory")
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--top-k', type=int, default=Config.TOP_K_RETRIEVAL)
+    parser.add_argument('--llm-latency', type=float, default=0.5, help="Seconds the stub LLM takes per response")
+    parser.add_argument('--concurrency', type=int, default=Config.LLM_MAX_CONCURRENCY, help="In-flight async queries")
+    parser.add_argument('--hashing-encoder', action='store_true',
+                        help="Embed with a hashing encoder instead of the model, for very large corpora")
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args()
+    
+    work_dir = tempfile.mkdtemp(prefix='rag_benchmark_')
+    rag = None
+    try:
+        corpus_dir = args.corpus_dir or os.path.join(work_dir, 'corpus')
+        Config.VECTOR_DB_PATH = os.path.join(work_dir, 'vector_store')
+        Config.EMBEDDING_CACHE_ENABLED = False  # measure encoding, not cache hits
+        # The questions repeat, measure every one of them
+        Config.ANSWER_CACHE_ENABLED = False
+        Config.COALESCE_QUERIES = False
+        if args.hashing_encoder:
+            Config.CHUNKING_STRATEGY = 'characters'  # no model tokenizer to count tokens with
+            Config.EMBEDDING_WORKERS = 0  # worker processes would load the real model
+        
+        file_paths = sorted(Path(corpus_dir).glob('*.txt'))
+        if len(file_paths) != args.documents:
+            print(f"Generating {args.documents} documents in {corpus_dir}...")
+            file_paths = generate_corpus(corpus_dir, args.documents, args.sentences)
+        
+        print("\nIngestion")
+        rag = BenchmarkPipeline(args.llm_latency, args.hashing_encoder)
+        ingestion = benchmark_ingestion(rag, corpus_dir, len(file_paths))
+        rag.close()
+        
+        print("\nLoading index in a fresh pipeline...")
+        rag = BenchmarkPipeline(args.llm_latency, args.hashing_encoder)
+        start = time.perf_counter()
+        rag.load_knowledge_base()
+        load_seconds = time.perf_counter() - start
+        rag.embedding_generator.warmup()
+        
+        print(f"Running {args.queries} queries...")
+        queries = benchmark_queries(rag, generate_questions(args.queries), args.top_k, args.concurrency)
+        
+        results = {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count()
+            },
+            'settings': dict(vars(args), index_type=Config.INDEX_TYPE, vector_storage=Config.VECTOR_STORAGE,
+                             embedding_model=Config.EMBEDDING_MODEL, embedding_backend=Config.EMBEDDING_BACKEND,
+                             chunking_strategy=Config.CHUNKING_STRATEGY),
+            'ingestion': ingestion,
+            'index_load_seconds': load_seconds,
+            'queries': queries,
+            'peak_rss_mb': peak_rss_mb()
+        }
+        
+        print(f"\nChunks indexed:      {ingestion['num_chunks']}")
+        print(f"Index load:          {load_seconds * 1000:.1f} ms")
+        for name in ('retrieval', 'query'):
+            summary = queries[name]
+            print(f"{name.capitalize() + ' latency:':<20} p50 {summary['ms_p50']:.1f} ms, "
+                  f"p95 {summary['ms_p95']:.1f} ms, p99 {summary['ms_p99']:.1f} ms")
+        for stage, summary in queries['query_stages'].items():
+            print(f"  {stage:<18} p50 {summary['ms_p50']:.1f} ms, p95 {summary['ms_p95']:.1f} ms")
+        print(f"Async throughput:    {queries['async_queries_per_second']:.1f} queries/s "
+              f"at concurrency {args.concurrency}")
+        if results['peak_rss_mb'] is not None:
+            print(f"Peak RSS:            {results['peak_rss_mb']:.0f} MB")
+        
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+            print(f"\nResults written to {args.output}")
+    finally:
+        if rag is not None:
+            rag.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
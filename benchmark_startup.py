@@ -0,0 +1,79 @@
+import argparse
+import json
+import subprocess
+import sys
+import numpy as np
+from typing import List, Dict
+
+# Modules whose import dominates startup time
+HEAVY_MODULES = ('torch', 'sentence_transformers', 'faiss', 'openai', 'httpx', 'PyPDF2', 'onnxruntime')
+
+# Runs in a fresh interpreter so every measurement starts cold
+CHILD_SCRIPT = """
+import json, sys, time
+heavy = {heavy!r}
+stages = []
+def mark(name, start):
+    stages.append({{'stage': name, 'seconds': time.perf_counter() - start,
+                    'heavy_modules': [m for m in heavy if m in sys.modules]}})
+
+start = time.perf_counter()
+from rag_pipeline import RAGPipeline
+mark('import rag_pipeline', start)
+
+start = time.perf_counter()
+rag = RAGPipeline()
+mark('RAGPipeline()', start)
+
+if {load_kb!r}:
+    start = time.perf_counter()
+    rag.load_knowledge_base()
+    mark('load_knowledge_base()', start)
+
+if {embed!r}:
+    start = time.perf_counter()
+    rag.embedding_generator.generate_query_embedding('What is machine learning?')
+    mark('first query embedding', start)
+
+print(json.dumps(stages))
+"""
+
+def run_once(load_kb: bool, embed: bool) -> List[Dict]:
+    """Time the startup stages in a fresh interpreter."""
+    script = CHILD_SCRIPT.format(heavy=HEAVY_MODULES, load_kb=load_kb, embed=embed)
+    completed = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True)
+    # The pipeline prints progress, the timings are on the last line
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start time of the RAG pipeline stage by stage.")
+    parser.add_argument('--runs', type=int, default=5, help="Fresh interpreters to average over")
+    parser.add_argument('--skip-load', action='store_true', help="Do not load the knowledge base")
+    parser.add_argument('--skip-embed', action='store_true', help="Do not embed a first query (loads the model)")
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args()
+    
+    runs = [run_once(not args.skip_load, not args.skip_embed) for _ in range(args.runs)]
+    
+    results = []
+    for i, stage in enumerate(runs[0]):
+        seconds = np.array([run[i]['seconds'] for run in runs]) * 1000
+        results.append({
+            'stage': stage['stage'],
+            'ms_median': float(np.median(seconds)),
+            'ms_min': float(seconds.min()),
+            'heavy_modules_loaded': stage['heavy_modules']
+        })
+    
+    print(f"\n{'stage':<24} {'median ms':>10} {'min ms':>10}  heavy modules loaded")
+    for result in results:
+        print(f"{result['stage']:<24} {result['ms_median']:>10.1f} {result['ms_min']:>10.1f}  "
+              f"{', '.join(result['heavy_modules_loaded']) or '-'}")
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import argparse
+import json
+import time
+import faiss
+import numpy as np
+from typing import List, Dict
+from benchmark_index import generate_vectors, load_store_vectors, build_store, recall_at_k
+from vector_store import VectorStore
+from config import Config
+
+def index_bytes(store: VectorStore) -> int:
+    """Size of the serialized FAISS index, which is what stays resident in memory."""
+    return len(faiss.serialize_index(store.index))
+
+def full_vector_bytes(store: VectorStore) -> int:
+    """Size of the memory-mapped full-precision vectors kept on disk for re-ranking."""
+    return len(store.full_vectors) * store.embedding_dim * 4
+
+def measure_ranking(store: VectorStore, queries: np.ndarray, k: int, exact_ids: np.ndarray) -> Dict:
+    """Recall@k, exact-order agreement and single-query latency of a store."""
+    latencies = []
+    ids = []
+    for query in queries:
+        start = time.perf_counter()
+        _, query_ids = store.search_ids(query.reshape(1, -1), k)
+        latencies.append(time.perf_counter() - start)
+        ids.append(query_ids[0])
+    
+    ids = np.array(ids)
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'recall_at_k': recall_at_k(ids, exact_ids),
+        'same_order': float((ids == exact_ids).all(axis=1).mean()),
+        'latency_ms_p50': float(np.percentile(latencies_ms, 50))
+    }
+
+def run_benchmark(vectors: np.ndarray, queries: np.ndarray, k: int, index_type: str,
+                  storages: List[str], rerank_factor: int) -> List[Dict]:
+    """Compare compressed storage modes, with and without re-ranking, against float32 storage."""
+    print(f"Building float32 {index_type} index over {len(vectors)} vectors...")
+    reference = build_store(index_type, vectors)
+    _, exact_ids = build_store('flat', vectors).search_ids(queries, k)
+    reference_bytes = index_bytes(reference)
+    
+    results = [dict(storage='float32', rerank_factor=None, index_bytes=reference_bytes,
+                    memory_saved=0.0, full_vector_bytes=0,
+                    **measure_ranking(reference, queries, k, exact_ids))]
+    
+    for storage in storages:
+        print(f"Building {storage} {index_type} index...")
+        store = build_store(index_type, vectors, storage=storage)
+        size = index_bytes(store)
+        
+        for factor in (1, rerank_factor):
+            store.rerank_factor = factor
+            results.append(dict(storage=storage, rerank_factor=factor, index_bytes=size,
+                                memory_saved=1 - size / reference_bytes,
+                                full_vector_bytes=full_vector_bytes(store),
+                                **measure_ranking(store, queries, k, exact_ids)))
+    
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Report index memory saved by compressed vector storage against the ranking change it causes.")
+    parser.add_argument('--vectors', type=int, default=100000, help="Number of indexed vectors")
+    parser.add_argument('--queries', type=int, default=500, help="Number of queries")
+    parser.add_argument('--dim', type=int, default=384, help="Embedding dimension")
+    parser.add_argument('--store', help="Benchmark the vectors of a saved vector store (path without extension) instead of synthetic ones")
+    parser.add_argument('--k', type=int, default=Config.TOP_K_RETRIEVAL, help="Neighbours per query")
+    parser.add_argument('--index-type', default='flat', help="Index type: flat, hnsw or ivf_flat")
+    parser.add_argument('--storage', nargs='+', default=['fp16', 'int8', 'pq'])
+    parser.add_argument('--rerank-factor', type=int, default=Config.RERANK_FACTOR)
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args()
+    
+    if args.store:
+        vectors, queries = load_store_vectors(args.store, args.queries)
+    else:
+        vectors = generate_vectors(args.vectors, args.dim)
+        queries = generate_vectors(args.queries, args.dim, seed=1)
+    
+    results = run_benchmark(vectors, queries, args.k, args.index_type, args.storage, args.rerank_factor)
+    
+    print(f"\n{'storage':<8} {'rerank':>6} {'index MB':>9} {'saved':>7} {'recall@' + str(args.k):>10} "
+          f"{'same order':>11} {'p50 ms':>8}")
+    for result in results:
+        print(f"{result['storage']:<8} {result['rerank_factor'] or '-':>6} "
+              f"{result['index_bytes'] / 2 ** 20:>9.1f} {result['memory_saved']:>7.1%} "
+              f"{result['recall_at_k']:>10.3f} {result['same_order']:>11.3f} {result['latency_ms_p50']:>8.3f}")
+    print("\nRe-ranking reads full-precision vectors from a memory-mapped file on disk, "
+          f"{results[-1]['full_vector_bytes'] / 2 ** 20:.1f} MB here.")
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import argparse
+import json
+import time
+import numpy as np
+from typing import List, Dict
+from document_processor import DocumentProcessor
+from embedding_backends import load_embedding_model
+from config import Config
+
+def load_texts(documents_directory: str, max_texts: int) -> List[str]:
+    """Chunk the documents in a directory and return up to max_texts chunk texts."""
+    processor = DocumentProcessor()
+    documents = processor.load_documents(documents_directory)
+    chunks = processor.process_documents(documents)
+    return [chunk['content'] for chunk in chunks[:max_texts]]
+
+def measure_backend(model, texts: List[str], queries: List[str], batch_size: int) -> Dict:
+    """Embed texts in batches and queries one at a time, timing both."""
+    start = time.perf_counter()
+    embeddings = model.encode(texts, batch_size=batch_size)
+    batch_seconds = time.perf_counter() - start
+    
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        model.encode([query])
+        latencies.append(time.perf_counter() - start)
+    
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'embeddings': np.asarray(embeddings, dtype='float32'),
+        'texts_per_second': len(texts) / batch_seconds,
+        'query_ms_p50': float(np.percentile(latencies_ms, 50)),
+        'query_ms_p95': float(np.percentile(latencies_ms, 95))
+    }
+
+def cosine_drift(reference: np.ndarray, candidate: np.ndarray) -> np.ndarray:
+    """Row-wise cosine similarity between reference and candidate embeddings."""
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    return (reference * candidate).sum(axis=1)
+
+def neighbour_agreement(reference: np.ndarray, candidate: np.ndarray, k: int) -> float:
+    """Fraction of each text's top-k reference neighbours that the candidate embeddings also rank top-k."""
+    k = min(k, len(reference))
+    reference_ids = np.argsort(-(reference @ reference.T), axis=1)[:, :k]
+    candidate_ids = np.argsort(-(candidate @ candidate.T), axis=1)[:, :k]
+    hits = sum(len(set(r) & set(c)) for r, c in zip(reference_ids, candidate_ids))
+    return hits / (len(reference) * k)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare a quantized embedding backend against the full-precision torch reference.")
+    parser.add_argument('--backend', default='onnx_int8', help="Backend to check: torch_int8, onnx or onnx_int8")
+    parser.add_argument('--model', default=Config.EMBEDDING_MODEL)
+    parser.add_argument('--documents', default='./sample_documents', help="Directory of documents to embed")
+    parser.add_argument('--max-texts', type=int, default=1000)
+    parser.add_argument('--queries', type=int, default=100, help="Single-text encodes used for latency")
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--k', type=int, default=Config.TOP_K_RETRIEVAL, help="Neighbours compared for ranking agreement")
+    parser.add_argument('--min-cosine', type=float, default=0.99, help="Exit non-zero if the mean cosine falls below this")
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args()
+    
+    texts = load_texts(args.documents, args.max_texts)
+    if not texts:
+        print(f"No documents found in {args.documents}")
+        return
+    queries = [text[:200] for text in texts[:args.queries]]
+    
+    print(f"Embedding {len(texts)} texts with the torch reference...")
+    reference = measure_backend(load_embedding_model(args.model, 'torch'), texts, queries, args.batch_size)
+    print(f"Embedding {len(texts)} texts with {args.backend}...")
+    candidate = measure_backend(
+        load_embedding_model(args.model, args.backend, Config.EMBEDDING_BACKEND_DIR), texts, queries, args.batch_size
+    )
+    
+    cosines = cosine_drift(reference['embeddings'], candidate['embeddings'])
+    results = {
+        'backend': args.backend,
+        'model': args.model,
+        'num_texts': len(texts),
+        'cosine_mean': float(cosines.mean()),
+        'cosine_min': float(cosines.min()),
+        'cosine_p1': float(np.percentile(cosines, 1)),
+        f'neighbour_agreement_at_{args.k}': neighbour_agreement(reference['embeddings'], candidate['embeddings'], args.k)
+    }
+    for name, measured in (('torch', reference), (args.backend, candidate)):
+        for key in ('texts_per_second', 'query_ms_p50', 'query_ms_p95'):
+            results[f'{name}_{key}'] = measured[key]
+    
+    print(f"\n{'backend':<12} {'texts/s':>10} {'query p50 ms':>14} {'query p95 ms':>14}")
+    for name, measured in (('torch', reference), (args.backend, candidate)):
+        print(f"{name:<12} {measured['texts_per_second']:>10.1f} "
+              f"{measured['query_ms_p50']:>14.2f} {measured['query_ms_p95']:>14.2f}")
+    print(f"\nCosine to reference: mean {results['cosine_mean']:.5f}, "
+          f"min {results['cosine_min']:.5f}, p1 {results['cosine_p1']:.5f}")
+    print(f"Top-{args.k} neighbour agreement: {results[f'neighbour_agreement_at_{args.k}']:.3f}")
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    
+    if results['cosine_mean'] < args.min_cosine:
+        print(f"Mean cosine {results['cosine_mean']:.5f} is below {args.min_cosine}")
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
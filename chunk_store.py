@@ -0,0 +1,290 @@
+import json
+import mmap
+import os
+import numpy as np
+from typing import List, Dict, Iterable, Optional
+
+# Fields stored in dedicated columns; any other chunk fields go to the extra column
+CORE_FIELDS = ('content', 'source', 'title', 'chunk_id')
+
+class ChunkStore:
+    """Columnar on-disk storage for chunk metadata.
+
+    Chunk text lives in one contiguous UTF-8 blob addressed by an
+    offsets/lengths array, source and title are dictionary-encoded into
+    int32 code arrays and chunk ids are an int32 array. Loaded stores are
+    memory-mapped and a chunk is only decoded when it is accessed, so load
+    time and resident memory do not grow with the corpus.
+    """
+    
+    def __init__(self):
+        self._text = b''
+        self._offsets = np.zeros((0, 2), dtype='int64')
+        self._source_codes = np.zeros(0, dtype='int32')
+        self._title_codes = np.zeros(0, dtype='int32')
+        self._chunk_ids = np.zeros(0, dtype='int32')
+        self._extra_text = b''
+        self._extra_offsets = np.zeros((0, 2), dtype='int64')
+        self._sources = []
+        self._titles = []
+        self._pending = []  # chunks added since the last load, kept as dicts
+        self._updated = {}  # mapped chunks changed since the last load, by position
+        self._loaded_from = None  # path whose files hold exactly the mapped chunks
+    
+    def __len__(self) -> int:
+        return len(self._offsets) + len(self._pending)
+    
+    def __getitem__(self, idx: int) -> Dict:
+        """Decode a single chunk."""
+        idx = int(idx)
+        if idx < 0:
+            idx += len(self)
+        num_mapped = len(self._offsets)
+        if idx >= num_mapped:
+            return dict(self._pending[idx - num_mapped])
+        if idx in self._updated:
+            return dict(self._updated[idx])
+        
+        offset, length = self._offsets[idx]
+        chunk = {
+            'content': bytes(self._text[offset:offset + length]).decode('utf-8'),
+            'source': self._sources[self._source_codes[idx]],
+            'title': self._titles[self._title_codes[idx]],
+            'chunk_id': int(self._chunk_ids[idx])
+        }
+        chunk.update(self._extra(idx))
+        return chunk
+    
+    def _extra(self, idx: int) -> Dict:
+        """Decode the non-core fields of a mapped chunk."""
+        extra_offset, extra_length = self._extra_offsets[idx]
+        if not extra_length:
+            return {}
+        return json.loads(bytes(self._extra_text[extra_offset:extra_offset + extra_length]))
+    
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+    
+    def extend(self, chunks: Iterable[Dict]):
+        """Append chunks."""
+        self._pending.extend(chunks)
+    
+    def column(self, field: str) -> List:
+        """Return one field for every chunk, without decoding chunk text unless asked for."""
+        if field == 'source':
+            mapped = [self._sources[code] for code in self._source_codes]
+        elif field == 'title':
+            mapped = [self._titles[code] for code in self._title_codes]
+        elif field == 'chunk_id':
+            mapped = self._chunk_ids.tolist()
+        elif field == 'content':
+            mapped = [self[idx]['content'] for idx in range(len(self._offsets))]
+        else:
+            mapped = [self._extra(idx).get(field) for idx in range(len(self._offsets))]
+        for idx, chunk in self._updated.items():
+            mapped[idx] = chunk.get(field)
+        return mapped + [chunk.get(field) for chunk in self._pending]
+    
+    def update(self, idx: int, fields: Dict):
+        """Change fields of a stored chunk; the next save patches its row."""
+        idx = int(idx)
+        num_mapped = len(self._offsets)
+        if idx >= num_mapped:
+            self._pending[idx - num_mapped].update(fields)
+            return
+        self._updated[idx] = dict(self[idx], **fields)
+    
+    def delete(self, positions: Iterable[int]):
+        """Remove chunks by position; later positions shift down."""
+        removed = set(int(p) for p in positions)
+        num_mapped = len(self._offsets)
+        
+        keep = np.array([i not in removed for i in range(num_mapped)], dtype=bool)
+        self._offsets = self._offsets[keep]
+        self._source_codes = self._source_codes[keep]
+        self._title_codes = self._title_codes[keep]
+        self._chunk_ids = self._chunk_ids[keep]
+        self._extra_offsets = self._extra_offsets[keep]
+        
+        self._pending = [
+            chunk for i, chunk in enumerate(self._pending, num_mapped) if i not in removed
+        ]
+        if self._updated:
+            new_positions = np.cumsum(keep) - 1
+            self._updated = {
+                int(new_positions[idx]): chunk for idx, chunk in self._updated.items() if keep[idx]
+            }
+        if removed:
+            # The files on disk no longer match, the next save rewrites them
+            self._loaded_from = None
+    
+    def _paths(self, filepath: str, generation: int = 0, text_generation: int = 0) -> Dict[str, str]:
+        prefix = f"{filepath}.chunks"
+        
+        def path(file_generation: int, suffix: str) -> str:
+            # Generation 0 keeps the names of stores saved before generations existed
+            return f"{prefix}.{file_generation}.{suffix}" if file_generation else f"{prefix}.{suffix}"
+        
+        return {
+            'header': f"{prefix}.json",
+            'text': path(text_generation, 'text'),
+            'extra_text': path(text_generation, 'extra.text'),
+            'offsets': path(generation, 'offsets.npy'),
+            'source': path(generation, 'source.npy'),
+            'title': path(generation, 'title.npy'),
+            'chunk_id': path(generation, 'chunk_id.npy'),
+            'extra_offsets': path(generation, 'extra_offsets.npy')
+        }
+    
+    @staticmethod
+    def _read_header(filepath: str) -> Optional[Dict]:
+        try:
+            with open(f"{filepath}.chunks.json", 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+    
+    def save(self, filepath: str):
+        """Write all chunks in the columnar format and re-map them from disk.
+        
+        Every save writes its arrays, and a full rewrite also its text
+        blobs, to files of a new generation that only the header, replaced
+        last, refers to; a save that is interrupted leaves the previous
+        store intact. When saving back to the files the store was loaded
+        from, only the chunks added or updated since then are appended to
+        the text blobs, past the text the old header's offsets cover, and
+        the rows of updated chunks point at their new text; the text they
+        replace is only reclaimed by a full rewrite.
+        """
+        header = self._read_header(filepath)
+        append = self._loaded_from == filepath and header is not None
+        generation = header.get('generation', 0) + 1 if header is not None else 0
+        text_generation = header.get('text_generation', 0) if append else generation
+        paths = self._paths(filepath, generation, text_generation)
+        
+        if append:
+            updated = sorted(self._updated)
+            rows = [self._updated[idx] for idx in updated] + self._pending
+            sources, titles = list(self._sources), list(self._titles)
+            text_mode = 'ab'
+            text_position = os.path.getsize(paths['text'])
+            extra_position = os.path.getsize(paths['extra_text'])
+        else:
+            rows = (self[idx] for idx in range(len(self)))
+            sources, titles = [], []
+            text_mode = 'wb'
+            text_position = 0
+            extra_position = 0
+        
+        count = len(rows) if append else len(self)
+        offsets = np.zeros((count, 2), dtype='int64')
+        extra_offsets = np.zeros((count, 2), dtype='int64')
+        source_codes = np.zeros(count, dtype='int32')
+        title_codes = np.zeros(count, dtype='int32')
+        chunk_ids = np.zeros(count, dtype='int32')
+        source_lookup = {source: code for code, source in enumerate(sources)}
+        title_lookup = {title: code for code, title in enumerate(titles)}
+        
+        with open(paths['text'], text_mode) as text_file, open(paths['extra_text'], text_mode) as extra_file:
+            for idx, chunk in enumerate(rows):
+                content = chunk['content'].encode('utf-8')
+                text_file.write(content)
+                offsets[idx] = (text_position, len(content))
+                text_position += len(content)
+                
+                extra = {k: v for k, v in chunk.items() if k not in CORE_FIELDS}
+                if extra:
+                    encoded = json.dumps(extra).encode('utf-8')
+                    extra_file.write(encoded)
+                    extra_offsets[idx] = (extra_position, len(encoded))
+                    extra_position += len(encoded)
+                
+                source_codes[idx] = source_lookup.setdefault(chunk['source'], len(sources))
+                if source_codes[idx] == len(sources):
+                    sources.append(chunk['source'])
+                title_codes[idx] = title_lookup.setdefault(chunk['title'], len(titles))
+                if title_codes[idx] == len(titles):
+                    titles.append(chunk['title'])
+                chunk_ids[idx] = chunk['chunk_id']
+        
+        if append:
+            columns = []
+            for mapped, written in ((self._offsets, offsets), (self._source_codes, source_codes),
+                                    (self._title_codes, title_codes), (self._chunk_ids, chunk_ids),
+                                    (self._extra_offsets, extra_offsets)):
+                column = np.concatenate([mapped, written[len(updated):]])
+                column[updated] = written[:len(updated)]
+                columns.append(column)
+            offsets, source_codes, title_codes, chunk_ids, extra_offsets = columns
+        
+        for name, array in (('offsets', offsets), ('source', source_codes), ('title', title_codes),
+                            ('chunk_id', chunk_ids), ('extra_offsets', extra_offsets)):
+            with open(paths[name], 'wb') as f:
+                np.save(f, array)
+        
+        # Switch to the new files in one atomic step
+        tmp_path = f"{paths['header']}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'count': len(offsets),
+                'generation': generation,
+                'text_generation': text_generation,
+                'sources': sources,
+                'titles': titles
+            }, f)
+        os.replace(tmp_path, paths['header'])
+        
+        self._remove_unreferenced(filepath, paths)
+        self.load(filepath)
+    
+    @staticmethod
+    def _remove_unreferenced(filepath: str, paths: Dict[str, str]):
+        """Delete files of earlier generations and of interrupted saves."""
+        directory, prefix = os.path.split(f"{filepath}.chunks.")
+        referenced = {os.path.basename(path) for path in paths.values()}
+        for name in os.listdir(directory or '.'):
+            if name.startswith(prefix) and name not in referenced:
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    # Still mapped on Windows; a later save removes it
+                    pass
+    
+    @staticmethod
+    def _map_file(path: str):
+        """Memory-map a file read-only (empty files cannot be mapped)."""
+        if os.path.getsize(path) == 0:
+            return b''
+        with open(path, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    
+    def load(self, filepath: str):
+        """Memory-map a saved chunk store, checking its files are complete."""
+        header = self._read_header(filepath)
+        if header is None:
+            raise FileNotFoundError(f"No chunk store saved at {filepath}")
+        paths = self._paths(filepath, header.get('generation', 0), header.get('text_generation', 0))
+        
+        text = self._map_file(paths['text'])
+        columns = {name: np.load(paths[name], mmap_mode='r')
+                   for name in ('offsets', 'source', 'title', 'chunk_id', 'extra_offsets')}
+        count = header['count']
+        for name, column in columns.items():
+            if len(column) != count:
+                raise ValueError(f"Chunk store {filepath} is incomplete: {len(column)} {name} rows for {count} chunks")
+        if count and int(columns['offsets'][-1].sum()) > len(text):
+            raise ValueError(f"Chunk store {filepath} is incomplete: its text is truncated")
+        
+        self._sources = header['sources']
+        self._titles = header['titles']
+        self._text = text
+        self._extra_text = self._map_file(paths['extra_text'])
+        self._offsets = columns['offsets']
+        self._source_codes = columns['source']
+        self._title_codes = columns['title']
+        self._chunk_ids = columns['chunk_id']
+        self._extra_offsets = columns['extra_offsets']
+        self._pending = []
+        self._updated = {}
+        self._loaded_from = filepath
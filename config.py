@@ -6,24 +6,86 @@ load_dotenv()
 class Config:
     # OpenAI Configuration
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+    OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL')  # e.g. a local stub server for testing
     
     # Embedding Model Configuration
     EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+    EMBEDDING_CACHE_ENABLED = True
+    EMBEDDING_CACHE_PATH = './embedding_cache/embeddings.sqlite'
+    EMBEDDING_BACKEND = 'torch'  # 'torch', 'torch_int8', 'onnx' or 'onnx_int8' (CPU inference)
+    EMBEDDING_BACKEND_DIR = './embedding_models'  # cached ONNX exports
+    EMBEDDING_BATCH_SIZE = 32
+    EMBEDDING_WORKERS = 0  # worker processes for ingest embedding, 0 encodes in process
+    EMBEDDING_THREADS_PER_WORKER = None  # defaults to the CPU count divided by the workers
     
     # Chunking Configuration
-    CHUNK_SIZE = 300  # tokens
+    CHUNK_SIZE = 300  # tokens, capped at the embedding model's sequence limit
     CHUNK_OVERLAP = 50  # tokens
+    CHUNKING_STRATEGY = 'tokens'  # 'tokens' (embedding model tokenizer) or 'characters'
     
     # Retrieval Configuration
     TOP_K_RETRIEVAL = 5
+    MAX_CONCURRENT_GENERATIONS = 8  # parallel LLM calls in RAGPipeline.query_batch
+    COALESCE_QUERIES = True  # identical concurrent queries share one retrieval and LLM call
+    CONTEXT_PACKING = True  # merge adjacent chunks, drop repeated overlap, fit the token budget
+    CONTEXT_TOKEN_BUDGET = 2000  # LLM tokens of retrieved context per prompt
     
     # Vector Database Configuration
-    VECTOR_DB_PATH = './vector_store'
+    VECTOR_DB_PATH = './vector_store'  # versioned knowledge base snapshots live under here
+    SNAPSHOTS_TO_KEEP = 3  # complete snapshots kept on disk for rollback
+    SNAPSHOT_POLL_INTERVAL = 2.0  # seconds between checks for snapshots published elsewhere, None disables
+    SNAPSHOT_LEASE = 600.0  # seconds after which an unfinished snapshot from another host counts as abandoned
+    INDEX_TYPE = 'flat'  # 'flat' (exact), 'hnsw', 'ivf_flat' or 'ivf_pq'
+    HNSW_M = 32  # graph neighbours per node
+    HNSW_EF_CONSTRUCTION = 200
+    HNSW_EF_SEARCH = 64  # query-time candidate list size
+    IVF_NLIST = 1024  # inverted lists, capped by the number of training vectors
+    IVF_NPROBE = 16  # lists scanned per query
+    PQ_M = 48  # sub-quantizers, must divide the embedding dimension
+    PQ_NBITS = 8
+    VECTOR_STORAGE = 'float32'  # 'float32', 'fp16', 'int8' or 'pq' codes in the index
+    RERANK_FACTOR = 4  # candidates per result re-ranked against memory-mapped float32 vectors
+    DEDUPLICATE_CHUNKS = False  # index one chunk per group of exact or near-duplicate chunks
+    DUPLICATE_SIMILARITY = 0.95  # embedding cosine similarity near-duplicates must also reach
+    COMPACTION_DEAD_RATIO = 0.2  # share of deleted chunks in the index that triggers a background compaction
+    VECTOR_SHARDS = 1  # partitions searched in parallel, each with its own index
+    VECTOR_SHARD_PROCESSES = False  # hold each shard in a local worker process instead of this one
+    VECTOR_SHARD_ADDRESSES = None  # 'host:port' of shard_server.py workers, one per shard
+    VECTOR_SHARD_AUTHKEY = os.getenv('VECTOR_SHARD_AUTHKEY')  # shared secret of the shard workers
     
     # Document Processing
     SUPPORTED_FORMATS = ['.txt', '.md', '.pdf']
+    PARALLEL_LOADING = False  # extract PDFs in a process pool, read text files in a thread pool
+    LOADER_WORKERS = None  # defaults to the number of CPUs
     
     # LLM Configuration
     LLM_MODEL = 'gpt-3.5-turbo'
     MAX_TOKENS = 1000
-    TEMPERATURE = 0.1
\ No newline at end of file
+    TEMPERATURE = 0.1
+    LLM_TIMEOUT = 30.0  # seconds
+    LLM_MAX_CONCURRENCY = 16  # in-flight requests per AsyncLLMInterface
+    LLM_MAX_RETRIES = 5
+    LLM_RETRY_BASE_DELAY = 0.5  # seconds, doubled on every retry
+    LLM_RETRY_MAX_DELAY = 20.0  # seconds
+    
+    # Answer Cache Configuration
+    ANSWER_CACHE_ENABLED = True
+    ANSWER_CACHE_PATH = './answer_cache/answers.sqlite'
+    ANSWER_CACHE_TTL = 24 * 3600  # seconds an answer is served for, None keeps answers until evicted
+    ANSWER_CACHE_MAX_ENTRIES = 100000  # least recently used answers beyond this are evicted
+    SEMANTIC_CACHE_ENABLED = False  # reuse answers to similar questions that retrieved the same chunks
+    SEMANTIC_CACHE_THRESHOLD = 0.95  # question embedding cosine similarity a semantic hit must reach
+    
+    # Knowledge Base Build Configuration
+    INCREMENTAL_BUILD = False  # only re-process added, changed or removed documents
+    STREAMING_INGESTION = False  # bounded-memory batched ingestion with resumable checkpoints
+    INGEST_BATCH_SIZE = 256  # chunks embedded and added per batch
+    INGEST_QUEUE_SIZE = 4  # items buffered between pipeline stages
+    INGEST_FLUSH_EVERY = 20  # minimum batches between checkpoints
+    INGEST_FLUSH_GROWTH = 0.25  # share the store must grow by between checkpoints, each of which saves all of it
+    INGEST_TRAIN_SIZE = 50000  # vectors collected to train IVF indexes before the first add
+    
+    # Instrumentation
+    METRICS_LOGGING = False  # log every stage timing and counter through the logging module
+    METRICS_PORT = None  # serve Prometheus metrics on http://localhost:<port>/metrics
+    METRICS_HOST = '127.0.0.1'  # interface the metrics server listens on, '0.0.0.0' for every interface
@@ -0,0 +1,99 @@
+from typing import List, Dict, Callable
+
+# A chunk that does not fit is cut to the remaining budget only if at least this many tokens remain
+MIN_PARTIAL_TOKENS = 64
+
+# Shorter repeats between adjacent chunks are treated as coincidence, not overlap
+MIN_OVERLAP_WORDS = 3
+
+def tiktoken_counter(model: str) -> Callable[[str], int]:
+    """Token counter using the LLM's own tokenizer, or a rough estimate if tiktoken is unavailable."""
+    try:
+        import tiktoken
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding('cl100k_base')
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    except Exception as e:
+        print(f"Could not load a tokenizer for {model}, estimating token counts: {e}")
+        return lambda text: (len(text) + 3) // 4
+
+def strip_overlap(previous: str, current: str) -> str:
+    """Remove the longest run of words at the start of current that repeats the end of previous."""
+    previous_words = previous.split()
+    current_words = current.split()
+    for size in range(min(len(previous_words), len(current_words)), MIN_OVERLAP_WORDS - 1, -1):
+        if previous_words[-size:] == current_words[:size]:
+            return ' '.join(current_words[size:])
+    return current
+
+class ContextPacker:
+    """Packs retrieved chunks into a prompt token budget.
+
+    Hits that are consecutive chunks of the same source are merged into one
+    passage with the text they share through chunk overlap removed. Passages
+    are then taken in order of their best similarity score until the budget,
+    counted with the LLM's tokenizer, is used up.
+    """
+    
+    def __init__(self, max_tokens: int, count_tokens: Callable[[str], int]):
+        self.max_tokens = max_tokens
+        self.count_tokens = count_tokens
+    
+    def merge_adjacent(self, chunks: List[Dict]) -> List[Dict]:
+        """Merge consecutive chunks of the same source, dropping their overlapping text."""
+        by_source = {}
+        for chunk in chunks:
+            by_source.setdefault(chunk['source'], []).append(chunk)
+        
+        passages = []
+        for source_chunks in by_source.values():
+            source_chunks.sort(key=lambda chunk: chunk['chunk_id'])
+            passage = None
+            for chunk in source_chunks:
+                if passage is not None and chunk['chunk_id'] == passage['chunk_ids'][-1] + 1:
+                    passage['content'] = f"{passage['content']} {strip_overlap(passage['content'], chunk['content'])}".strip()
+                    passage['chunk_ids'].append(chunk['chunk_id'])
+                    passage['similarity_score'] = max(passage['similarity_score'], chunk.get('similarity_score', 0.0))
+                    continue
+                passage = dict(chunk, chunk_ids=[chunk['chunk_id']])
+                passage.setdefault('similarity_score', 0.0)
+                passages.append(passage)
+        
+        passages.sort(key=lambda passage: passage['similarity_score'], reverse=True)
+        return passages
+    
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        """Cut text at a word boundary to at most max_tokens tokens."""
+        words = text.split()
+        low, high = 0, len(words)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.count_tokens(' '.join(words[:middle])) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        return ' '.join(words[:low])
+    
+    def pack(self, chunks: List[Dict], format_passage: Callable[[int, Dict], str]) -> List[Dict]:
+        """Select passages in score order until the token budget is used up.
+
+        ``format_passage(position, passage)`` renders a passage the way it
+        appears in the prompt, so headers count against the budget too.
+        """
+        packed = []
+        remaining = self.max_tokens
+        for passage in self.merge_adjacent(chunks):
+            tokens = self.count_tokens(format_passage(len(packed) + 1, passage))
+            if tokens <= remaining:
+                packed.append(passage)
+                remaining -= tokens
+                continue
+            
+            overhead = self.count_tokens(format_passage(len(packed) + 1, dict(passage, content='')))
+            if remaining - overhead >= MIN_PARTIAL_TOKENS:
+                packed.append(dict(passage, content=self._truncate(passage['content'], remaining - overhead)))
+                break
+        
+        return packed
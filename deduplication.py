@@ -0,0 +1,223 @@
+import hashlib
+import os
+import re
+import zlib
+import numpy as np
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# MinHash signature length, split into LSH bands of NUM_PERMUTATIONS // LSH_BANDS rows;
+# 16 bands of 8 rows make texts above ~0.7 Jaccard similarity likely to share a band
+NUM_PERMUTATIONS = 128
+LSH_BANDS = 16
+
+# Texts are compared as sets of overlapping word n-grams of this length
+SHINGLE_WORDS = 3
+
+# Largest prime below 2**32, the modulus of the MinHash permutations
+_PRIME = 4294967291
+_random = np.random.RandomState(1)
+_A = _random.randint(1, _PRIME, NUM_PERMUTATIONS, dtype=np.int64).astype(np.uint64)
+_B = _random.randint(0, _PRIME, NUM_PERMUTATIONS, dtype=np.int64).astype(np.uint64)
+# Odd multipliers hashing the rows of an LSH band to 64 bits; collisions only add candidates
+_BAND_MULTIPLIERS = _random.randint(0, 2 ** 62, NUM_PERMUTATIONS // LSH_BANDS, dtype=np.int64).astype(np.uint64) * 2 + 1
+
+# Arrays of a saved duplicate index, stored next to the vector store
+INDEX_FILES = ('hashes', 'signatures', 'sorted_hashes', 'sorted_ids')
+
+# Metadata of a merged duplicate recorded on the chunk that represents it
+DUPLICATE_FIELDS = ('source', 'title', 'chunk_id', 'tags')
+
+Fingerprint = Tuple[str, np.ndarray]
+
+def fingerprint(text: str) -> Fingerprint:
+    """Exact-match key and MinHash signature of a text, ignoring case, punctuation and spacing."""
+    words = re.findall(r'\w+', text.lower())
+    key = hashlib.sha1(' '.join(words).encode('utf-8')).hexdigest()
+
+    shingles = {' '.join(words[i:i + SHINGLE_WORDS]) for i in range(max(1, len(words) - SHINGLE_WORDS + 1))}
+    hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8')) for shingle in shingles),
+                         dtype=np.uint64, count=len(shingles))
+    signature = ((np.outer(hashes, _A) + _B) % _PRIME).min(axis=0).astype(np.uint32)
+    return key, signature
+
+def duplicate_entry(chunk: Dict) -> Dict:
+    """The metadata of a chunk kept when it is merged into a duplicate."""
+    return {field: chunk[field] for field in DUPLICATE_FIELDS if field in chunk}
+
+class DuplicateIndex:
+    """Finds exact and near-duplicate chunks by text and embedding.
+
+    Chunks with the same normalized text are duplicates outright. Otherwise
+    MinHash LSH proposes chunks whose word shingles overlap, and a candidate
+    counts as a duplicate only if both its estimated Jaccard similarity and
+    its embedding cosine similarity reach the thresholds, so boilerplate
+    that differs in a few words is caught while chunks that merely share
+    phrasing are kept apart.
+
+    Every chunk is looked up by 64-bit hashes of its exact-match key and of
+    each LSH band. A saved index keeps them with the MinHash signatures in
+    memory-mapped arrays, sorted per hash for binary search, so loading it
+    does not hash the corpus again; chunks added since then are held in
+    dicts until the next save. Removed chunks are only skipped by lookups.
+    """
+
+    def __init__(self, jaccard_threshold: float = 0.8, similarity_threshold: float = 0.95):
+        self.jaccard_threshold = jaccard_threshold
+        self.similarity_threshold = similarity_threshold
+        # Saved chunks, by position
+        self._hashes = np.zeros((0, LSH_BANDS + 1), dtype=np.uint64)
+        self._signatures = np.zeros((0, NUM_PERMUTATIONS), dtype=np.uint32)
+        # Every hash column sorted, with the positions in the same order
+        self._sorted_hashes = np.zeros((LSH_BANDS + 1, 0), dtype=np.uint64)
+        self._sorted_ids = np.zeros((LSH_BANDS + 1, 0), dtype='int64')
+        # Chunks added since the last save or load
+        self._pending_hashes = {}
+        self._pending_signatures = {}
+        self._lookup = [{} for _ in range(LSH_BANDS + 1)]
+        self._removed = set()
+        self._loaded_from = None  # path whose files hold exactly the saved chunks
+
+    def __len__(self) -> int:
+        return len(self._hashes) + len(self._pending_hashes)
+
+    @staticmethod
+    def _hash(text_fingerprint: Fingerprint) -> np.ndarray:
+        """The exact-match hash followed by one hash per LSH band."""
+        key, signature = text_fingerprint
+        bands = (signature.reshape(LSH_BANDS, -1).astype(np.uint64) * _BAND_MULTIPLIERS).sum(axis=1)
+        return np.concatenate([np.array([int(key[:16], 16)], dtype=np.uint64), bands])
+
+    def _signature(self, idx: int) -> np.ndarray:
+        return self._signatures[idx] if idx < len(self._signatures) else self._pending_signatures[idx]
+
+    def _matches(self, column: int, value: np.uint64) -> List[int]:
+        """Positions of the chunks whose hash in a column equals value."""
+        sorted_hashes = self._sorted_hashes[column]
+        start = np.searchsorted(sorted_hashes, value, side='left')
+        end = np.searchsorted(sorted_hashes, value, side='right')
+        matches = self._sorted_ids[column, start:end].tolist() + self._lookup[column].get(int(value), [])
+        return [idx for idx in matches if idx not in self._removed]
+
+    def add(self, idx: int, text_fingerprint: Fingerprint):
+        """Index a chunk under its position in the vector store, which must be the next one."""
+        if idx != len(self):
+            raise ValueError(f"Expected chunk position {len(self)}, got {idx}")
+        hashes = self._hash(text_fingerprint)
+        for lookup, value in zip(self._lookup, hashes.tolist()):
+            lookup.setdefault(value, []).append(idx)
+        self._pending_hashes[idx] = hashes
+        self._pending_signatures[idx] = text_fingerprint[1]
+
+    def remove(self, positions: Iterable[int]):
+        """Stop matching chunks, e.g. deleted ones; they keep their positions."""
+        self._removed.update(int(idx) for idx in positions)
+
+    def find(self, text_fingerprint: Fingerprint, embedding: np.ndarray,
+             vectors: Callable[[np.ndarray], np.ndarray]) -> Optional[int]:
+        """Return the position of an indexed duplicate of a chunk, or None.
+
+        ``embedding`` is the chunk's normalized embedding and ``vectors``
+        returns the normalized embeddings of indexed chunks by position.
+        """
+        signature = text_fingerprint[1]
+        hashes = self._hash(text_fingerprint)
+        # Identical normalized texts also have identical signatures
+        exact = [idx for idx in self._matches(0, hashes[0]) if np.array_equal(self._signature(idx), signature)]
+        if exact:
+            return min(exact)
+
+        candidates = set()
+        for column in range(1, LSH_BANDS + 1):
+            candidates.update(self._matches(column, hashes[column]))
+        candidates = np.array(sorted(
+            idx for idx in candidates
+            if np.mean(self._signature(idx) == signature) >= self.jaccard_threshold
+        ), dtype='int64')
+        if len(candidates) == 0:
+            return None
+
+        similarities = vectors(candidates) @ embedding
+        best = int(np.argmax(similarities))
+        if similarities[best] >= self.similarity_threshold:
+            return int(candidates[best])
+        return None
+
+    def _all_rows(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Hashes and signatures of every chunk, saved or not."""
+        pending = range(len(self._hashes), len(self))
+        hashes = np.vstack([self._hashes] + [self._pending_hashes[idx][None] for idx in pending])
+        signatures = np.vstack([self._signatures] + [self._pending_signatures[idx][None] for idx in pending])
+        return hashes, signatures
+
+    def _set_rows(self, hashes: np.ndarray, signatures: np.ndarray):
+        order = np.argsort(hashes, axis=0, kind='stable')
+        self._hashes = hashes
+        self._signatures = signatures
+        self._sorted_hashes = np.take_along_axis(hashes, order, axis=0).T.copy()
+        self._sorted_ids = order.T.astype('int64')
+        self._pending_hashes = {}
+        self._pending_signatures = {}
+        self._lookup = [{} for _ in range(LSH_BANDS + 1)]
+        self._loaded_from = None
+
+    def subset(self, positions: np.ndarray) -> 'DuplicateIndex':
+        """A new index of the chunks at the given positions, renumbered from 0, without rehashing their text."""
+        positions = np.asarray(positions, dtype='int64')
+        hashes, signatures = self._all_rows()
+        subset = DuplicateIndex(self.jaccard_threshold, self.similarity_threshold)
+        subset._set_rows(hashes[positions], signatures[positions])
+        subset.remove(np.flatnonzero(np.isin(positions, list(self._removed))))
+        return subset
+
+    @staticmethod
+    def _path(filepath: str, name: str) -> str:
+        return f"{filepath}.dedup.{name}.npy"
+
+    def save(self, filepath: str):
+        """Write the index next to a vector store and re-map it from disk."""
+        if self._pending_hashes:
+            self._set_rows(*self._all_rows())
+        elif self._loaded_from == filepath:
+            # The files already hold exactly these chunks
+            return
+        arrays = {
+            'hashes': self._hashes,
+            'signatures': self._signatures,
+            'sorted_hashes': self._sorted_hashes,
+            'sorted_ids': self._sorted_ids
+        }
+        for name, array in arrays.items():
+            # The current files may be mapped, write beside them and swap
+            path = self._path(filepath, name)
+            with open(f"{path}.tmp", 'wb') as f:
+                np.save(f, np.asarray(array))
+            os.replace(f"{path}.tmp", path)
+        removed = self._removed
+        self.load(filepath, len(self._hashes))
+        self._removed = removed
+
+    def load(self, filepath: str, count: int) -> bool:
+        """Memory-map an index saved for count chunks, returning False if there is none that fits."""
+        try:
+            arrays = {name: np.load(self._path(filepath, name), mmap_mode='r') for name in INDEX_FILES}
+        except (OSError, ValueError):
+            return False
+        if len(arrays['hashes']) != count or arrays['sorted_ids'].shape != (LSH_BANDS + 1, count):
+            return False
+        self._hashes = arrays['hashes']
+        self._signatures = arrays['signatures']
+        self._sorted_hashes = arrays['sorted_hashes']
+        self._sorted_ids = arrays['sorted_ids']
+        self._pending_hashes = {}
+        self._pending_signatures = {}
+        self._lookup = [{} for _ in range(LSH_BANDS + 1)]
+        self._removed = set()
+        self._loaded_from = filepath
+        return True
+
+    @staticmethod
+    def remove_files(filepath: str):
+        """Delete a saved index, e.g. once it no longer matches its vector store."""
+        for name in INDEX_FILES:
+            if os.path.exists(DuplicateIndex._path(filepath, name)):
+                os.remove(DuplicateIndex._path(filepath, name))
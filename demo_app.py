@@ -1,6 +1,9 @@
 import streamlit as st
 from rag_pipeline import RAGPipeline
+from resource_registry import shared_registry
+from config import Config
 import os
+import shutil
 import tempfile
 from pathlib import Path
 
@@ -8,15 +11,27 @@ def main():
     st.title("RAG Pipeline Demo: Reducing Hallucinations")
     st.write("This demo shows how RAG grounds responses in real documents to reduce hallucinations.")
     
-    # Initialize RAG pipeline
+    # Initialize RAG pipeline; the embedding model and loaded knowledge base are shared by all sessions
     if 'rag_pipeline' not in st.session_state:
-        st.session_state.rag_pipeline = RAGPipeline()
+        st.session_state.rag_pipeline = RAGPipeline(registry=shared_registry)
     
     rag = st.session_state.rag_pipeline
     
     # Sidebar for knowledge base management
     st.sidebar.header("Knowledge Base Management")
     
+    # Knowledge bases are rebuilt in the background; queries use the current one meanwhile
+    build = st.session_state.get('knowledge_base_build')
+    if build is not None:
+        if not build.done():
+            st.sidebar.info("⏳ Building knowledge base in the background, questions use the current one until it is ready")
+        else:
+            del st.session_state['knowledge_base_build']
+            if build.exception() is not None:
+                st.sidebar.error(f"❌ Build failed, the current knowledge base was kept: {build.exception()}")
+            else:
+                st.sidebar.success(f"✅ Knowledge base built with {build.result()} chunks!")
+    
     # Load existing knowledge base
     if st.sidebar.button("Load Existing Knowledge Base"):
         if rag.load_knowledge_base():
@@ -24,6 +39,13 @@ def main():
         else:
             st.sidebar.error("No existing knowledge base found")
     
+    if st.sidebar.button("Roll Back to Previous Knowledge Base"):
+        version = rag.rollback_knowledge_base()
+        if version is not None:
+            st.sidebar.success(f"Rolled back to snapshot {version}")
+        else:
+            st.sidebar.error("No earlier knowledge base snapshot found")
+    
     # File upload section
     st.sidebar.subheader("📁 Upload Your Documents")
     uploaded_files = st.sidebar.file_uploader(
@@ -37,7 +59,7 @@ def main():
         st.sidebar.write(f"📄 {len(uploaded_files)} file(s) uploaded")
         
         if st.sidebar.button("🚀 Build Knowledge Base from Uploaded Files"):
-            with st.spinner("Processing uploaded files..."):
+            with st.spinner("Saving uploaded files..."):
                 # Create temporary directory for uploaded files
                 temp_dir = tempfile.mkdtemp()
                 
@@ -60,17 +82,15 @@ def main():
                             with open(file_path, 'wb') as f:
                                 f.write(uploaded_file.getvalue())
                     
-                    # Build knowledge base from uploaded files
-                    num_chunks = rag.build_knowledge_base(temp_dir)
-                    st.sidebar.success(f"✅ Knowledge base built with {num_chunks} chunks from your uploaded files!")
+                    # Build knowledge base from uploaded files, removing them once it is done
+                    build = rag.build_knowledge_base_in_background(temp_dir)
+                    build.add_done_callback(lambda _: shutil.rmtree(temp_dir, ignore_errors=True))
+                    st.session_state.knowledge_base_build = build
+                    st.sidebar.info("⏳ Building knowledge base from your uploaded files in the background")
                     
                 except Exception as e:
-                    st.sidebar.error(f"❌ Error processing files: {str(e)}")
-                
-                finally:
-                    # Clean up temporary directory
-                    import shutil
                     shutil.rmtree(temp_dir, ignore_errors=True)
+                    st.sidebar.error(f"❌ Error processing files: {str(e)}")
     
     # Build new knowledge base from directory
     st.sidebar.subheader("📂 Or Use Document Directory")
@@ -79,12 +99,18 @@ def main():
         value="./sample_documents",
         help="Path to directory containing your documents"
     )
+    incremental = st.sidebar.checkbox(
+        "Incremental build",
+        value=Config.INCREMENTAL_BUILD,
+        help="Only re-process documents added, changed or removed since the last build"
+    )
     
     if st.sidebar.button("Build Knowledge Base from Directory"):
         if os.path.exists(docs_directory):
-            with st.spinner("Building knowledge base..."):
-                num_chunks = rag.build_knowledge_base(docs_directory)
-            st.sidebar.success(f"✅ Knowledge base built with {num_chunks} chunks!")
+            st.session_state.knowledge_base_build = rag.build_knowledge_base_in_background(
+                docs_directory, incremental=incremental
+            )
+            st.sidebar.info("⏳ Building knowledge base in the background")
         else:
             st.sidebar.error("❌ Directory not found")
     
@@ -104,19 +130,31 @@ def main():
     with col1:
         if st.button("🎯 Get Grounded Response"):
             if question and rag.is_indexed:
-                with st.spinner("Generating response..."):
-                    result = rag.query(question)
+                # Render sources as soon as retrieval finishes, then the response as it streams
+                with st.spinner("Retrieving sources..."):
+                    events = rag.query_stream(question)
+                    first_event = next(events)
                 
-                if 'error' in result:
-                    st.error(result['error'])
+                if first_event['type'] == 'error':
+                    st.error(first_event['error'])
                 else:
                     st.subheader("🎯 Grounded Response")
-                    st.write(result['response'])
+                    response_placeholder = st.empty()
+                    response_text = ""
                     
                     st.subheader("📚 Sources Used")
-                    for i, source in enumerate(result['sources'], 1):
+                    for i, source in enumerate(first_event['sources'], 1):
                         with st.expander(f"Source {i}: {source['title']} (Score: {source['similarity_score']:.3f})"):
                             st.write(source['content'])
+                    
+                    for event in events:
+                        if event['type'] == 'delta':
+                            response_text += event['text']
+                            response_placeholder.markdown(response_text + "▌")
+                        elif event['type'] == 'done':
+                            response_placeholder.markdown(event['response'])
+                            if event['cached']:
+                                st.caption(f"Answered from the {event['cached']} answer cache")
             elif not rag.is_indexed:
                 st.error("Please build or load a knowledge base first")
             else:
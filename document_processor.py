@@ -1,8 +1,27 @@
 import os
 import re
-from typing import List, Dict
+from typing import List, Dict, Optional
 from pathlib import Path
-import PyPDF2
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from token_chunker import TokenChunker
+from metrics import metrics
+
+# Load order of the supported formats
+FILE_SUFFIXES = ('.txt', '.pdf', '.md')
+
+def read_pdf_text(pdf_path: str) -> str:
+    """Extract the text of every page of a PDF, raising on failure."""
+    import PyPDF2
+    
+    with open(pdf_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        # Join once instead of growing a string page by page
+        return "".join(page.extract_text() + "\n" for page in pdf_reader.pages)
+
+def read_text_file(file_path: str) -> str:
+    """Read a UTF-8 text or markdown file."""
+    with open(file_path, 'r', encoding='utf-8') as file:
+        return file.read()
 
 class DocumentProcessor:
     """Handles document collection, cleaning, and preprocessing."""
@@ -10,69 +29,114 @@ class DocumentProcessor:
     def __init__(self, chunk_size: int = 300, chunk_overlap: int = 50):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.load_errors = []  # per-file failures of the last load
+        self.token_chunker = None
     
-    def load_documents(self, directory_path: str) -> List[Dict[str, str]]:
-        """Load documents from a directory."""
-        documents = []
-        directory = Path(directory_path)
+    def use_tokenizer(self, tokenizer, max_seq_length: int):
+        """Measure chunk size and overlap in the embedding model's tokens.
         
-        # Process text files
-        for file_path in directory.rglob('*.txt'):
-            try:
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    content = file.read()
-                    documents.append({
-                        'content': content,
-                        'source': str(file_path),
-                        'title': file_path.stem
-                    })
-            except Exception as e:
-                print(f"Error loading {file_path}: {e}")
+        Chunks are capped at the model's sequence limit (minus its special
+        tokens) so the encoder never truncates them.
+        """
+        max_tokens = min(self.chunk_size, max_seq_length - tokenizer.num_special_tokens_to_add())
+        self.token_chunker = TokenChunker(tokenizer, max_tokens, self.chunk_overlap)
+    
+    def list_document_files(self, directory_path: str) -> List[Path]:
+        """List supported document files in the order they are loaded."""
+        # Walk the tree once and group by format
+        files_by_suffix = {suffix: [] for suffix in FILE_SUFFIXES}
+        for file_path in sorted(Path(directory_path).rglob('*')):
+            if file_path.suffix in files_by_suffix and file_path.is_file():
+                files_by_suffix[file_path.suffix].append(file_path)
         
-        # Process PDF files
-        for file_path in directory.rglob('*.pdf'):
-            try:
-                content = self.extract_text_from_pdf(file_path)
-                if content.strip():  # Only add if content is not empty
-                    documents.append({
-                        'content': content,
-                        'source': str(file_path),
-                        'title': file_path.stem
-                    })
-            except Exception as e:
-                print(f"Error loading PDF {file_path}: {e}")
+        return [file_path for suffix in FILE_SUFFIXES for file_path in files_by_suffix[suffix]]
+    
+    def _make_document(self, file_path: Path, content: str) -> Optional[Dict[str, str]]:
+        if file_path.suffix == '.pdf' and not content.strip():  # Only add if content is not empty
+            return None
         
-        # Process Markdown files
-        for file_path in directory.rglob('*.md'):
-            try:
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    content = file.read()
-                    documents.append({
-                        'content': content,
-                        'source': str(file_path),
-                        'title': file_path.stem
-                    })
-            except Exception as e:
-                print(f"Error loading {file_path}: {e}")
+        metrics.increment('documents_loaded')
+        return {
+            'content': content,
+            'source': str(file_path),
+            'title': file_path.stem
+        }
+    
+    def load_file(self, file_path: Path) -> Optional[Dict[str, str]]:
+        """Load a single document, returning None if it has no usable content."""
+        try:
+            if file_path.suffix == '.pdf':
+                content = read_pdf_text(str(file_path))
+            else:
+                content = read_text_file(str(file_path))
+        except Exception as e:
+            print(f"Error loading {file_path}: {e}")
+            self.load_errors.append({'source': str(file_path), 'error': str(e)})
+            metrics.increment('document_load_errors')
+            return None
+        
+        return self._make_document(file_path, content)
+    
+    def load_files(self, file_paths: List[Path], parallel: bool = False, max_workers: int = None) -> List[Dict[str, str]]:
+        """Load documents from a list of files, keeping their order.
         
+        In parallel mode PDFs are extracted in a process pool and text files
+        read in a thread pool. Per-file failures are collected in ``load_errors``.
+        """
+        self.load_errors = []
+        
+        if not parallel:
+            documents = []
+            for file_path in file_paths:
+                document = self.load_file(file_path)
+                if document is not None:
+                    documents.append(document)
+            return documents
+        
+        max_workers = max_workers or os.cpu_count()
+        has_pdfs = any(file_path.suffix == '.pdf' for file_path in file_paths)
+        
+        pdf_pool = ProcessPoolExecutor(max_workers=max_workers) if has_pdfs else None
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as text_pool:
+                futures = [
+                    pdf_pool.submit(read_pdf_text, str(file_path)) if file_path.suffix == '.pdf'
+                    else text_pool.submit(read_text_file, str(file_path))
+                    for file_path in file_paths
+                ]
+                
+                documents = []
+                for file_path, future in zip(file_paths, futures):
+                    try:
+                        content = future.result()
+                    except Exception as e:
+                        print(f"Error loading {file_path}: {e}")
+                        self.load_errors.append({'source': str(file_path), 'error': str(e)})
+                        metrics.increment('document_load_errors')
+                        continue
+                    
+                    document = self._make_document(file_path, content)
+                    if document is not None:
+                        documents.append(document)
+        finally:
+            if pdf_pool is not None:
+                pdf_pool.shutdown()
+        
+        if self.load_errors:
+            print(f"Failed to load {len(self.load_errors)} of {len(file_paths)} files")
         return documents
     
+    def load_documents(self, directory_path: str, parallel: bool = False, max_workers: int = None) -> List[Dict[str, str]]:
+        """Load documents from a directory."""
+        return self.load_files(self.list_document_files(directory_path), parallel=parallel, max_workers=max_workers)
+    
     def extract_text_from_pdf(self, pdf_path: Path) -> str:
         """Extract text content from PDF file."""
-        text = ""
         try:
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                
-                for page_num in range(len(pdf_reader.pages)):
-                    page = pdf_reader.pages[page_num]
-                    text += page.extract_text() + "\n"
-                    
+            return read_pdf_text(str(pdf_path))
         except Exception as e:
             print(f"Error extracting text from PDF {pdf_path}: {e}")
             return ""
-        
-        return text
     
     def clean_text(self, text: str) -> str:
         """Clean and normalize text content."""
@@ -127,14 +191,31 @@ class DocumentProcessor:
         return chunks
     
     def process_documents(self, documents: List[Dict[str, str]]) -> List[Dict[str, str]]:
-        """Process documents into chunks."""
-        all_chunks = []
+        """Process documents into chunks.
         
-        for doc in documents:
-            chunks = self.chunk_text(doc['content'], {
-                'source': doc['source'],
-                'title': doc['title']
-            })
-            all_chunks.extend(chunks)
+        A document's optional 'tags' list is copied onto each of its chunks
+        so retrieval can be filtered by it.
+        """
+        if self.token_chunker is not None:
+            # Clean before measuring so chunk sizes match what gets embedded
+            all_chunks = self.token_chunker.chunk_documents(
+                [self.clean_text(doc['content']) for doc in documents],
+                [{'source': doc['source'], 'title': doc['title']} for doc in documents]
+            )
+        else:
+            all_chunks = []
+            
+            for doc in documents:
+                chunks = self.chunk_text(doc['content'], {
+                    'source': doc['source'],
+                    'title': doc['title']
+                })
+                all_chunks.extend(chunks)
+        
+        tags_by_source = {doc['source']: doc['tags'] for doc in documents if doc.get('tags')}
+        if tags_by_source:
+            for chunk in all_chunks:
+                if chunk['source'] in tags_by_source:
+                    chunk['tags'] = list(tags_by_source[chunk['source']])
         
         return all_chunks
\ No newline at end of file
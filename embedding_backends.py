@@ -0,0 +1,153 @@
+import json
+import os
+import numpy as np
+from typing import List
+
+BACKENDS = ('torch', 'torch_int8', 'onnx', 'onnx_int8')
+
+ONNX_MODEL_FILE = 'model.onnx'
+ONNX_INT8_MODEL_FILE = 'model.int8.onnx'
+BACKEND_CONFIG_FILE = 'backend.json'
+
+class OnnxEncoder:
+    """Sentence encoder that runs an exported transformer with ONNX Runtime on CPU.
+
+    Mirrors the parts of the SentenceTransformer API used by
+    EmbeddingGenerator: tokenization, the transformer forward pass, pooling
+    and optional normalization.
+    """
+    
+    def __init__(self, export_dir: str, quantized: bool = True, num_threads: int = None):
+        import onnxruntime
+        from transformers import AutoTokenizer
+        
+        with open(os.path.join(export_dir, BACKEND_CONFIG_FILE), 'r', encoding='utf-8') as f:
+            self.config = json.load(f)
+        
+        model_file = ONNX_INT8_MODEL_FILE if quantized else ONNX_MODEL_FILE
+        options = onnxruntime.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(export_dir, model_file),
+            sess_options=options,
+            providers=['CPUExecutionProvider']
+        )
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+        self.tokenizer = AutoTokenizer.from_pretrained(export_dir)
+        self.max_seq_length = self.config['max_seq_length']
+    
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.config['embedding_dim']
+    
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        features = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.max_seq_length,
+            return_tensors='np'
+        )
+        feeds = {name: features[name].astype('int64') for name in self.input_names}
+        token_embeddings = self.session.run(None, feeds)[0]
+        
+        if self.config['pooling'] == 'cls':
+            embeddings = token_embeddings[:, 0]
+        else:
+            mask = features['attention_mask'][..., None].astype('float32')
+            embeddings = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        
+        if self.config['normalize']:
+            embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings.astype('float32')
+    
+    def encode(self, texts: List[str], batch_size: int = 32, show_progress_bar: bool = False) -> np.ndarray:
+        """Embed texts in batches of similar length, returning them in input order."""
+        if not texts:
+            return np.zeros((0, self.get_sentence_embedding_dimension()), dtype='float32')
+        
+        order = np.argsort([-len(text) for text in texts], kind='stable')
+        sorted_texts = [texts[i] for i in order]
+        batches = range(0, len(texts), batch_size)
+        if show_progress_bar:
+            from tqdm import tqdm
+            batches = tqdm(batches, desc="Batches")
+        
+        embeddings = np.zeros((len(texts), self.get_sentence_embedding_dimension()), dtype='float32')
+        embeddings[order] = np.vstack([self._encode_batch(sorted_texts[start:start + batch_size]) for start in batches])
+        return embeddings
+
+def export_onnx(model_name: str, export_dir: str):
+    """Export a SentenceTransformer's transformer to ONNX, plus a dynamic-int8 quantized copy."""
+    import torch
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    from sentence_transformers import SentenceTransformer
+    
+    print(f"Exporting {model_name} to ONNX in {export_dir}...")
+    os.makedirs(export_dir, exist_ok=True)
+    model = SentenceTransformer(model_name, device='cpu')
+    transformer = model[0].auto_model.eval()
+    pooling = model[1]
+    
+    dummy = model.tokenizer(["An example sentence."], return_tensors='pt')
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in dummy]
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes['last_hidden_state'] = {0: 'batch', 1: 'sequence'}
+    
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(dummy[name] for name in input_names),
+            os.path.join(export_dir, ONNX_MODEL_FILE),
+            input_names=input_names,
+            output_names=['last_hidden_state'],
+            dynamic_axes=dynamic_axes,
+            opset_version=14
+        )
+    
+    quantize_dynamic(
+        os.path.join(export_dir, ONNX_MODEL_FILE),
+        os.path.join(export_dir, ONNX_INT8_MODEL_FILE),
+        weight_type=QuantType.QInt8
+    )
+    
+    model.tokenizer.save_pretrained(export_dir)
+    with open(os.path.join(export_dir, BACKEND_CONFIG_FILE), 'w', encoding='utf-8') as f:
+        json.dump({
+            'model_name': model_name,
+            'pooling': 'cls' if pooling.pooling_mode_cls_token else 'mean',
+            'normalize': any(type(module).__name__ == 'Normalize' for module in model),
+            'max_seq_length': model.max_seq_length,
+            'embedding_dim': model.get_sentence_embedding_dimension()
+        }, f)
+
+def load_embedding_model(model_name: str, backend: str = 'torch', cache_dir: str = './embedding_models',
+                         num_threads: int = None):
+    """Load an embedding model for the given inference backend.
+
+    'torch' is the full-precision SentenceTransformer, 'torch_int8' the same
+    model with dynamically quantized int8 linear layers, and 'onnx' /
+    'onnx_int8' an ONNX Runtime export that is created on first use and
+    cached under ``cache_dir``. ``num_threads`` caps the intra-op threads
+    used for inference.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}', expected one of {BACKENDS}")
+    
+    if backend in ('torch', 'torch_int8'):
+        # Deferred so importing this module does not pull in torch
+        import torch
+        from sentence_transformers import SentenceTransformer
+        
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        if backend == 'torch':
+            return SentenceTransformer(model_name)
+        
+        model = SentenceTransformer(model_name, device='cpu')
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    
+    export_dir = os.path.join(cache_dir, model_name.replace('/', '__'))
+    if not os.path.exists(os.path.join(export_dir, BACKEND_CONFIG_FILE)):
+        export_onnx(model_name, export_dir)
+    return OnnxEncoder(export_dir, quantized=backend == 'onnx_int8', num_threads=num_threads)
@@ -0,0 +1,80 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import unicodedata
+import numpy as np
+from typing import List, Optional
+
+class EmbeddingCache:
+    """Persistent SQLite cache of embeddings keyed by model name and chunk text."""
+
+    # Stay well below SQLite's limit on bound parameters per statement
+    BATCH_SIZE = 500
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, dim INTEGER NOT NULL, vector BLOB NOT NULL)"
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        """Normalize text so formatting-only differences share a cache entry."""
+        return ' '.join(unicodedata.normalize('NFC', text).split())
+
+    @classmethod
+    def make_key(cls, model_name: str, text: str) -> str:
+        """Build the cache key for a (model name, text) pair."""
+        payload = f"{model_name}\0{cls.normalize_text(text)}".encode('utf-8')
+        return hashlib.sha256(payload).hexdigest()
+
+    def get_many(self, model_name: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Look up embeddings for texts, returning None for cache misses."""
+        keys = [self.make_key(model_name, text) for text in texts]
+        found = {}
+
+        with self.lock:
+            for start in range(0, len(keys), self.BATCH_SIZE):
+                batch = list(set(keys[start:start + self.BATCH_SIZE]))
+                placeholders = ','.join('?' * len(batch))
+                rows = self.conn.execute(
+                    f"SELECT key, dim, vector FROM embeddings WHERE key IN ({placeholders})",
+                    batch
+                )
+                for key, dim, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype='float32', count=dim)
+
+        return [found.get(key) for key in keys]
+
+    def put_many(self, model_name: str, texts: List[str], embeddings: np.ndarray):
+        """Store embeddings for texts."""
+        rows = []
+        for text, embedding in zip(texts, embeddings):
+            vector = np.asarray(embedding, dtype='float32')
+            rows.append((self.make_key(model_name, text), vector.shape[0], vector.tobytes()))
+
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, dim, vector) VALUES (?, ?, ?)",
+                rows
+            )
+            self.conn.commit()
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        """Close the underlying database connection."""
+        with self.lock:
+            self.conn.close()
@@ -1,26 +1,121 @@
 import numpy as np
-from sentence_transformers import SentenceTransformer
 from typing import List, Dict
 import pickle
 import os
+import threading
+from embedding_cache import EmbeddingCache
+from embedding_backends import load_embedding_model
+from embedding_pool import EmbeddingPool
+from metrics import metrics
 
 class EmbeddingGenerator:
-    """Handles embedding generation using sentence transformers."""
+    """Handles embedding generation using sentence transformers.
     
-    def __init__(self, model_name: str = 'all-MiniLM-L6-v2'):
+    The model is loaded on first use, or up front with ``warmup()``.
+    """
+    
+    def __init__(self, model_name: str = 'all-MiniLM-L6-v2', cache_path: str = None,
+                 backend: str = 'torch', backend_dir: str = './embedding_models',
+                 batch_size: int = 32, num_workers: int = 0, threads_per_worker: int = None):
         self.model_name = model_name
-        self.model = SentenceTransformer(model_name)
-        self.embedding_dim = self.model.get_sentence_embedding_dimension()
+        self.backend = backend
+        self.backend_dir = backend_dir
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self.threads_per_worker = threads_per_worker
+        self.pool = None  # worker processes, started on the first large enough batch
+        self._model = None
+        self._model_lock = threading.Lock()
+        self.cache = EmbeddingCache(cache_path) if cache_path else None
+        # Quantized backends drift slightly, so they get their own cache entries
+        self.cache_key = model_name if backend == 'torch' else f"{model_name}:{backend}"
+    
+    @property
+    def model(self):
+        """The embedding model, loaded on first access."""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    self._model = load_embedding_model(self.model_name, self.backend, self.backend_dir)
+        return self._model
+    
+    @property
+    def embedding_dim(self) -> int:
+        """Dimension of the model's embeddings."""
+        return self.model.get_sentence_embedding_dimension()
+    
+    def warmup(self):
+        """Load the model and run a dummy encode so the first real call is fast."""
+        self.model.encode(["warmup"])
+    
+    @property
+    def tokenizer(self):
+        """The embedding model's tokenizer."""
+        return self.model.tokenizer
+    
+    @property
+    def max_seq_length(self) -> int:
+        """Maximum number of tokens the model embeds before truncating."""
+        return self.model.max_seq_length
+    
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        """Encode texts in process, or across the worker pool when there is enough work for it."""
+        if self.num_workers > 0 and len(texts) >= self.batch_size * self.num_workers:
+            if self.pool is None:
+                self.pool = EmbeddingPool(
+                    self.model_name, self.tokenizer, self.max_seq_length, self.num_workers,
+                    batch_size=self.batch_size,
+                    threads_per_worker=self.threads_per_worker,
+                    backend=self.backend,
+                    backend_dir=self.backend_dir
+                )
+            return self.pool.encode(texts, show_progress_bar=True)
+        return self.model.encode(texts, batch_size=self.batch_size, show_progress_bar=True)
+    
+    def close(self):
+        """Stop the embedding worker processes, if any were started."""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
     
     def generate_embeddings(self, texts: List[str]) -> np.ndarray:
         """Generate embeddings for a list of texts."""
-        embeddings = self.model.encode(texts, show_progress_bar=True)
-        return embeddings
+        if self.cache is None or not texts:
+            embeddings = self._encode(texts)
+            return embeddings
+        
+        embeddings = self.cache.get_many(self.cache_key, texts)
+        
+        # Encode each distinct missing text once
+        missing = {}
+        for i, embedding in enumerate(embeddings):
+            if embedding is None:
+                missing.setdefault(texts[i], []).append(i)
+        
+        hits = len(texts) - sum(len(v) for v in missing.values())
+        metrics.increment('embedding_cache_hits', hits)
+        metrics.increment('embedding_cache_misses', len(texts) - hits)
+        print(f"Embedding cache: {hits} hits, {len(missing)} texts to encode")
+        
+        if missing:
+            missing_texts = list(missing)
+            new_embeddings = self._encode(missing_texts)
+            self.cache.put_many(self.cache_key, missing_texts, new_embeddings)
+            
+            for text, embedding in zip(missing_texts, new_embeddings):
+                for i in missing[text]:
+                    embeddings[i] = embedding
+        
+        return np.vstack(embeddings).astype('float32')
     
     def generate_query_embedding(self, query: str) -> np.ndarray:
         """Generate embedding for a single query."""
         return self.model.encode([query])[0]
     
+    def generate_query_embeddings(self, queries: List[str]) -> np.ndarray:
+        """Generate embeddings for a batch of queries in a single encode call."""
+        return self.model.encode(queries)
+    
     def save_embeddings(self, embeddings: np.ndarray, metadata: List[Dict], filepath: str):
         """Save embeddings and metadata to disk."""
         data = {
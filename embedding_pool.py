@@ -0,0 +1,96 @@
+import multiprocessing
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List
+
+# Tasks queued per worker, so workers that finish early pick up more
+TASKS_PER_WORKER = 4
+
+# The model held by each worker process
+_worker_model = None
+
+def _init_worker(model_name: str, backend: str, backend_dir: str, num_threads: int):
+    """Pin the worker's thread pools and load its copy of the model."""
+    global _worker_model
+    for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ[var] = str(num_threads)
+    os.environ['TOKENIZERS_PARALLELISM'] = 'false'
+    
+    from embedding_backends import load_embedding_model
+    _worker_model = load_embedding_model(model_name, backend, backend_dir, num_threads=num_threads)
+
+def _encode_batches(batches: List[List[str]]) -> List[np.ndarray]:
+    """Encode each batch in a single forward pass."""
+    return [
+        np.asarray(_worker_model.encode(batch, batch_size=len(batch)), dtype='float32')
+        for batch in batches
+    ]
+
+class EmbeddingPool:
+    """Encodes texts across worker processes, each with its own model copy.
+
+    Texts are sorted by token length and cut into batches of similar length,
+    so little of each batch is padding. Runs of neighbouring batches are
+    sent to the workers longest first and the embeddings are put back in
+    the original order.
+    """
+    
+    def __init__(self, model_name: str, tokenizer, max_seq_length: int, num_workers: int,
+                 batch_size: int = 32, threads_per_worker: int = None,
+                 backend: str = 'torch', backend_dir: str = './embedding_models'):
+        self.tokenizer = tokenizer
+        self.max_seq_length = max_seq_length
+        self.num_workers = num_workers
+        self.batch_size = batch_size
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // num_workers)
+        
+        # Spawn, as forking a process that already runs torch thread pools can deadlock
+        self.executor = ProcessPoolExecutor(
+            max_workers=num_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(model_name, backend, backend_dir, self.threads_per_worker)
+        )
+    
+    def _token_lengths(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer(
+            texts,
+            truncation=True,
+            max_length=self.max_seq_length,
+            return_attention_mask=False,
+            return_token_type_ids=False,
+            verbose=False
+        )
+        return np.array([len(ids) for ids in encodings['input_ids']])
+    
+    def encode(self, texts: List[str], show_progress_bar: bool = False) -> np.ndarray:
+        """Embed texts, returning the embeddings in input order."""
+        order = np.argsort(self._token_lengths(texts), kind='stable')
+        batches = [order[start:start + self.batch_size] for start in range(0, len(order), self.batch_size)]
+        
+        num_tasks = min(len(batches), self.num_workers * TASKS_PER_WORKER)
+        tasks = np.array_split(np.arange(len(batches)), num_tasks)
+        
+        futures = {}
+        for task in reversed(tasks):
+            task_batches = [[texts[i] for i in batches[b]] for b in task]
+            futures[self.executor.submit(_encode_batches, task_batches)] = task
+        
+        completed = as_completed(futures)
+        if show_progress_bar:
+            from tqdm import tqdm
+            completed = tqdm(completed, total=len(futures), desc="Embedding tasks")
+        
+        embeddings = None
+        for future in completed:
+            for batch_id, batch_embeddings in zip(futures[future], future.result()):
+                if embeddings is None:
+                    embeddings = np.zeros((len(texts), batch_embeddings.shape[1]), dtype='float32')
+                embeddings[batches[batch_id]] = batch_embeddings
+        
+        return embeddings
+    
+    def close(self):
+        """Shut the worker processes down."""
+        self.executor.shutdown()
@@ -0,0 +1,196 @@
+import queue
+import threading
+import numpy as np
+from pathlib import Path
+from typing import List, Dict, Callable, Optional
+from document_processor import DocumentProcessor
+from embedding_generator import EmbeddingGenerator
+from vector_store import VectorStore
+from metrics import metrics
+
+# Marks the end of a stage's output
+_DONE = object()
+
+class IngestionPipeline:
+    """Streaming load -> chunk -> embed -> add pipeline with bounded memory.
+
+    Loading and chunking run in their own threads and hand work on through
+    bounded queues, so a slow stage blocks the stages before it instead of
+    letting documents pile up in memory. Chunks are embedded and added to
+    the vector store in fixed-size batches, and ``on_flush`` is called
+    with the files whose chunks are all in the store, so the caller can
+    persist progress as a resumable checkpoint. It is called once more with
+    ``final=True`` when the run completes.
+    
+    A checkpoint saves the whole store, so checkpoints wait for at least
+    ``flush_every`` batches and for the store to grow by ``flush_growth``
+    of its size at the previous checkpoint. The sizes saved then form a
+    geometric series, and all checkpoints together write a small multiple
+    of the final store instead of an amount quadratic in it; an
+    interruption loses at most that share of the work done.
+    Time spent in each stage is summed in ``timings``.
+    """
+    
+    def __init__(self, doc_processor: DocumentProcessor, embedding_generator: EmbeddingGenerator,
+                 vector_store: VectorStore, batch_size: int = 256, queue_size: int = 4,
+                 flush_every: int = 20, flush_growth: float = 0.25, train_size: int = 50000):
+        self.doc_processor = doc_processor
+        self.embedding_generator = embedding_generator
+        self.vector_store = vector_store
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.flush_every = flush_every
+        self.flush_growth = flush_growth
+        self.train_size = train_size
+        
+        self._stop = threading.Event()
+        self._errors = []
+        self.timings = {}
+    
+    def _put(self, out_queue: queue.Queue, item):
+        """Put an item on a queue, giving up if the pipeline is stopping."""
+        while not self._stop.is_set():
+            try:
+                out_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def _get(self, in_queue: queue.Queue):
+        """Get an item from a queue, returning _DONE if the pipeline is stopping."""
+        while not self._stop.is_set():
+            try:
+                return in_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+    
+    def _load_stage(self, file_paths: List[Path], out_queue: queue.Queue):
+        """Load documents one at a time."""
+        try:
+            for file_path in file_paths:
+                num_errors = len(self.doc_processor.load_errors)
+                with metrics.span('load_documents', self.timings):
+                    document = self.doc_processor.load_file(file_path)
+                failed = len(self.doc_processor.load_errors) > num_errors
+                if not self._put(out_queue, (file_path, document, failed)):
+                    return
+        except Exception as e:
+            self._errors.append(e)
+        finally:
+            self._put(out_queue, _DONE)
+    
+    def _chunk_stage(self, in_queue: queue.Queue, out_queue: queue.Queue):
+        """Chunk documents and group the chunks into batches.
+
+        Each batch carries the files whose last chunk it contains, so a file
+        only counts as completed once all of its chunks have been added.
+        """
+        try:
+            batch, completed = [], []
+            while True:
+                item = self._get(in_queue)
+                if item is _DONE:
+                    break
+                file_path, document, failed = item
+                
+                if document is not None:
+                    with metrics.span('chunk', self.timings):
+                        chunks = self.doc_processor.process_documents([document])
+                    for chunk in chunks:
+                        batch.append(chunk)
+                        if len(batch) >= self.batch_size:
+                            if not self._put(out_queue, (batch, completed)):
+                                return
+                            batch, completed = [], []
+                
+                if not failed:
+                    completed.append(file_path)
+            
+            self._put(out_queue, (batch, completed))
+        except Exception as e:
+            self._errors.append(e)
+        finally:
+            self._put(out_queue, _DONE)
+    
+    def _add(self, embeddings: np.ndarray, chunks: List[Dict]):
+        """Add a batch to the vector store, counting the chunks merged as duplicates."""
+        num_added = self.vector_store.add_embeddings(embeddings, chunks)
+        metrics.increment('chunks_indexed', num_added)
+        metrics.increment('duplicate_chunks', len(chunks) - num_added)
+    
+    def run(self, file_paths: List[Path],
+            on_flush: Optional[Callable[[List[Path], bool], None]] = None) -> int:
+        """Ingest files into the vector store, returning the number of chunks added."""
+        self._stop.clear()
+        self._errors = []
+        self.timings = {}
+        self.doc_processor.load_errors = []
+        
+        document_queue = queue.Queue(maxsize=self.queue_size)
+        batch_queue = queue.Queue(maxsize=self.queue_size)
+        stages = [
+            threading.Thread(target=self._load_stage, args=(file_paths, document_queue), daemon=True),
+            threading.Thread(target=self._chunk_stage, args=(document_queue, batch_queue), daemon=True)
+        ]
+        for stage in stages:
+            stage.start()
+        
+        num_chunks = 0
+        batches_since_flush = 0
+        flushed_size = self.vector_store.num_vectors
+        completed = []
+        # Untrained (IVF) indexes need a representative sample before the first add
+        train_embeddings, train_chunks = [], []
+        
+        try:
+            while True:
+                item = batch_queue.get()
+                if item is _DONE:
+                    break
+                batch, batch_completed = item
+                
+                if batch:
+                    with metrics.span('embed', self.timings):
+                        embeddings = self.embedding_generator.generate_embeddings(
+                            [chunk['content'] for chunk in batch]
+                        )
+                    with metrics.span('index', self.timings):
+                        if self.vector_store.is_trained:
+                            self._add(embeddings, batch)
+                        else:
+                            train_embeddings.append(np.asarray(embeddings))
+                            train_chunks.extend(batch)
+                            if len(train_chunks) >= self.train_size:
+                                self._add(np.vstack(train_embeddings), train_chunks)
+                                train_embeddings, train_chunks = [], []
+                    num_chunks += len(batch)
+                    print(f"Ingested {num_chunks} chunks")
+                
+                completed.extend(batch_completed)
+                batches_since_flush += 1
+                size = self.vector_store.num_vectors
+                if (batches_since_flush >= self.flush_every and not train_chunks
+                        and size - flushed_size >= self.flush_growth * flushed_size):
+                    if on_flush is not None:
+                        with metrics.span('checkpoint', self.timings):
+                            on_flush(completed, False)
+                    completed = []
+                    batches_since_flush = 0
+                    flushed_size = size
+        finally:
+            self._stop.set()
+            for stage in stages:
+                stage.join()
+        
+        if self._errors:
+            raise self._errors[0]
+        
+        if train_chunks:
+            with metrics.span('index', self.timings):
+                self._add(np.vstack(train_embeddings), train_chunks)
+        if on_flush is not None:
+            on_flush(completed, True)
+        
+        return num_chunks
@@ -1,33 +1,83 @@
-from openai import OpenAI
-from typing import List, Dict
+import asyncio
+import random
+import time
+import httpx
+import openai
+from email.utils import parsedate_to_datetime
+from openai import OpenAI, AsyncOpenAI
+from typing import List, Dict, Iterator, Optional, Tuple
+from context_packer import ContextPacker, tiktoken_counter
+from metrics import metrics
 from config import Config
 
-class LLMInterface:
-    """Interface for interacting with Language Models."""
-    
-    def __init__(self, api_key: str = None, model: str = None):
-        self.api_key = api_key or Config.OPENAI_API_KEY
-        self.model = model or Config.LLM_MODEL
-        
-        # Initialize OpenAI client with minimal configuration
+SYSTEM_PROMPT = "You are a helpful assistant that answers questions based only on the provided context. Do not use external knowledge."
+
+# Start of the text returned in place of an answer when the LLM call fails
+ERROR_PREFIX = "Error generating response"
+
+# Transient failures worth retrying
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError
+)
+
+def retry_after_seconds(headers) -> Optional[float]:
+    """Seconds a response's Retry-After (or OpenAI's retry-after-ms) header asks to wait, if any."""
+    retry_after_ms = headers.get('retry-after-ms')
+    if retry_after_ms is not None:
         try:
-            self.client = OpenAI(
-                api_key=self.api_key,
-                timeout=30.0
+            return max(0.0, float(retry_after_ms) / 1000)
+        except ValueError:
+            pass
+    retry_after = headers.get('retry-after')
+    if retry_after is None:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        # An HTTP date
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class PromptBuilder:
+    """Prompt construction shared by the synchronous and asynchronous LLM interfaces."""
+    
+    _context_packer = None
+    
+    @property
+    def context_packer(self) -> ContextPacker:
+        """Packer that fits retrieved context into the prompt token budget, created on first use."""
+        if self._context_packer is None:
+            self._context_packer = ContextPacker(
+                Config.CONTEXT_TOKEN_BUDGET,
+                tiktoken_counter(getattr(self, 'model', None) or Config.LLM_MODEL)
             )
-        except Exception as e:
-            print(f"Error initializing OpenAI client: {e}")
-            # Fallback initialization
-            self.client = OpenAI(api_key=self.api_key)
+        return self._context_packer
+    
+    @staticmethod
+    def format_source(position: int, chunk: Dict) -> str:
+        """Render one retrieved passage for the prompt context."""
+        return f"Source {position} ({chunk['title']}):\n{chunk['content']}\n"
     
     def construct_prompt(self, query: str, retrieved_chunks: List[Dict]) -> str:
-        """Construct a prompt with retrieved context."""
+        """Construct a prompt with retrieved context.
+        
+        With context packing enabled, adjacent chunks of a document are
+        merged without their repeated overlap and passages are added in
+        score order up to ``Config.CONTEXT_TOKEN_BUDGET`` tokens.
+        """
+        if Config.CONTEXT_PACKING:
+            retrieved_chunks = self.context_packer.pack(retrieved_chunks, self.format_source)
+        
         context_parts = []
         
         for i, chunk in enumerate(retrieved_chunks, 1):
-            context_parts.append(
-                f"Source {i} ({chunk['title']}):\n{chunk['content']}\n"
-            )
+            context_parts.append(self.format_source(i, chunk))
         
         context = "\n".join(context_parts)
         
@@ -42,32 +92,248 @@ Answer:"""
         
         return prompt
     
+    @staticmethod
+    def record_usage(response) -> bool:
+        """Count the prompt and completion tokens a response reports, returning whether it reported any."""
+        usage = getattr(response, 'usage', None)
+        if usage is None:
+            return False
+        if isinstance(usage, dict):
+            # Stream chunks carry the usage as an undeclared field
+            prompt_tokens, completion_tokens = usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0)
+        else:
+            prompt_tokens, completion_tokens = usage.prompt_tokens, usage.completion_tokens
+        if metrics.enabled:
+            metrics.increment('llm_prompt_tokens', prompt_tokens)
+            metrics.increment('llm_completion_tokens', completion_tokens)
+        return True
+    
+    def record_estimated_usage(self, prompt: str, completion: str):
+        """Count tokens with the local tokenizer, for responses that do not report their usage."""
+        if metrics.enabled:
+            count_tokens = self.context_packer.count_tokens
+            metrics.increment('llm_prompt_tokens', count_tokens(SYSTEM_PROMPT) + count_tokens(prompt))
+            metrics.increment('llm_completion_tokens', count_tokens(completion))
+    
+    def build_messages(self, prompt: str) -> List[Dict]:
+        """Build the chat messages for a prompt."""
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+
+class LLMInterface(PromptBuilder):
+    """Interface for interacting with Language Models."""
+    
+    def __init__(self, api_key: str = None, model: str = None, base_url: str = None):
+        self.api_key = api_key or Config.OPENAI_API_KEY
+        self.model = model or Config.LLM_MODEL
+        self.base_url = base_url or Config.OPENAI_BASE_URL
+        
+        # Initialize OpenAI client with minimal configuration
+        try:
+            self.client = OpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                timeout=Config.LLM_TIMEOUT
+            )
+        except Exception as e:
+            print(f"Error initializing OpenAI client: {e}")
+            # Fallback initialization
+            self.client = OpenAI(api_key=self.api_key)
+    
     def generate_response(self, prompt: str) -> str:
         """Generate response using the LLM."""
         try:
             response = self.client.chat.completions.create(
                 model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant that answers questions based only on the provided context. Do not use external knowledge."},
-                    {"role": "user", "content": prompt}
-                ],
+                messages=self.build_messages(prompt),
                 max_tokens=Config.MAX_TOKENS,
                 temperature=Config.TEMPERATURE
             )
+            self.record_usage(response)
             
             return response.choices[0].message.content.strip()
         
         except Exception as e:
-            return f"Error generating response: {str(e)}"
+            metrics.increment('llm_errors')
+            return f"{ERROR_PREFIX}: {str(e)}"
     
-    def generate_grounded_response(self, query: str, retrieved_chunks: List[Dict]) -> Dict:
-        """Generate a grounded response with sources."""
-        prompt = self.construct_prompt(query, retrieved_chunks)
-        response = self.generate_response(prompt)
+    def stream_response(self, prompt: str, status: Dict = None) -> Iterator[str]:
+        """Generate response using the LLM, yielding text deltas as they arrive.
+        
+        A failure is yielded as error text, possibly after part of the
+        answer, and also recorded under ``status['error']`` when a status
+        dict is passed, so callers can tell a truncated answer apart.
+        """
+        try:
+            stream = self.client.chat.completions.create(
+                model=self.model,
+                messages=self.build_messages(prompt),
+                max_tokens=Config.MAX_TOKENS,
+                temperature=Config.TEMPERATURE,
+                stream=True,
+                # The final chunk then reports the token usage
+                extra_body={'stream_options': {'include_usage': True}}
+            )
+            
+            parts = []
+            reported_usage = False
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+                reported_usage = self.record_usage(chunk) or reported_usage
+            if not reported_usage:
+                self.record_estimated_usage(prompt, ''.join(parts))
+        
+        except Exception as e:
+            metrics.increment('llm_errors')
+            if status is not None:
+                status['error'] = str(e)
+            yield f"{ERROR_PREFIX}: {str(e)}"
+    
+    def generate_grounded_response(self, query: str, retrieved_chunks: List[Dict],
+                                   timings: Dict[str, float] = None) -> Dict:
+        """Generate a grounded response with sources, adding stage durations to timings if given."""
+        with metrics.span('build_prompt', timings):
+            prompt = self.construct_prompt(query, retrieved_chunks)
+        with metrics.span('generate', timings):
+            response = self.generate_response(prompt)
+        
+        return {
+            'query': query,
+            'response': response,
+            'sources': retrieved_chunks,
+            'prompt_used': prompt
+        }
+
+class AsyncLLMInterface(PromptBuilder):
+    """Asyncio interface to the LLM with pooled connections, a concurrency limit and retries.
+    
+    Requests share one pooled HTTP client per event loop, at most
+    ``max_concurrency`` of them are in flight at once, and rate limits,
+    timeouts and server errors are retried after the server's
+    ``Retry-After`` or with jittered exponential backoff. A loop's client is
+    closed when the loop shuts down (e.g. at the end of ``asyncio.run``) or
+    by ``aclose()``.
+    """
+    
+    def __init__(self, api_key: str = None, model: str = None, base_url: str = None,
+                 max_concurrency: int = None, max_retries: int = None, timeout: float = None):
+        self.api_key = api_key or Config.OPENAI_API_KEY
+        self.model = model or Config.LLM_MODEL
+        self.base_url = base_url or Config.OPENAI_BASE_URL
+        self.max_concurrency = max_concurrency or Config.LLM_MAX_CONCURRENCY
+        self.max_retries = Config.LLM_MAX_RETRIES if max_retries is None else max_retries
+        self.timeout = timeout or Config.LLM_TIMEOUT
+        
+        # Connection pools and semaphores are bound to the loop that uses them
+        self._loop_clients = {}  # event loop -> (client, semaphore, closer)
+    
+    async def _get_client(self) -> Tuple[AsyncOpenAI, asyncio.Semaphore]:
+        """Return the client and semaphore of the running event loop, creating them on first use."""
+        loop = asyncio.get_running_loop()
+        for closed_loop in [other for other in self._loop_clients if other.is_closed()]:
+            # Closed without shutting down its async generators; its pool cannot be awaited any more
+            del self._loop_clients[closed_loop]
+        
+        if loop not in self._loop_clients:
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency
+                ),
+                timeout=self.timeout
+            )
+            client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                http_client=http_client,
+                max_retries=0,  # retries are handled here
+                timeout=self.timeout
+            )
+            closer = self._close_on_shutdown(loop, http_client)
+            await closer.__anext__()
+            self._loop_clients[loop] = (client, asyncio.Semaphore(self.max_concurrency), closer)
+        client, semaphore, _ = self._loop_clients[loop]
+        return client, semaphore
+    
+    async def _close_on_shutdown(self, loop: asyncio.AbstractEventLoop, http_client: httpx.AsyncClient):
+        """Async generator parked until its loop shuts down, then closing the loop's connection pool.
+        
+        Event loops finalize pending async generators while shutting down,
+        the last moment the pool's connections can still be closed on them.
+        """
+        try:
+            yield
+        finally:
+            self._loop_clients.pop(loop, None)
+            await http_client.aclose()
+    
+    def _backoff_delay(self, attempt: int) -> float:
+        """Exponential backoff with full jitter."""
+        cap = min(Config.LLM_RETRY_MAX_DELAY, Config.LLM_RETRY_BASE_DELAY * (2 ** attempt))
+        return random.uniform(0, cap)
+    
+    def _retry_delay(self, attempt: int, error: Exception) -> float:
+        """Seconds to wait before a retry: the server's Retry-After, capped at the maximum delay, or backoff."""
+        response = getattr(error, 'response', None)
+        retry_after = retry_after_seconds(response.headers) if response is not None else None
+        if retry_after is not None:
+            return min(retry_after, Config.LLM_RETRY_MAX_DELAY)
+        return self._backoff_delay(attempt)
+    
+    async def generate_response(self, prompt: str) -> str:
+        """Generate response using the LLM."""
+        client, semaphore = await self._get_client()
+        
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with semaphore:
+                    response = await client.chat.completions.create(
+                        model=self.model,
+                        messages=self.build_messages(prompt),
+                        max_tokens=Config.MAX_TOKENS,
+                        temperature=Config.TEMPERATURE
+                    )
+                self.record_usage(response)
+                return response.choices[0].message.content.strip()
+            
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    metrics.increment('llm_errors')
+                    return f"{ERROR_PREFIX}: {str(e)}"
+                metrics.increment('llm_retries')
+                await asyncio.sleep(self._retry_delay(attempt, e))
+            
+            except Exception as e:
+                metrics.increment('llm_errors')
+                return f"{ERROR_PREFIX}: {str(e)}"
+    
+    async def generate_grounded_response(self, query: str, retrieved_chunks: List[Dict],
+                                         timings: Dict[str, float] = None) -> Dict:
+        """Generate a grounded response with sources, adding stage durations to timings if given."""
+        with metrics.span('build_prompt', timings):
+            prompt = self.construct_prompt(query, retrieved_chunks)
+        with metrics.span('generate', timings):
+            response = await self.generate_response(prompt)
         
         return {
             'query': query,
             'response': response,
             'sources': retrieved_chunks,
             'prompt_used': prompt
-        }
\ No newline at end of file
+        }
+    
+    async def aclose(self):
+        """Close the pooled HTTP client of the running event loop."""
+        entry = self._loop_clients.pop(asyncio.get_running_loop(), None)
+        if entry is not None:
+            await entry[2].aclose()
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
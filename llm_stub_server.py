@@ -0,0 +1,137 @@
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+DEFAULT_ANSWER = "This is a stub answer."
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        server = self.server
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        failure = server.record(body)
+
+        if failure is not None:
+            status, headers = failure
+            self._send_json(status, {'error': {'message': f"Stub failure {status}", 'type': 'stub_error'}}, headers)
+            return
+
+        time.sleep(server.latency)
+        words = server.answer.split(' ')
+        usage = {
+            'prompt_tokens': sum(len(message['content'].split()) for message in body.get('messages', [])),
+            'completion_tokens': len(words)
+        }
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+        model = body.get('model', 'stub')
+
+        if not body.get('stream'):
+            self._send_json(200, {
+                'id': 'chatcmpl-stub', 'object': 'chat.completion', 'created': int(time.time()), 'model': model,
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': server.answer}}],
+                'usage': usage
+            })
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        for position, word in enumerate(words):
+            if server.fail_stream_after is not None and position == server.fail_stream_after:
+                self._send_event({'error': {'message': "Stub stream failure", 'type': 'stub_error'}})
+                return
+            self._send_event(self._chunk(model, [{'index': 0, 'finish_reason': None,
+                                                  'delta': {'content': word if position == 0 else f" {word}"}}]))
+        if (body.get('stream_options') or {}).get('include_usage'):
+            self._send_event(dict(self._chunk(model, []), usage=usage))
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    @staticmethod
+    def _chunk(model: str, choices: List[Dict]) -> Dict:
+        return {'id': 'chatcmpl-stub', 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                'model': model, 'choices': choices}
+
+    def _send_event(self, data: Dict):
+        self.wfile.write(f"data: {json.dumps(data)}\n\n".encode('utf-8'))
+        self.wfile.flush()
+
+    def _send_json(self, status: int, data: Dict, headers: Dict[str, str] = None):
+        payload = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+class StubLLMServer(ThreadingHTTPServer):
+    """Local OpenAI-compatible chat completions endpoint, for tests and offline runs.
+
+    Every request is answered with ``answer`` after ``latency`` seconds,
+    streamed word by word when the request asks for a stream. ``failures``
+    queues error responses (status and headers, e.g. a 429 with
+    ``Retry-After``) returned to the next requests, and
+    ``fail_stream_after`` makes streams send that many deltas followed by an
+    error event. Point the LLM interfaces at ``base_url``, or set
+    ``OPENAI_BASE_URL`` to it.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, answer: str = DEFAULT_ANSWER,
+                 latency: float = 0.0):
+        super().__init__((host, port), _Handler)
+        self.answer = answer
+        self.latency = latency
+        self.failures: List[Tuple[int, Dict[str, str]]] = []
+        self.fail_stream_after = None
+        self.requests = []  # bodies of every request received
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def record(self, body: Dict):
+        """Record a request, returning the failure queued for it, if any."""
+        with self._lock:
+            self.requests.append(body)
+            return self.failures.pop(0) if self.failures else None
+
+    def start(self) -> 'StubLLMServer':
+        """Serve on a daemon thread."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a stub OpenAI-compatible chat completions API.")
+    parser.add_argument('--host', default='127.0.0.1', help="Interface to listen on")
+    parser.add_argument('--port', type=int, default=8001, help="Port to listen on")
+    parser.add_argument('--latency', type=float, default=0.5, help="Seconds to wait before answering")
+    parser.add_argument('--answer', default=DEFAULT_ANSWER, help="Text of every answer")
+    args = parser.parse_args()
+
+    server = StubLLMServer(args.host, args.port, answer=args.answer, latency=args.latency)
+    print(f"Serving stub LLM API, set OPENAI_BASE_URL={server.base_url}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -28,11 +28,11 @@ def main():
         "What are some key milestones in space exploration?"
     ]
     
-    for question in demo_questions:
+    # Get grounded responses for all questions in one batch
+    results = rag.query_batch(demo_questions)
+    
+    for question, result in zip(demo_questions, results):
         print(f"\n--- Question: {question} ---")
-        
-        # Get grounded response
-        result = rag.query(question)
         print("\nGrounded Response:")
         print(result['response'])
         
@@ -42,8 +42,23 @@ def main():
         
         print("-" * 80)
     
+    # Streaming demo
+    print("\n5. Streaming a grounded response...")
+    stream_question = "How does deep learning relate to machine learning?"
+    print(f"\n--- Question: {stream_question} ---")
+    
+    for event in rag.query_stream(stream_question):
+        if event['type'] == 'sources':
+            print("\nSources used:")
+            for i, source in enumerate(event['sources'], 1):
+                print(f"{i}. {source['title']} (Score: {source['similarity_score']:.3f})")
+            print("\nGrounded Response:")
+        elif event['type'] == 'delta':
+            print(event['text'], end='', flush=True)
+    print()
+    
     # Comparison demo
-    print("\n5. Comparing grounded vs ungrounded responses...")
+    print("\n6. Comparing grounded vs ungrounded responses...")
     test_question = "What is the most important greenhouse gas?"
     
     comparison = rag.compare_responses(test_question)
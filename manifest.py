@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import List, Dict
+
+class KnowledgeBaseManifest:
+    """Tracks the source files behind a knowledge base and the chunks built from them.
+
+    ``settings`` records how the chunks were built, so an incremental build
+    can tell whether unchanged files would still be chunked the same way.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.settings = {}
+        self._hashes = {}
+
+    @staticmethod
+    def hash_file(file_path: Path) -> str:
+        """Compute the SHA-256 hash of a file's contents."""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def scan(self, file_paths: List[Path]) -> Dict[str, List]:
+        """Classify files as added, changed, removed or unchanged since the last build."""
+        changes = {'added': [], 'changed': [], 'removed': [], 'unchanged': []}
+        seen = set()
+
+        for file_path in file_paths:
+            source = str(file_path)
+            seen.add(source)
+            stat = file_path.stat()
+            entry = self.entries.get(source)
+
+            # Size and mtime match: trust the entry without reading the file
+            if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+                changes['unchanged'].append(file_path)
+                continue
+
+            content_hash = self.hash_file(file_path)
+            self._hashes[source] = content_hash
+
+            if entry is None:
+                changes['added'].append(file_path)
+            elif entry['content_hash'] == content_hash:
+                # Touched but not modified
+                entry['size'] = stat.st_size
+                entry['mtime'] = stat.st_mtime
+                changes['unchanged'].append(file_path)
+            else:
+                changes['changed'].append(file_path)
+
+        changes['removed'] = [source for source in self.entries if source not in seen]
+        return changes
+
+    def record(self, file_path: Path):
+        """Record the current state of a processed file."""
+        source = str(file_path)
+        stat = file_path.stat()
+        content_hash = self._hashes.pop(source, None) or self.hash_file(file_path)
+        self.entries[source] = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'content_hash': content_hash,
+            'chunk_ids': []
+        }
+
+    def remove(self, source: str):
+        """Forget a source file."""
+        self.entries.pop(source, None)
+
+    def update_chunk_ids(self, chunk_sources: List[List[str]]):
+        """Re-derive each source's chunk ids from the sources every stored chunk stands for."""
+        for entry in self.entries.values():
+            entry['chunk_ids'] = []
+        for idx, sources in enumerate(chunk_sources):
+            for source in dict.fromkeys(sources):
+                entry = self.entries.get(source)
+                if entry is not None:
+                    entry['chunk_ids'].append(idx)
+
+    def save(self, filepath: str):
+        """Save the manifest to disk."""
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        tmp_path = f"{filepath}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'entries': self.entries, 'settings': self.settings}, f)
+        os.replace(tmp_path, filepath)
+
+    def load(self, filepath: str) -> bool:
+        """Load the manifest from disk, returning False if none exists."""
+        if not os.path.exists(filepath):
+            return False
+        with open(filepath, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        self.entries = data['entries']
+        self.settings = data.get('settings', {})
+        self._hashes = {}
+        return True
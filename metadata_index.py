@@ -0,0 +1,87 @@
+import threading
+import numpy as np
+from typing import Dict, Any, List, Optional
+
+class MetadataIndex:
+    """Inverted index from chunk metadata values to vector ids.
+
+    Posting lists are built per field the first time that field is
+    filtered on. List-valued fields such as ``tags`` index every value, and
+    a chunk standing in for merged duplicates also matches their values.
+    Changed and deleted chunks are updated in the built posting lists.
+    """
+    
+    def __init__(self, chunk_store):
+        self.chunk_store = chunk_store
+        self._postings = {}
+        self._duplicates = None
+        self._removed = set()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _values(own_value: Any, duplicates: Optional[List[Dict]], field: str) -> List:
+        """Every value a chunk is indexed under for a field."""
+        values = []
+        for value in [own_value] + [duplicate.get(field) for duplicate in duplicates or ()]:
+            values.extend(value if isinstance(value, list) else [value])
+        return values
+    
+    def _field_postings(self, field: str) -> Dict[Any, np.ndarray]:
+        # Concurrent searches must not build the same posting lists twice
+        with self._lock:
+            if field not in self._postings:
+                if self._duplicates is None:
+                    self._duplicates = self.chunk_store.column('duplicates')
+                postings = {}
+                for idx, (own_value, duplicates) in enumerate(zip(self.chunk_store.column(field), self._duplicates)):
+                    if idx in self._removed:
+                        continue
+                    for value in self._values(own_value, duplicates, field):
+                        postings.setdefault(value, []).append(idx)
+                self._postings[field] = {
+                    value: np.array(ids, dtype='int64') for value, ids in postings.items()
+                }
+            return self._postings[field]
+    
+    def match(self, filters: Dict[str, Any]) -> np.ndarray:
+        """Return the sorted ids of chunks matching all filters.
+
+        Each filter maps a field to a value or a list of accepted values; a
+        chunk matches if every field has one of its accepted values.
+        """
+        ids = np.arange(len(self.chunk_store), dtype='int64')
+        for field, accepted in filters.items():
+            if not isinstance(accepted, (list, tuple, set)):
+                accepted = [accepted]
+            postings = self._field_postings(field)
+            field_ids = [postings[value] for value in accepted if value in postings]
+            if not field_ids:
+                return np.zeros(0, dtype='int64')
+            ids = np.intersect1d(ids, np.unique(np.concatenate(field_ids)), assume_unique=True)
+        return ids
+    
+    def update(self, idx: int, old_chunk: Dict, new_chunk: Optional[Dict]):
+        """Re-index a chunk whose metadata changed from old_chunk to new_chunk, or that was deleted (None)."""
+        with self._lock:
+            if new_chunk is None:
+                self._removed.add(idx)
+            elif self._duplicates is not None:
+                self._duplicates[idx] = new_chunk.get('duplicates')
+            for field, postings in self._postings.items():
+                old_values = set(self._values(old_chunk.get(field), old_chunk.get('duplicates'), field))
+                new_values = set() if new_chunk is None else set(
+                    self._values(new_chunk.get(field), new_chunk.get('duplicates'), field)
+                )
+                for value in old_values - new_values:
+                    ids = postings[value][postings[value] != idx]
+                    if len(ids):
+                        postings[value] = ids
+                    else:
+                        del postings[value]
+                for value in new_values - old_values:
+                    ids = postings.get(value, np.zeros(0, dtype='int64'))
+                    postings[value] = np.insert(ids, np.searchsorted(ids, idx), idx)
+    
+    def remove(self, idx: int, chunk: Dict):
+        """Stop matching a deleted chunk."""
+        self.update(idx, chunk, None)
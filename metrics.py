@@ -0,0 +1,217 @@
+import bisect
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence
+from config import Config
+
+# Histogram bucket upper bounds, in seconds for the stage timing histograms
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class _NullSpan:
+    """Span that does nothing, handed out while instrumentation is disabled."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class Span:
+    """Times a block, adding the duration to a timings dict and a ``<name>_seconds`` histogram.
+
+    A block that raises also increments the ``<name>_errors`` counter.
+    """
+
+    __slots__ = ('metrics', 'name', 'timings', 'start')
+
+    def __init__(self, metrics: 'Metrics', name: str, timings: Optional[Dict[str, float]]):
+        self.metrics = metrics
+        self.name = name
+        self.timings = timings
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        if self.timings is not None:
+            self.timings[self.name] = self.timings.get(self.name, 0.0) + seconds
+        self.metrics.observe(f"{self.name}_seconds", seconds)
+        if exc_type is not None:
+            self.metrics.increment(f"{self.name}_errors")
+        return False
+
+class Metrics:
+    """Timing spans, counters and histograms, exported through pluggable sinks.
+
+    A sink is any object with ``increment(name, value)`` and
+    ``observe(name, value)`` methods. Without sinks every call returns
+    immediately, and ``span`` only measures time when the caller asks for
+    the duration in a timings dict.
+    """
+
+    def __init__(self):
+        self.sinks = []
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.sinks)
+
+    def add_sink(self, sink):
+        self.sinks = self.sinks + [sink]
+        return sink
+
+    def remove_sink(self, sink):
+        self.sinks = [s for s in self.sinks if s is not sink]
+
+    def increment(self, name: str, value: float = 1):
+        """Add to a counter."""
+        for sink in self.sinks:
+            sink.increment(name, value)
+
+    def observe(self, name: str, value: float):
+        """Record one observation of a histogram."""
+        for sink in self.sinks:
+            sink.observe(name, value)
+
+    def span(self, name: str, timings: Dict[str, float] = None):
+        """Context manager timing a pipeline stage, also recorded in timings if given."""
+        if timings is None and not self.sinks:
+            return _NULL_SPAN
+        return Span(self, name, timings)
+
+class InMemoryCollector:
+    """Sink keeping every counter and observation in memory, for tests and notebooks."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.observations = {}
+
+    def increment(self, name: str, value: float):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            self.observations.setdefault(name, []).append(value)
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.observations = {}
+
+class LoggingSink:
+    """Sink writing every counter increment and observation to a logger."""
+
+    def __init__(self, logger: logging.Logger = None, level: int = logging.INFO):
+        self.logger = logger or logging.getLogger('rag_pipeline.metrics')
+        self.level = level
+
+    def increment(self, name: str, value: float):
+        self.logger.log(self.level, "%s +%g", name, value)
+
+    def observe(self, name: str, value: float):
+        self.logger.log(self.level, "%s %.6f", name, value)
+
+class PrometheusSink:
+    """Sink aggregating counters and bucketed histograms in the Prometheus text format.
+
+    ``render()`` returns the exposition text; ``serve(port)`` exposes it on
+    ``/metrics`` from a background HTTP server.
+    """
+
+    def __init__(self, namespace: str = 'rag', buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.namespace = namespace
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}  # name -> [bucket counts..., +Inf count], sum
+        self.server = None
+
+    def increment(self, name: str, value: float):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts, total = self._histograms[name]
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._histograms[name][1] = total + value
+
+    def render(self) -> str:
+        """Current values in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, value in sorted(self._counters.items()):
+                metric = f"{self.namespace}_{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {value:g}")
+
+            for name, (counts, total) in sorted(self._histograms.items()):
+                metric = f"{self.namespace}_{name}"
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{le="{bound:g}"}} {cumulative}')
+                cumulative += counts[-1]
+                lines.append(f'{metric}_bucket{{le="+Inf"}} {cumulative}')
+                lines.append(f"{metric}_sum {total:g}")
+                lines.append(f"{metric}_count {cumulative}")
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+        """Serve ``/metrics`` on a daemon thread, on the loopback interface unless another host is given."""
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = sink.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server
+
+# Process-wide instrumentation used by every pipeline component
+metrics = Metrics()
+
+_configured = False
+_configure_lock = threading.Lock()
+
+def configure_metrics() -> List:
+    """Attach the sinks enabled in Config, once per process; returns the sinks added."""
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return []
+        _configured = True
+
+        added = []
+        if Config.METRICS_LOGGING:
+            added.append(metrics.add_sink(LoggingSink()))
+        if Config.METRICS_PORT:
+            sink = PrometheusSink()
+            sink.serve(Config.METRICS_PORT, Config.METRICS_HOST)
+            added.append(metrics.add_sink(sink))
+        return added
@@ -1,81 +1,917 @@
-from typing import List, Dict
+from typing import List, Dict, Iterator, Any, Optional, Tuple
 from document_processor import DocumentProcessor
-from embedding_generator import EmbeddingGenerator
-from vector_store import VectorStore
-from llm_interface import LLMInterface
+from manifest import KnowledgeBaseManifest
+from resource_registry import ResourceRegistry
+from snapshots import SnapshotManager
+from answer_cache import AnswerCache
+from single_flight import SingleFlight
+from metrics import metrics, configure_metrics
 from config import Config
 import os
+import json
+import time
+import unicodedata
+import asyncio
+import threading
+import weakref
+from pathlib import Path
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Stored vectors searched for themselves when validating a new snapshot
+VALIDATION_PROBES = 16
+
+# Share of probes that must find themselves; approximate indexes may miss a few
+MIN_PROBE_HIT_RATE = 0.9
 
 class RAGPipeline:
-    """End-to-end RAG pipeline."""
+    """End-to-end RAG pipeline.
     
-    def __init__(self):
-        self.doc_processor = DocumentProcessor(
-            chunk_size=Config.CHUNK_SIZE,
-            chunk_overlap=Config.CHUNK_OVERLAP
-        )
-        self.embedding_generator = EmbeddingGenerator(Config.EMBEDDING_MODEL)
-        self.vector_store = VectorStore(self.embedding_generator.embedding_dim)
-        self.llm_interface = LLMInterface()
+    Components are imported and constructed on first use, so creating a
+    pipeline is cheap and e.g. loading a knowledge base never builds an LLM
+    client. Call ``warmup()`` to load everything up front instead.
+    
+    With a ``registry``, the embedding model and loaded knowledge bases are
+    shared read-only with every other pipeline using the same registry, so
+    each pipeline only holds lightweight per-user state. Building a
+    knowledge base works on a private copy and publishes the result.
+    
+    Knowledge bases are versioned snapshots: a build, possibly running in
+    the background, publishes a new snapshot and swaps it in without
+    interrupting queries, and pipelines reload snapshots published by
+    others when they next query.
+    """
+    
+    def __init__(self, registry: ResourceRegistry = None):
+        configure_metrics()
+        self.registry = registry
+        self._shared = {}  # component -> (registry key, finalizer releasing it)
+        self._doc_processor = None
+        self._embedding_generator = None
+        self._vector_store = None
+        self._llm_interface = None
+        self._async_llm_interface = None
+        self._answer_cache = None
+        self._single_flight = None
         self.is_indexed = False
+        self._loaded_version = None  # snapshot the vector store was loaded from
+        self._build_lock = threading.Lock()
+        self._background_executor = None
+        self._reloading = threading.Event()
+        self._last_snapshot_check = time.monotonic()
     
-    def build_knowledge_base(self, documents_directory: str):
-        """Build the knowledge base from documents."""
-        print("Loading documents...")
-        documents = self.doc_processor.load_documents(documents_directory)
-        print(f"Loaded {len(documents)} documents")
+    def _acquire_shared(self, component: str, key, factory, close_on_release: bool = True):
+        """Take a reference to a shared resource, released by close() or when the pipeline is collected.
         
+        The new resource is acquired before the previous one of the
+        component is released, so a reload of the same key reuses it.
+        """
+        resource = self.registry.acquire(key, factory, close_on_release)
+        self._release_shared(component)
+        self._shared[component] = (key, weakref.finalize(self, self.registry.release, key))
+        return resource
+    
+    def _release_shared(self, component: str):
+        if component in self._shared:
+            _, finalizer = self._shared.pop(component)
+            finalizer()
+    
+    def close(self):
+        """Release the shared resources this pipeline holds."""
+        for component in list(self._shared):
+            self._release_shared(component)
+        self._embedding_generator = None
+        self._vector_store = None
+        self._answer_cache = None
+        self._single_flight = None
+        self.is_indexed = False
+        if self._background_executor is not None:
+            self._background_executor.shutdown(wait=False)
+            self._background_executor = None
+    
+    @property
+    def doc_processor(self) -> DocumentProcessor:
+        """Document loader and chunker; token chunking loads the embedding tokenizer."""
+        if self._doc_processor is None:
+            doc_processor = DocumentProcessor(
+                chunk_size=Config.CHUNK_SIZE,
+                chunk_overlap=Config.CHUNK_OVERLAP
+            )
+            if Config.CHUNKING_STRATEGY == 'tokens':
+                doc_processor.use_tokenizer(
+                    self.embedding_generator.tokenizer,
+                    self.embedding_generator.max_seq_length
+                )
+            self._doc_processor = doc_processor
+        return self._doc_processor
+    
+    @property
+    def embedding_generator(self) -> 'EmbeddingGenerator':
+        """Embedding generator; its model is loaded on first encode."""
+        if self._embedding_generator is None:
+            if self.registry is not None:
+                key = ('embedding_generator', Config.EMBEDDING_MODEL, Config.EMBEDDING_BACKEND)
+                self._embedding_generator = self._acquire_shared(
+                    'embedding_generator', key, self._create_embedding_generator
+                )
+            else:
+                self._embedding_generator = self._create_embedding_generator()
+        return self._embedding_generator
+    
+    def _create_embedding_generator(self) -> 'EmbeddingGenerator':
+        from embedding_generator import EmbeddingGenerator
+        return EmbeddingGenerator(
+            Config.EMBEDDING_MODEL,
+            cache_path=Config.EMBEDDING_CACHE_PATH if Config.EMBEDDING_CACHE_ENABLED else None,
+            backend=Config.EMBEDDING_BACKEND,
+            backend_dir=Config.EMBEDDING_BACKEND_DIR,
+            batch_size=Config.EMBEDDING_BATCH_SIZE,
+            num_workers=Config.EMBEDDING_WORKERS,
+            threads_per_worker=Config.EMBEDDING_THREADS_PER_WORKER
+        )
+    
+    @property
+    def vector_store(self) -> 'VectorStore':
+        """Empty vector store sized for the embedding model, unless a knowledge base was loaded."""
+        if self._vector_store is None:
+            self._vector_store = self._create_vector_store(self.embedding_generator.embedding_dim)
+        return self._vector_store
+    
+    @property
+    def llm_interface(self) -> 'LLMInterface':
+        """Synchronous LLM interface."""
+        if self._llm_interface is None:
+            from llm_interface import LLMInterface
+            self._llm_interface = LLMInterface()
+        return self._llm_interface
+    
+    @property
+    def async_llm_interface(self) -> 'AsyncLLMInterface':
+        """Asynchronous LLM interface."""
+        if self._async_llm_interface is None:
+            from llm_interface import AsyncLLMInterface
+            self._async_llm_interface = AsyncLLMInterface()
+        return self._async_llm_interface
+    
+    @property
+    def answer_cache(self) -> Optional[AnswerCache]:
+        """Persistent cache of LLM answers, or None when ``ANSWER_CACHE_ENABLED`` is off."""
+        if self._answer_cache is None and Config.ANSWER_CACHE_ENABLED:
+            if self.registry is not None:
+                key = ('answer_cache', os.path.abspath(Config.ANSWER_CACHE_PATH))
+                self._answer_cache = self._acquire_shared('answer_cache', key, self._create_answer_cache)
+            else:
+                self._answer_cache = self._create_answer_cache()
+            if self.is_indexed:
+                self._answer_cache.invalidate(self._loaded_version)
+        return self._answer_cache
+    
+    @property
+    def single_flight(self) -> SingleFlight:
+        """Coalesces identical concurrent queries; shared by every pipeline using the registry."""
+        if self._single_flight is None:
+            if self.registry is not None:
+                self._single_flight = self._acquire_shared('single_flight', ('single_flight',), SingleFlight)
+            else:
+                self._single_flight = SingleFlight()
+        return self._single_flight
+    
+    def _flight_key(self, question: str, top_k: int, filters: Dict[str, Any] = None) -> tuple:
+        """Queries with the same key get the same answer: normalized question, top k, filters and snapshot."""
+        normalized = ' '.join(unicodedata.normalize('NFC', question).casefold().split())
+        return (normalized, top_k, json.dumps(filters, sort_keys=True, default=str), self._loaded_version)
+    
+    def _create_answer_cache(self) -> AnswerCache:
+        return AnswerCache(
+            Config.ANSWER_CACHE_PATH,
+            ttl=Config.ANSWER_CACHE_TTL,
+            max_entries=Config.ANSWER_CACHE_MAX_ENTRIES,
+            semantic_threshold=Config.SEMANTIC_CACHE_THRESHOLD if Config.SEMANTIC_CACHE_ENABLED else None
+        )
+    
+    def _create_vector_store(self, embedding_dim: int, num_shards: int = None) -> 'VectorStore':
+        """Empty store in the configured layout, or with the shard count of a saved store."""
+        if num_shards is None:
+            num_shards = len(Config.VECTOR_SHARD_ADDRESSES) if Config.VECTOR_SHARD_ADDRESSES else Config.VECTOR_SHARDS
+        if num_shards > 1 or Config.VECTOR_SHARD_ADDRESSES:
+            from sharded_store import ShardedVectorStore
+            authkey = Config.VECTOR_SHARD_AUTHKEY
+            return ShardedVectorStore(
+                embedding_dim,
+                num_shards=num_shards,
+                processes=Config.VECTOR_SHARD_PROCESSES,
+                addresses=Config.VECTOR_SHARD_ADDRESSES,
+                authkey=authkey.encode('utf-8') if authkey else None,
+                **self._vector_store_settings()
+            )
+        from vector_store import VectorStore
+        return VectorStore(embedding_dim, **self._vector_store_settings())
+    
+    @staticmethod
+    def _vector_store_settings() -> Dict[str, Any]:
+        """Index and storage settings of every store, or every shard of a sharded store."""
+        return dict(
+            index_type=Config.INDEX_TYPE,
+            hnsw_m=Config.HNSW_M,
+            ef_construction=Config.HNSW_EF_CONSTRUCTION,
+            ef_search=Config.HNSW_EF_SEARCH,
+            nlist=Config.IVF_NLIST,
+            nprobe=Config.IVF_NPROBE,
+            pq_m=Config.PQ_M,
+            pq_nbits=Config.PQ_NBITS,
+            storage=Config.VECTOR_STORAGE,
+            rerank_factor=Config.RERANK_FACTOR,
+            deduplicate=Config.DEDUPLICATE_CHUNKS,
+            duplicate_threshold=Config.DUPLICATE_SIMILARITY
+        )
+    
+    @staticmethod
+    def _chunking_settings() -> Dict[str, Any]:
+        """Settings that determine the chunks and embeddings built from a file, recorded in the manifest."""
+        return {
+            'chunking_strategy': Config.CHUNKING_STRATEGY,
+            'chunk_size': Config.CHUNK_SIZE,
+            'chunk_overlap': Config.CHUNK_OVERLAP,
+            'embedding_model': Config.EMBEDDING_MODEL
+        }
+    
+    def warmup(self):
+        """Load the embedding model (with a dummy encode), the knowledge base and the LLM clients now."""
+        self.embedding_generator.warmup()
+        if not self.is_indexed:
+            self.load_knowledge_base()
+        self._ensure_llm_clients()
+    
+    def _ensure_llm_clients(self):
+        """Create the synchronous and asynchronous LLM clients if they do not exist yet."""
+        _ = self.llm_interface
+        _ = self.async_llm_interface
+    
+    @property
+    def snapshots(self) -> SnapshotManager:
+        """Versioned knowledge base snapshots under ``Config.VECTOR_DB_PATH``."""
+        remote_shards = None
+        if Config.VECTOR_SHARD_ADDRESSES:
+            from sharded_store import RemoteShardFiles
+            authkey = Config.VECTOR_SHARD_AUTHKEY
+            remote_shards = RemoteShardFiles(Config.VECTOR_SHARD_ADDRESSES, authkey.encode('utf-8') if authkey else None)
+        return SnapshotManager(Config.VECTOR_DB_PATH, Config.SNAPSHOT_LEASE, remote_shards)
+    
+    def _published_store(self) -> Tuple[Optional[str], str]:
+        """The published snapshot version and its store path; older unversioned stores have no version."""
+        snapshots = self.snapshots
+        version = snapshots.current()
+        if version is not None:
+            return version, snapshots.store_path(version)
+        return None, os.path.join(Config.VECTOR_DB_PATH, 'vector_store')
+    
+    def _vector_store_path(self) -> str:
+        return self._published_store()[1]
+    
+    def _index_documents(self, documents: List[Dict], vector_store: 'VectorStore',
+                         timings: Dict[str, float] = None) -> int:
+        """Chunk, embed and add documents to the vector store."""
         print("Processing documents into chunks...")
-        chunks = self.doc_processor.process_documents(documents)
+        with metrics.span('chunk', timings):
+            chunks = self.doc_processor.process_documents(documents)
         print(f"Created {len(chunks)} chunks")
         
+        if not chunks:
+            return 0
+        
         print("Generating embeddings...")
         texts = [chunk['content'] for chunk in chunks]
-        embeddings = self.embedding_generator.generate_embeddings(texts)
+        with metrics.span('embed', timings):
+            embeddings = self.embedding_generator.generate_embeddings(texts)
         
         print("Building vector store...")
-        self.vector_store.add_embeddings(embeddings, chunks)
+        with metrics.span('index', timings):
+            num_added = vector_store.add_embeddings(embeddings, chunks)
+        metrics.increment('chunks_indexed', num_added)
+        metrics.increment('duplicate_chunks', len(chunks) - num_added)
+        return num_added
+    
+    def _stream_documents(self, file_paths: List[Path], manifest: KnowledgeBaseManifest,
+                          documents_directory: str, vector_store: 'VectorStore', vector_store_path: str,
+                          timings: Dict[str, float] = None) -> int:
+        """Ingest files in bounded-memory batches, checkpointing progress to disk."""
+        from ingestion import IngestionPipeline
+        
+        checkpoint_path = f"{vector_store_path}.checkpoint.json"
         
-        # Save the vector store
-        vector_store_path = os.path.join(Config.VECTOR_DB_PATH, 'vector_store')
-        self.vector_store.save(vector_store_path)
+        def flush(completed: List[Path], final: bool):
+            for file_path in completed:
+                manifest.record(file_path)
+            if final:
+                # build_knowledge_base saves the finished store
+                return
+            manifest.update_chunk_ids(vector_store.chunk_sources())
+            vector_store.save(vector_store_path)
+            manifest.save(f"{vector_store_path}.manifest.json")
+            
+            # The checkpoint marks the saved store as a partial build to resume
+            with open(checkpoint_path, 'w', encoding='utf-8') as f:
+                json.dump({'documents_directory': os.path.abspath(documents_directory)}, f)
+        
+        pipeline = IngestionPipeline(
+            self.doc_processor,
+            self.embedding_generator,
+            vector_store,
+            batch_size=Config.INGEST_BATCH_SIZE,
+            queue_size=Config.INGEST_QUEUE_SIZE,
+            flush_every=Config.INGEST_FLUSH_EVERY,
+            flush_growth=Config.INGEST_FLUSH_GROWTH,
+            train_size=Config.INGEST_TRAIN_SIZE
+        )
+        try:
+            return pipeline.run(file_paths, on_flush=flush)
+        finally:
+            if timings is not None:
+                timings.update(pipeline.timings)
+    
+    def _find_interrupted_build(self, documents_directory: str) -> Optional[str]:
+        """Find an abandoned snapshot of the same directory with a streaming checkpoint to resume."""
+        snapshots = self.snapshots
+        for version in reversed(snapshots.abandoned()):
+            checkpoint_path = f"{snapshots.store_path(version)}.checkpoint.json"
+            if not os.path.exists(checkpoint_path):
+                continue
+            with open(checkpoint_path, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+            if checkpoint['documents_directory'] == os.path.abspath(documents_directory):
+                return version
+        return None
+    
+    def build_knowledge_base(self, documents_directory: str, incremental: bool = None,
+                             streaming: bool = None) -> int:
+        """Build the knowledge base from documents into a new snapshot.
+        
+        The build works on a private vector store saved to a new versioned
+        snapshot, while queries keep using the published one. The saved
+        snapshot is loaded back and validated, published atomically and
+        swapped in; in-flight queries finish on the old store, which stays
+        on disk for ``rollback_knowledge_base()``.
+        
+        In incremental mode only files added, changed or removed since the
+        last build (according to the manifest) are re-processed. In
+        streaming mode documents flow through the pipeline in batches that
+        are periodically saved, and an interrupted build resumes from the
+        last checkpoint. The time spent in each stage is printed at the end.
+        """
+        timings = {}
+        with self._build_lock, self.snapshots.build_lock():
+            with metrics.span('build_knowledge_base', timings):
+                num_chunks = self._build_knowledge_base(documents_directory, incremental, streaming, timings)
+        print("Stage timings: " + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in timings.items()))
+        return num_chunks
+    
+    def build_knowledge_base_in_background(self, documents_directory: str, incremental: bool = None,
+                                           streaming: bool = None) -> Future:
+        """Run ``build_knowledge_base`` on a background thread, returning a future of its chunk count."""
+        return self._background.submit(self.build_knowledge_base, documents_directory, incremental, streaming)
+    
+    @property
+    def _background(self) -> ThreadPoolExecutor:
+        """Single worker thread for builds and snapshot reloads."""
+        if self._background_executor is None:
+            self._background_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='knowledge-base')
+        return self._background_executor
+    
+    def _build_knowledge_base(self, documents_directory: str, incremental: bool, streaming: bool,
+                              timings: Dict[str, float]) -> int:
+        if incremental is None:
+            incremental = Config.INCREMENTAL_BUILD
+        if streaming is None:
+            streaming = Config.STREAMING_INGESTION
+        
+        snapshots = self.snapshots
+        file_paths = self.doc_processor.list_document_files(documents_directory)
+        
+        version = self._find_interrupted_build(documents_directory)
+        if version is not None:
+            # Everything saved before the interruption counts as already built
+            print(f"Resuming interrupted build of snapshot {version} from checkpoint")
+            incremental = True
+        else:
+            # Left behind by builds that crashed before completing
+            for abandoned in snapshots.abandoned():
+                snapshots.discard(abandoned)
+            base_path = self._vector_store_path()
+            has_base = incremental and self._has_vector_store(base_path)
+            version = snapshots.create(base_path if has_base else None)
+        
+        with snapshots.owned(version):
+            return self._build_snapshot(version, documents_directory, file_paths, incremental, streaming, timings)
+    
+    def _build_snapshot(self, version: str, documents_directory: str, file_paths: List[Path],
+                        incremental: bool, streaming: bool, timings: Dict[str, float]) -> int:
+        """Build a pending snapshot, then validate, publish and load it."""
+        snapshots = self.snapshots
+        manifest = KnowledgeBaseManifest()
+        vector_store_path = snapshots.store_path(version)
+        manifest_path = f"{vector_store_path}.manifest.json"
+        checkpoint_path = f"{vector_store_path}.checkpoint.json"
+        
+        # Build on a private store, the published one keeps serving queries
+        vector_store = None
+        if incremental and os.path.exists(f"{vector_store_path}.metadata"):
+            vector_store = self._load_vector_store(vector_store_path)
+            if not manifest.load(manifest_path):
+                print("No manifest found for existing knowledge base, rebuilding from scratch")
+                incremental = False
+            elif manifest.settings != self._chunking_settings():
+                # Unchanged files would keep chunks built differently from the new ones
+                print("Chunking settings changed since the last build, rebuilding from scratch")
+                manifest = KnowledgeBaseManifest()
+                incremental = False
+        manifest.settings = self._chunking_settings()
+        if vector_store is None or not incremental:
+            # Start from an empty store so a rebuild never duplicates vectors
+            vector_store = self._create_vector_store(self.embedding_generator.embedding_dim)
+        
+        if incremental:
+            changes = manifest.scan(file_paths)
+            print(f"Found {len(changes['added'])} added, {len(changes['changed'])} changed, "
+                  f"{len(changes['removed'])} removed, {len(changes['unchanged'])} unchanged documents")
+            
+            for source in changes['removed']:
+                manifest.remove(source)
+            
+            # Delete chunks of changed and removed files, and any partial
+            # chunks of files an interrupted build did not finish; the
+            # index keeps them as tombstones until it is compacted
+            current_sources = set(manifest.entries) - {str(p) for p in changes['changed']}
+            stale_sources = {source for sources in vector_store.chunk_sources() for source in sources} - current_sources
+            metrics.increment('chunks_deleted', vector_store.delete(stale_sources))
+            file_paths = changes['added'] + changes['changed']
+        
+        if streaming:
+            print("Streaming documents into the vector store...")
+            num_chunks = self._stream_documents(file_paths, manifest, documents_directory,
+                                                vector_store, vector_store_path, timings)
+            print(f"Added {num_chunks} chunks")
+        else:
+            print("Loading documents...")
+            with metrics.span('load_documents', timings):
+                documents = self.doc_processor.load_files(
+                    file_paths,
+                    parallel=Config.PARALLEL_LOADING,
+                    max_workers=Config.LOADER_WORKERS
+                )
+            # Files that failed to load are retried on the next incremental build
+            failed_sources = {error['source'] for error in self.doc_processor.load_errors}
+            for file_path in file_paths:
+                if str(file_path) not in failed_sources:
+                    manifest.record(file_path)
+            print(f"Loaded {len(documents)} documents")
+            
+            self._index_documents(documents, vector_store, timings)
+        
+        manifest.update_chunk_ids(vector_store.chunk_sources())
+        
+        # Save the snapshot
+        with metrics.span('save', timings):
+            vector_store.save(vector_store_path)
+            manifest.save(manifest_path)
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
         print(f"Vector store saved to {vector_store_path}")
         
+        # Serve exactly what is on disk, and only if it is sound
+        with metrics.span('validate', timings):
+            vector_store = self._validate_snapshot(vector_store_path, len(vector_store.metadata))
+        snapshots.complete(version, {
+            'documents_directory': os.path.abspath(documents_directory),
+            'num_chunks': vector_store.num_chunks
+        })
+        snapshots.publish(version)
+        print(f"Published knowledge base snapshot {version}")
+        
+        self._swap_vector_store(vector_store, version, vector_store_path)
+        snapshots.prune(Config.SNAPSHOTS_TO_KEEP)
+        
+        if vector_store.dead_ratio > Config.COMPACTION_DEAD_RATIO:
+            print(f"{vector_store.dead_ratio:.0%} of indexed vectors belong to deleted chunks, compacting in the background")
+            self._background.submit(self.compact_knowledge_base).add_done_callback(self._report_compaction)
+        return vector_store.num_chunks
+    
+    def compact_knowledge_base(self) -> Optional[str]:
+        """Publish a copy of the current snapshot without its deleted chunks, returning its version.
+        
+        Deleted chunks are only tombstoned by incremental builds; this
+        reclaims their space in the index and the chunk store.
+        """
+        with self._build_lock, self.snapshots.build_lock():
+            snapshots = self.snapshots
+            base_version, base_path = self._published_store()
+            if base_version is None:
+                print("No published snapshot to compact")
+                return None
+            
+            version = snapshots.create(base_path)
+            with snapshots.owned(version):
+                vector_store_path = snapshots.store_path(version)
+                manifest_path = f"{vector_store_path}.manifest.json"
+                vector_store = self._load_vector_store(vector_store_path)
+                num_removed = vector_store.compact()
+                metrics.increment('chunks_compacted', num_removed)
+                
+                # Manifest chunk ids are positions, which compaction shifts
+                manifest = KnowledgeBaseManifest()
+                if manifest.load(manifest_path):
+                    manifest.update_chunk_ids(vector_store.chunk_sources())
+                    manifest.save(manifest_path)
+                vector_store.save(vector_store_path)
+                
+                vector_store = self._validate_snapshot(vector_store_path, len(vector_store.metadata))
+                snapshots.complete(version, dict(snapshots.info(base_version), compacted_from=base_version))
+            snapshots.publish(version)
+            print(f"Published knowledge base snapshot {version}, compacted {num_removed} deleted chunks")
+            
+            self._swap_vector_store(vector_store, version, vector_store_path)
+            snapshots.prune(Config.SNAPSHOTS_TO_KEEP)
+            return version
+    
+    @staticmethod
+    def _report_compaction(future: Future):
+        if future.exception() is not None:
+            print(f"Compacting the knowledge base failed: {future.exception()}")
+    
+    def _validate_snapshot(self, vector_store_path: str, expected_chunks: int) -> 'VectorStore':
+        """Load a saved snapshot back from disk and check it is complete and searchable."""
+        import numpy as np
+        
+        vector_store = self._load_vector_store(vector_store_path)
+        num_chunks = len(vector_store.metadata)
+        if num_chunks != expected_chunks or vector_store.num_vectors != num_chunks:
+            raise ValueError(
+                f"Snapshot {vector_store_path} is inconsistent: {vector_store.num_vectors} vectors and "
+                f"{num_chunks} chunks, expected {expected_chunks}; the current knowledge base was kept"
+            )
+        
+        live_ids = vector_store.live_positions()
+        if len(live_ids):
+            # Stored vectors must find themselves; deleted ones are never returned
+            probe_ids = np.random.default_rng(0).choice(live_ids, min(VALIDATION_PROBES, len(live_ids)), replace=False)
+            scores, _ = vector_store.search_ids(vector_store.reconstruct(probe_ids), k=1)
+            hit_rate = float(np.mean(scores[:, 0] >= 0.99))
+            if hit_rate < MIN_PROBE_HIT_RATE:
+                raise ValueError(
+                    f"Snapshot {vector_store_path} failed validation: only {hit_rate:.0%} of stored "
+                    "vectors were found by search; the current knowledge base was kept"
+                )
+        return vector_store
+    
+    def _swap_vector_store(self, vector_store: 'VectorStore', version: Optional[str], vector_store_path: str):
+        """Start serving a loaded store; queries already running keep the store they started with."""
+        if self.registry is not None:
+            # Publish the store to the other pipelines. The previous store is not closed, as
+            # running queries may still search it; sharded stores stop their shards once collected
+            self._vector_store = self._acquire_shared(
+                'vector_store', self._shared_vector_store_key(vector_store_path), lambda: vector_store,
+                close_on_release=False
+            )
+        else:
+            self._vector_store = vector_store
+        self._set_loaded_version(version)
         self.is_indexed = True
-        return len(chunks)
     
-    def load_knowledge_base(self):
-        """Load existing knowledge base."""
-        vector_store_path = os.path.join(Config.VECTOR_DB_PATH, 'vector_store')
+    def _set_loaded_version(self, version: Optional[str]):
+        """Record the served snapshot; cached answers grounded in other versions are dropped."""
+        if self._answer_cache is not None and version != self._loaded_version:
+            self._answer_cache.invalidate(version)
+        self._loaded_version = version
+    
+    def rollback_knowledge_base(self) -> Optional[str]:
+        """Publish and load the snapshot before the current one, returning its version."""
+        with self._build_lock, self.snapshots.build_lock():
+            version = self.snapshots.previous()
+            if version is None:
+                print("No earlier snapshot to roll back to")
+                return None
+            self.snapshots.publish(version)
+        print(f"Rolled back to knowledge base snapshot {version}")
+        self.load_knowledge_base()
+        return version
+    
+    def _check_for_new_snapshot(self):
+        """Reload in the background if another pipeline published or rolled back a snapshot.
+        
+        Checks at most every ``Config.SNAPSHOT_POLL_INTERVAL`` seconds;
+        queries keep using the loaded store until the reload swaps it.
+        """
+        if not self.is_indexed or Config.SNAPSHOT_POLL_INTERVAL is None:
+            return
+        now = time.monotonic()
+        if now - self._last_snapshot_check < Config.SNAPSHOT_POLL_INTERVAL:
+            return
+        self._last_snapshot_check = now
+        
+        if self.snapshots.current() != self._loaded_version and not self._reloading.is_set():
+            self._reloading.set()
+            future = self._background.submit(self.load_knowledge_base)
+            future.add_done_callback(lambda _: self._reloading.clear())
+    
+    def _load_vector_store(self, vector_store_path: str) -> 'VectorStore':
+        """Load a saved vector store, sized from its saved settings rather than the embedding model."""
+        from vector_store import VectorStore
+        settings = VectorStore.read_settings(vector_store_path)
+        vector_store = self._create_vector_store(settings['embedding_dim'], settings.get('num_shards', 1))
+        vector_store.load(vector_store_path)
+        return vector_store
+    
+    @staticmethod
+    def _has_vector_store(vector_store_path: str) -> bool:
+        """Whether a loadable store is saved at a path; legacy pickled stores are reported and ignored."""
+        if not os.path.exists(f"{vector_store_path}.metadata"):
+            return False
+        from vector_store import VectorStore
+        try:
+            VectorStore.read_settings(vector_store_path)
+        except ValueError as e:
+            print(e)
+            return False
+        return True
+    
+    @staticmethod
+    def _shared_vector_store_key(vector_store_path: str) -> tuple:
+        """Registry key of a saved store; saving it again yields a new key."""
+        saved_at = os.stat(f"{vector_store_path}.metadata").st_mtime_ns
+        return ('vector_store', os.path.abspath(vector_store_path), saved_at)
+    
+    def load_knowledge_base(self, shared: bool = True):
+        """Load the published knowledge base snapshot.
         
-        if os.path.exists(f"{vector_store_path}.faiss"):
-            self.vector_store.load(vector_store_path)
+        With a registry the loaded store is shared with other pipelines
+        unless ``shared`` is False.
+        """
+        version, vector_store_path = self._published_store()
+        
+        if self._has_vector_store(vector_store_path):
+            if self.registry is not None and shared:
+                vector_store = self._acquire_shared(
+                    'vector_store',
+                    self._shared_vector_store_key(vector_store_path),
+                    lambda: self._load_vector_store(vector_store_path),
+                    close_on_release=False
+                )
+            else:
+                vector_store = self._load_vector_store(vector_store_path)
+                self._release_shared('vector_store')
+            self._vector_store = vector_store
+            self._set_loaded_version(version)
             self.is_indexed = True
-            print(f"Loaded vector store with {len(self.vector_store.metadata)} chunks")
+            print(f"Loaded vector store with {vector_store.num_chunks} chunks")
             return True
         else:
             print("No existing vector store found")
             return False
     
-    def query(self, question: str, top_k: int = None) -> Dict:
-        """Query the RAG system."""
+    def _retrieve(self, question: str, top_k: int, filters: Dict[str, Any] = None,
+                  timings: Dict[str, float] = None) -> Tuple[Any, List[Dict]]:
+        """Embed a question and retrieve its most relevant chunks, returning the embedding and the chunks."""
+        # Search the snapshot served when the query started, even if a new one is swapped in meanwhile
+        vector_store = self.vector_store
+        with metrics.span('embed_query', timings):
+            query_embedding = self.embedding_generator.generate_query_embedding(question)
+        with metrics.span('search', timings):
+            return query_embedding, vector_store.search(query_embedding, k=top_k, filters=filters)
+    
+    @staticmethod
+    def _is_answer(response: str) -> bool:
+        """Whether a response is an answer rather than a reported LLM failure, which is never cached."""
+        from llm_interface import ERROR_PREFIX
+        return not response.startswith(ERROR_PREFIX)
+    
+    def _answer_scope(self, interface, prompt: str, retrieved_chunks: List[Dict] = None,
+                      query_embedding=None) -> Dict[str, Any]:
+        """Answer cache arguments of an LLM request; grounded answers are tied to the loaded snapshot."""
+        model = getattr(interface, 'model', Config.LLM_MODEL)
+        scope = {'key': AnswerCache.make_key(model, Config.TEMPERATURE, prompt)}
+        if retrieved_chunks is not None:
+            scope['kb_version'] = self._loaded_version or ''
+            if query_embedding is not None:
+                chunk_ids = [chunk.get('vector_id') for chunk in retrieved_chunks]
+                scope['retrieval_key'] = AnswerCache.make_retrieval_key(
+                    model, Config.TEMPERATURE, scope['kb_version'], chunk_ids
+                )
+                scope['embedding'] = query_embedding
+        return scope
+    
+    def _generate(self, prompt: str, timings: Dict[str, float] = None, retrieved_chunks: List[Dict] = None,
+                  query_embedding=None) -> Tuple[str, Optional[str]]:
+        """Answer a prompt from the answer cache or the LLM, returning the response and the cache tier that answered."""
+        cache = self.answer_cache
+        if cache is not None:
+            scope = self._answer_scope(self.llm_interface, prompt, retrieved_chunks, query_embedding)
+            with metrics.span('answer_cache', timings):
+                response, tier = cache.get(**scope)
+            if response is not None:
+                return response, tier
+        
+        with metrics.span('generate', timings):
+            response = self.llm_interface.generate_response(prompt)
+        if cache is not None and self._is_answer(response):
+            cache.put(response=response, **scope)
+        return response, None
+    
+    async def _agenerate(self, prompt: str, timings: Dict[str, float] = None, retrieved_chunks: List[Dict] = None,
+                         query_embedding=None) -> Tuple[str, Optional[str]]:
+        """Async ``_generate``, calling the LLM through the async interface."""
+        cache = self.answer_cache
+        if cache is not None:
+            scope = self._answer_scope(self.async_llm_interface, prompt, retrieved_chunks, query_embedding)
+            with metrics.span('answer_cache', timings):
+                response, tier = cache.get(**scope)
+            if response is not None:
+                return response, tier
+        
+        with metrics.span('generate', timings):
+            response = await self.async_llm_interface.generate_response(prompt)
+        if cache is not None and self._is_answer(response):
+            cache.put(response=response, **scope)
+        return response, None
+    
+    def _grounded_result(self, question: str, retrieved_chunks: List[Dict], prompt: str,
+                         response: str, cached: Optional[str]) -> Dict:
+        return {
+            'query': question,
+            'response': response,
+            'sources': retrieved_chunks,
+            'prompt_used': prompt,
+            'cached': cached
+        }
+    
+    def _generate_grounded(self, question: str, retrieved_chunks: List[Dict], query_embedding=None,
+                           timings: Dict[str, float] = None) -> Dict:
+        """Generate, or fetch from the answer cache, a grounded response with sources."""
+        with metrics.span('build_prompt', timings):
+            prompt = self.llm_interface.construct_prompt(question, retrieved_chunks)
+        response, cached = self._generate(prompt, timings, retrieved_chunks, query_embedding)
+        return self._grounded_result(question, retrieved_chunks, prompt, response, cached)
+    
+    def query(self, question: str, top_k: int = None, filters: Dict[str, Any] = None) -> Dict:
+        """Query the RAG system.
+        
+        ``filters`` restricts retrieval to chunks whose metadata matches,
+        e.g. ``{'source': ['docs/a.pdf', 'docs/b.txt']}`` or ``{'tags': 'finance'}``.
+        The result's ``timings`` hold the seconds spent in each stage, and
+        ``cached`` names the answer cache tier that answered, if any.
+        
+        With ``COALESCE_QUERIES``, identical queries arriving while one is
+        in flight share its result and are marked ``coalesced``.
+        """
+        self._check_for_new_snapshot()
         if not self.is_indexed:
             return {
                 'error': 'Knowledge base not built. Please run build_knowledge_base() first.'
             }
         
         top_k = top_k or Config.TOP_K_RETRIEVAL
+        metrics.increment('queries')
+        if not Config.COALESCE_QUERIES:
+            return self._query(question, top_k, filters)
         
-        # Generate query embedding
-        query_embedding = self.embedding_generator.generate_query_embedding(question)
+        result, coalesced = self.single_flight.do(
+            self._flight_key(question, top_k, filters), self._query, question, top_k, filters
+        )
+        if coalesced:
+            metrics.increment('coalesced_queries')
+        result['coalesced'] = coalesced
+        return result
+    
+    def _query(self, question: str, top_k: int, filters: Dict[str, Any] = None) -> Dict:
+        """Retrieve and answer one question."""
+        timings = {}
+        with metrics.span('query', timings):
+            # Retrieve relevant chunks
+            query_embedding, retrieved_chunks = self._retrieve(question, top_k, filters, timings)
+            
+            # Generate grounded response
+            result = self._generate_grounded(question, retrieved_chunks, query_embedding, timings)
+        
+        result['timings'] = timings
+        return result
+    
+    def query_stream(self, question: str, top_k: int = None, filters: Dict[str, Any] = None) -> Iterator[Dict]:
+        """Query the RAG system, streaming the response.
+        
+        Yields a 'sources' event as soon as retrieval finishes, then one
+        'delta' event per chunk of generated text and a final 'done' event
+        carrying the full result. If generation fails part-way, the 'done'
+        event also carries the 'error' and the partial answer is not cached.
+        
+        With ``COALESCE_QUERIES``, identical queries arriving while one is
+        streaming get the events it already produced and then follow it;
+        their 'done' event is marked ``coalesced``.
+        """
+        self._check_for_new_snapshot()
+        if not self.is_indexed:
+            yield {
+                'type': 'error',
+                'error': 'Knowledge base not built. Please run build_knowledge_base() first.'
+            }
+            return
+        
+        top_k = top_k or Config.TOP_K_RETRIEVAL
+        metrics.increment('queries')
+        if not Config.COALESCE_QUERIES:
+            yield from self._query_stream(question, top_k, filters)
+            return
+        
+        events = self.single_flight.stream(
+            self._flight_key(question, top_k, filters), self._query_stream, question, top_k, filters
+        )
+        for event, coalesced in events:
+            if event['type'] == 'done':
+                if coalesced:
+                    metrics.increment('coalesced_queries')
+                event['coalesced'] = coalesced
+            yield event
+    
+    def _query_stream(self, question: str, top_k: int, filters: Dict[str, Any] = None) -> Iterator[Dict]:
+        """Retrieve and stream the answer to one question."""
+        timings = {}
+        start = time.perf_counter()
         
         # Retrieve relevant chunks
-        retrieved_chunks = self.vector_store.search(query_embedding, k=top_k)
+        query_embedding, retrieved_chunks = self._retrieve(question, top_k, filters, timings)
+        yield {'type': 'sources', 'sources': retrieved_chunks}
         
-        # Generate grounded response
-        result = self.llm_interface.generate_grounded_response(question, retrieved_chunks)
+        # Stream grounded response
+        with metrics.span('build_prompt', timings):
+            prompt = self.llm_interface.construct_prompt(question, retrieved_chunks)
         
-        return result
+        cache = self.answer_cache
+        response, cached = None, None
+        status = {}
+        if cache is not None:
+            scope = self._answer_scope(self.llm_interface, prompt, retrieved_chunks, query_embedding)
+            with metrics.span('answer_cache', timings):
+                response, cached = cache.get(**scope)
+        
+        if response is not None:
+            # A cached answer arrives as a single delta
+            yield {'type': 'delta', 'text': response}
+        else:
+            response_parts = []
+            with metrics.span('generate', timings):
+                # Includes the time the consumer takes to handle each delta
+                for text in self.llm_interface.stream_response(prompt, status):
+                    response_parts.append(text)
+                    yield {'type': 'delta', 'text': text}
+            response = ''.join(response_parts).strip()
+            if cache is not None and 'error' not in status and self._is_answer(response):
+                cache.put(response=response, **scope)
+        
+        timings['query'] = time.perf_counter() - start
+        metrics.observe('query_seconds', timings['query'])
+        result = self._grounded_result(question, retrieved_chunks, prompt, response, cached)
+        yield dict(result, type='done', timings=timings, **status)
+    
+    def query_batch(self, questions: List[str], top_k: int = None, max_workers: int = None,
+                    filters: Dict[str, Any] = None) -> List[Dict]:
+        """Query the RAG system with several questions at once.
+        
+        All questions are embedded in one encode call and searched with one
+        index scan; answers are then generated concurrently.
+        """
+        self._check_for_new_snapshot()
+        if not self.is_indexed:
+            return [{
+                'error': 'Knowledge base not built. Please run build_knowledge_base() first.'
+            } for _ in questions]
+        
+        if not questions:
+            return []
+        
+        top_k = top_k or Config.TOP_K_RETRIEVAL
+        max_workers = max_workers or Config.MAX_CONCURRENT_GENERATIONS
+        metrics.increment('queries', len(questions))
+        start = time.perf_counter()
+        batch_timings = {}
+        vector_store = self.vector_store
+        
+        # Generate query embeddings
+        with metrics.span('embed_query', batch_timings):
+            query_embeddings = self.embedding_generator.generate_query_embeddings(questions)
+        
+        # Retrieve relevant chunks for every question
+        with metrics.span('search', batch_timings):
+            retrieved_chunks = vector_store.search_batch(query_embeddings, k=top_k, filters=filters)
+        
+        # Generate grounded responses with bounded concurrency
+        timings = [dict(batch_timings) for _ in questions]
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(questions))) as executor:
+            results = list(executor.map(
+                self._generate_grounded, questions, retrieved_chunks, query_embeddings, timings
+            ))
+        
+        # Embedding and search timings are for the whole batch
+        elapsed = time.perf_counter() - start
+        for result, result_timings in zip(results, timings):
+            result_timings['query'] = elapsed
+            result['timings'] = result_timings
+        return results
     
     def compare_responses(self, question: str) -> Dict:
         """Compare grounded vs ungrounded responses."""
@@ -84,11 +920,64 @@ class RAGPipeline:
         
         # Get ungrounded response (without context)
         ungrounded_prompt = f"Question: {question}\n\nAnswer:"
-        ungrounded_response = self.llm_interface.generate_response(ungrounded_prompt)
+        ungrounded_response, _ = self._generate(ungrounded_prompt)
+        
+        return {
+            'question': question,
+            'grounded_response': grounded_result.get('response', 'Error'),
+            'ungrounded_response': ungrounded_response,
+            'sources': grounded_result.get('sources', [])
+        }
+    
+    async def aquery(self, question: str, top_k: int = None, filters: Dict[str, Any] = None) -> Dict:
+        """Query the RAG system without blocking the event loop; identical concurrent queries are coalesced like in ``query``."""
+        self._check_for_new_snapshot()
+        if not self.is_indexed:
+            return {
+                'error': 'Knowledge base not built. Please run build_knowledge_base() first.'
+            }
+        
+        top_k = top_k or Config.TOP_K_RETRIEVAL
+        metrics.increment('queries')
+        if not Config.COALESCE_QUERIES:
+            return await self._aquery(question, top_k, filters)
+        
+        result, coalesced = await self.single_flight.ado(
+            self._flight_key(question, top_k, filters), self._aquery, question, top_k, filters
+        )
+        if coalesced:
+            metrics.increment('coalesced_queries')
+        result['coalesced'] = coalesced
+        return result
+    
+    async def _aquery(self, question: str, top_k: int, filters: Dict[str, Any] = None) -> Dict:
+        """Retrieve and answer one question asynchronously."""
+        timings = {}
+        with metrics.span('query', timings):
+            # Embedding and search are CPU-bound, keep them off the event loop
+            query_embedding, retrieved_chunks = await asyncio.to_thread(
+                self._retrieve, question, top_k, filters, timings
+            )
+            
+            with metrics.span('build_prompt', timings):
+                prompt = self.async_llm_interface.construct_prompt(question, retrieved_chunks)
+            response, cached = await self._agenerate(prompt, timings, retrieved_chunks, query_embedding)
+            result = self._grounded_result(question, retrieved_chunks, prompt, response, cached)
+        
+        result['timings'] = timings
+        return result
+    
+    async def acompare_responses(self, question: str) -> Dict:
+        """Compare grounded vs ungrounded responses, running both LLM calls concurrently."""
+        ungrounded_prompt = f"Question: {question}\n\nAnswer:"
+        grounded_result, (ungrounded_response, _) = await asyncio.gather(
+            self.aquery(question),
+            self._agenerate(ungrounded_prompt)
+        )
         
         return {
             'question': question,
             'grounded_response': grounded_result.get('response', 'Error'),
             'ungrounded_response': ungrounded_response,
             'sources': grounded_result.get('sources', [])
-        }
\ No newline at end of file
+        }
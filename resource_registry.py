@@ -0,0 +1,76 @@
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+class ResourceRegistry:
+    """Process-wide registry of shared, reference-counted resources.
+
+    ``acquire`` returns the resource stored under a key, creating it with
+    the given factory if nobody holds it yet; concurrent acquirers of the
+    same key wait for a single load instead of each loading their own copy.
+    ``release`` drops a reference, and the last release discards the
+    resource, calling its ``close()`` if it has one unless it was acquired
+    with ``close_on_release=False``; such resources may still be in use by
+    readers that are not holders, and clean up when they are collected.
+    Shared resources must only be read by their holders.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._resources = {}
+        self._refcounts = {}
+        self._close_on_release = {}
+    
+    def acquire(self, key: Hashable, factory: Callable[[], Any], close_on_release: bool = True) -> Any:
+        """Return the shared resource for key, creating it on first acquisition."""
+        while True:
+            with self._lock:
+                key_lock = self._key_locks.setdefault(key, threading.Lock())
+            
+            with key_lock:
+                with self._lock:
+                    if self._key_locks.get(key) is not key_lock:
+                        # Released and dropped while we waited; take the key's current lock
+                        continue
+                    if key in self._resources:
+                        self._refcounts[key] += 1
+                        return self._resources[key]
+                
+                # Load outside the registry lock so other keys are not blocked
+                try:
+                    resource = factory()
+                except BaseException:
+                    with self._lock:
+                        del self._key_locks[key]
+                    raise
+                with self._lock:
+                    self._resources[key] = resource
+                    self._refcounts[key] = 1
+                    self._close_on_release[key] = close_on_release
+                return resource
+    
+    def release(self, key: Hashable):
+        """Drop one reference to key, discarding the resource with the last one."""
+        with self._lock:
+            if key not in self._refcounts:
+                return
+            self._refcounts[key] -= 1
+            if self._refcounts[key] > 0:
+                return
+            del self._refcounts[key]
+            del self._key_locks[key]
+            resource = self._resources.pop(key)
+            if not self._close_on_release.pop(key):
+                return
+        
+        close = getattr(resource, 'close', None)
+        if callable(close):
+            close()
+    
+    def stats(self) -> Dict[Hashable, int]:
+        """Reference count of every live resource."""
+        with self._lock:
+            return dict(self._refcounts)
+
+# Shared by every pipeline in the process that opts in, e.g. all Streamlit sessions
+shared_registry = ResourceRegistry()
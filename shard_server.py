@@ -0,0 +1,20 @@
+import argparse
+import os
+from sharded_store import serve_shard
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve one shard of a sharded vector store to remote pipelines.")
+    parser.add_argument('--host', default='127.0.0.1',
+                        help="Interface to listen on; '0.0.0.0' accepts pipelines on other machines")
+    parser.add_argument('--port', type=int, default=7100, help="Port to listen on")
+    args = parser.parse_args()
+
+    authkey = os.getenv('VECTOR_SHARD_AUTHKEY')
+    if not authkey:
+        parser.error("Set VECTOR_SHARD_AUTHKEY to the secret shared with the pipelines")
+
+    print(f"Serving vector store shard on {args.host}:{args.port}")
+    serve_shard((args.host, args.port), authkey.encode('utf-8'))
+
+if __name__ == "__main__":
+    main()
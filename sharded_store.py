@@ -0,0 +1,491 @@
+import json
+import os
+import threading
+import weakref
+import zlib
+import numpy as np
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Client, Listener
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+from snapshots import copy_store_files, remove_store_files
+from vector_store import VectorStore
+
+class ShardService:
+    """The operations a sharded store runs on one shard, executed where the shard lives."""
+
+    def __init__(self, store_kwargs: Dict = None):
+        self.store_kwargs = store_kwargs or {}
+        self.store = None
+
+    def create(self, embedding_dim: int, store_kwargs: Dict) -> Dict:
+        self.store_kwargs = store_kwargs
+        self.store = VectorStore(embedding_dim, **store_kwargs)
+        return self.stats()
+
+    def stats(self) -> Dict:
+        return {
+            'num_vectors': self.store.num_vectors,
+            'num_chunks': len(self.store.metadata),
+            'num_live': self.store.num_chunks,
+            'is_trained': self.store.is_trained
+        }
+
+    def add_embeddings(self, embeddings: np.ndarray, metadata: List[Dict]) -> int:
+        return self.store.add_embeddings(embeddings, metadata)
+
+    def search_ids(self, query_embeddings: np.ndarray, k: int,
+                   filters: Dict[str, Any] = None) -> Tuple[np.ndarray, np.ndarray]:
+        return self.store.search_ids(query_embeddings, k, filters=filters)
+
+    def chunks(self, ids: List[int]) -> List[Dict]:
+        return [self.store.chunk(idx) for idx in ids]
+
+    def get(self, vector_id: int) -> Optional[Dict]:
+        return self.store.get(vector_id)
+
+    def live_positions(self) -> np.ndarray:
+        return self.store.live_positions()
+
+    def column(self, field: str) -> List:
+        return self.store.metadata.column(field)
+
+    def chunk_sources(self) -> List[List[str]]:
+        return self.store.chunk_sources()
+
+    def reconstruct(self, ids: np.ndarray) -> np.ndarray:
+        return self.store.reconstruct(ids)
+
+    def remove_ids(self, ids: List[int]):
+        self.store.remove_ids(ids)
+
+    def delete(self, sources: List[str]) -> int:
+        return self.store.delete(sources)
+
+    def compact(self) -> int:
+        return self.store.compact()
+
+    def reset(self):
+        self.store.reset()
+
+    def set_search_params(self, ef_search: int = None, nprobe: int = None):
+        self.store.set_search_params(ef_search=ef_search, nprobe=nprobe)
+
+    def save(self, filepath: str):
+        self.store.save(filepath)
+
+    def load(self, filepath: str) -> Dict:
+        self.store = VectorStore(VectorStore.read_settings(filepath)['embedding_dim'], **self.store_kwargs)
+        self.store.load(filepath)
+        return self.stats()
+
+    def copy_files(self, source_path: str, target_path: str):
+        copy_store_files(source_path, target_path)
+
+    def remove_files(self, store_path: str):
+        remove_store_files(store_path)
+
+def serve_shard(address: Tuple[str, int], authkey: bytes, ready=None):
+    """Serve shards over multiprocessing connections until the process is stopped.
+
+    Every client connection is handled on its own thread with its own
+    shard, so a pipeline building a new snapshot never touches the shard a
+    serving pipeline is searching. Requests are ``(method, args, kwargs)``
+    tuples answered with ``('ok', result)`` or ``('error', exception)``.
+    """
+    listener = Listener(address, authkey=authkey)
+    if ready is not None:
+        ready.send(listener.address)
+        ready.close()
+
+    def handle(connection):
+        service = ShardService()
+        with connection:
+            while True:
+                try:
+                    method, args, kwargs = connection.recv()
+                except EOFError:
+                    return
+                try:
+                    if method.startswith('_') or not hasattr(ShardService, method):
+                        raise AttributeError(f"Unknown shard method '{method}'")
+                    connection.send(('ok', getattr(service, method)(*args, **kwargs)))
+                except Exception as e:
+                    connection.send(('error', e))
+
+    while True:
+        threading.Thread(target=handle, args=(listener.accept(),), daemon=True).start()
+
+class LocalShard:
+    """A shard held in this process."""
+
+    def __init__(self, store_kwargs: Dict):
+        self.service = ShardService(store_kwargs)
+
+    def call(self, method: str, *args, **kwargs):
+        return getattr(self.service, method)(*args, **kwargs)
+
+    def close(self):
+        pass
+
+class RemoteShard:
+    """A shard served by ``serve_shard`` in another process, possibly on another machine."""
+
+    def __init__(self, address: Tuple[str, int], authkey: bytes, process=None):
+        self.address = address
+        self.process = process
+        self._connection = Client(address, authkey=authkey)
+        self._lock = threading.Lock()
+
+    def call(self, method: str, *args, **kwargs):
+        with self._lock:
+            self._connection.send((method, args, kwargs))
+            status, result = self._connection.recv()
+        if status == 'error':
+            raise result
+        return result
+
+    def close(self):
+        self._connection.close()
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+
+def parse_address(address: str) -> Tuple[str, int]:
+    """Turn 'host:port' into a connection address."""
+    host, port = address.rsplit(':', 1)
+    return host, int(port)
+
+class RemoteShardFiles:
+    """Copies and deletes the files remote shards save on their own machines, for snapshots."""
+
+    def __init__(self, addresses: List[str], authkey: bytes):
+        if authkey is None:
+            raise ValueError("Connecting to shard servers needs the authkey they were started with")
+        self.addresses = addresses
+        self.authkey = authkey
+
+    def _call_each(self, method: str, *store_paths: str):
+        for shard_number, address in enumerate(self.addresses):
+            shard = RemoteShard(parse_address(address), self.authkey)
+            try:
+                shard.call(method, *(f"{path}.shard{shard_number}" for path in store_paths))
+            finally:
+                shard.close()
+
+    def copy(self, source_path: str, target_path: str):
+        """Copy every shard's files of a saved store to another path, on the shard's machine."""
+        self._call_each('copy_files', source_path, target_path)
+
+    def remove(self, store_path: str):
+        """Delete every shard's files of a saved store, on the shard's machine."""
+        self._call_each('remove_files', store_path)
+
+def spawn_shard_process(authkey: bytes) -> RemoteShard:
+    """Start a shard server process on a free local port and connect to it."""
+    context = mp.get_context('spawn')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=serve_shard, args=(('127.0.0.1', 0), authkey, sender), daemon=True)
+    process.start()
+    sender.close()
+    address = receiver.recv()
+    return RemoteShard(address, authkey, process=process)
+
+def _close_shards(shards: List, executor: ThreadPoolExecutor):
+    for shard in shards:
+        shard.close()
+    executor.shutdown(wait=False)
+
+class ShardedChunks:
+    """Read-only view of the chunks of every shard, in global id order."""
+
+    def __init__(self, store: 'ShardedVectorStore'):
+        self.store = store
+
+    def __len__(self) -> int:
+        return sum(self.store._counts)
+
+    def __getitem__(self, idx: int) -> Dict:
+        shard, local_id = self.store._locate(np.array([int(idx)]))
+        return self.store._shard_chunks(int(shard[0]), [int(local_id[0])])[0]
+
+    def __iter__(self):
+        for shard_number, shard in enumerate(self.store.shards):
+            yield from self.store._shard_chunks(shard_number, list(range(shard.call('stats')['num_chunks'])))
+
+    def column(self, field: str) -> List:
+        columns = self.store._map(lambda shard: shard.call('column', field))
+        return [value for column in columns for value in column]
+
+class ShardedVectorStore:
+    """Vector store partitioned across shards that are searched in parallel.
+
+    Chunks are assigned to shards by a hash of their source, so a document
+    lives in one shard. Each shard is a ``VectorStore`` held in this process
+    (searched on a thread pool; FAISS releases the GIL), in local worker
+    processes (``processes=True``), or in ``shard_server.py`` workers on
+    other machines (``addresses``). A search scatters the queries to every
+    shard and merges the per-shard top k into the global top k; scores are
+    directly comparable because every shard uses the same metric.
+
+    Global ids number the chunks of shard 0 first, then shard 1 and so
+    on, so they shift when chunks are added to or removed from a shard.
+    Stable vector ids are the shard's vector id times the number of
+    shards plus the shard number. Duplicate chunks are only merged within
+    a shard.
+    """
+
+    def __init__(self, embedding_dim: int, num_shards: int = 2, processes: bool = False,
+                 addresses: List[str] = None, authkey: bytes = None, **store_kwargs):
+        if addresses:
+            num_shards = len(addresses)
+        if num_shards < 1:
+            raise ValueError("A sharded vector store needs at least one shard")
+        if addresses and authkey is None:
+            raise ValueError("Connecting to shard servers needs the authkey they were started with")
+
+        self.embedding_dim = embedding_dim
+        self.num_shards = num_shards
+        self.store_kwargs = store_kwargs
+        self.authkey = authkey or os.urandom(16)
+
+        if addresses:
+            self.shards = [RemoteShard(parse_address(address), self.authkey) for address in addresses]
+        elif processes:
+            self.shards = [spawn_shard_process(self.authkey) for _ in range(num_shards)]
+        else:
+            self.shards = [LocalShard(store_kwargs) for _ in range(num_shards)]
+
+        self._executor = ThreadPoolExecutor(max_workers=num_shards, thread_name_prefix='shard')
+        self._finalizer = weakref.finalize(self, _close_shards, self.shards, self._executor)
+        self._update_stats(self._map(lambda shard: shard.call('create', embedding_dim, store_kwargs)))
+        self.metadata = ShardedChunks(self)
+
+    def close(self):
+        """Disconnect from the shards, stopping any worker processes this store started."""
+        self._finalizer()
+
+    def _map(self, func, items: Iterable = None) -> List:
+        """Run func on every shard (or every item) in parallel, returning results in shard order."""
+        return list(self._executor.map(func, self.shards if items is None else items))
+
+    def _update_stats(self, stats: List[Dict]):
+        self._counts = [shard_stats['num_chunks'] for shard_stats in stats]
+        self._num_live = sum(shard_stats['num_live'] for shard_stats in stats)
+        self._num_vectors = sum(shard_stats['num_vectors'] for shard_stats in stats)
+        self._is_trained = all(shard_stats['is_trained'] for shard_stats in stats)
+
+    def _refresh_stats(self):
+        self._update_stats(self._map(lambda shard: shard.call('stats')))
+
+    def _offsets(self) -> np.ndarray:
+        return np.concatenate([[0], np.cumsum(self._counts)]).astype('int64')
+
+    def _locate(self, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Split global ids into shard numbers and ids within the shard."""
+        offsets = self._offsets()
+        shards = np.searchsorted(offsets, ids, side='right') - 1
+        return shards, ids - offsets[shards]
+
+    def _group(self, ids: np.ndarray) -> Dict[int, Tuple[np.ndarray, np.ndarray]]:
+        """Group global ids by shard: shard -> (positions in ids, ids within the shard)."""
+        ids = np.asarray(ids, dtype='int64')
+        shards, local_ids = self._locate(ids)
+        return {
+            int(shard): (np.flatnonzero(shards == shard), local_ids[shards == shard])
+            for shard in np.unique(shards)
+        }
+
+    @property
+    def num_vectors(self) -> int:
+        return self._num_vectors
+
+    @property
+    def is_trained(self) -> bool:
+        return self._is_trained
+
+    @property
+    def num_chunks(self) -> int:
+        return self._num_live
+
+    @property
+    def dead_ratio(self) -> float:
+        num_stored = sum(self._counts)
+        return 1 - self._num_live / num_stored if num_stored else 0.0
+
+    def live_positions(self) -> np.ndarray:
+        """Global ids of the chunks that have not been deleted."""
+        offsets = self._offsets()
+        return np.concatenate([
+            positions + offsets[shard]
+            for shard, positions in enumerate(self._map(lambda shard: shard.call('live_positions')))
+        ]).astype('int64')
+
+    def chunk_sources(self) -> List[List[str]]:
+        """The sources every chunk stands for, in global id order."""
+        return [sources for shard_sources in self._map(lambda shard: shard.call('chunk_sources'))
+                for sources in shard_sources]
+
+    def shard_of(self, source: str) -> int:
+        """The shard holding a source's chunks."""
+        return zlib.crc32(source.encode('utf-8')) % self.num_shards
+
+    def add_embeddings(self, embeddings: np.ndarray, metadata: List[Dict]) -> int:
+        """Add embeddings to the shards of their sources, returning the number of vectors added."""
+        embeddings = np.asarray(embeddings)
+        assignments = np.array([self.shard_of(chunk['source']) for chunk in metadata], dtype='int64')
+
+        def add(shard_number: int) -> int:
+            positions = np.flatnonzero(assignments == shard_number)
+            if len(positions) == 0:
+                return 0
+            return self.shards[shard_number].call(
+                'add_embeddings', embeddings[positions], [metadata[position] for position in positions]
+            )
+
+        num_added = sum(self._map(add, range(self.num_shards)))
+        self._refresh_stats()
+        return num_added
+
+    def remove_ids(self, ids: List[int]):
+        """Remove chunks by global id; later ids shift down."""
+        if len(ids) == 0:
+            return
+        groups = self._group(np.unique(np.asarray(ids, dtype='int64')))
+        self._map(lambda item: self.shards[item[0]].call('remove_ids', item[1][1].tolist()), groups.items())
+        self._refresh_stats()
+
+    def delete(self, sources: Union[str, Iterable[str]]) -> int:
+        """Tombstone the chunks of one or more sources in their shards, returning the number deleted."""
+        sources = {sources} if isinstance(sources, str) else set(sources)
+        by_shard = {}
+        for source in sources:
+            by_shard.setdefault(self.shard_of(source), []).append(source)
+        deleted = sum(self._map(lambda item: self.shards[item[0]].call('delete', item[1]), by_shard.items()))
+        self._refresh_stats()
+        return deleted
+
+    def upsert(self, embeddings: np.ndarray, metadata: List[Dict]) -> int:
+        """Replace all chunks of the sources in metadata, returning the number of vectors added."""
+        self.delete({chunk['source'] for chunk in metadata})
+        return self.add_embeddings(embeddings, metadata)
+
+    def compact(self) -> int:
+        """Physically remove deleted chunks from every shard, returning how many were removed."""
+        removed = sum(self._map(lambda shard: shard.call('compact')))
+        self._refresh_stats()
+        return removed
+
+    def get(self, vector_id: int) -> Optional[Dict]:
+        """The chunk with a vector id, or None if it was deleted."""
+        shard_number = int(vector_id) % self.num_shards
+        chunk = self.shards[shard_number].call('get', int(vector_id) // self.num_shards)
+        if chunk is not None:
+            chunk['vector_id'] = int(vector_id)
+        return chunk
+
+    def reset(self):
+        """Remove all embeddings and metadata from every shard."""
+        self._map(lambda shard: shard.call('reset'))
+        self._refresh_stats()
+
+    def reconstruct(self, ids: np.ndarray) -> np.ndarray:
+        """Return the stored normalized vectors for the given global ids."""
+        ids = np.asarray(ids, dtype='int64')
+        vectors = np.empty((len(ids), self.embedding_dim), dtype='float32')
+        groups = self._group(ids)
+        results = self._map(lambda item: self.shards[item[0]].call('reconstruct', item[1][1]), groups.items())
+        for (positions, _), shard_vectors in zip(groups.values(), results):
+            vectors[positions] = shard_vectors
+        return vectors
+
+    def set_search_params(self, ef_search: int = None, nprobe: int = None):
+        """Change the query-time knobs of every shard."""
+        self._map(lambda shard: shard.call('set_search_params', ef_search=ef_search, nprobe=nprobe))
+
+    def search_ids(self, query_embeddings: np.ndarray, k: int = 5,
+                   filters: Dict[str, Any] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Search every shard in parallel and merge their top k into global scores and ids."""
+        query_embeddings = np.asarray(query_embeddings, dtype='float32')
+        results = self._map(lambda shard: shard.call('search_ids', query_embeddings, k, filters))
+        offsets = self._offsets()
+
+        scores = np.hstack([shard_scores for shard_scores, _ in results])
+        ids = np.hstack([
+            np.where(shard_ids >= 0, shard_ids + offsets[shard], -1)
+            for shard, (_, shard_ids) in enumerate(results)
+        ])
+        scores = np.where(ids >= 0, scores, -np.inf)
+        top = np.argsort(-scores, axis=1, kind='stable')[:, :k]
+        return np.take_along_axis(scores, top, axis=1), np.take_along_axis(ids, top, axis=1)
+
+    def search(self, query_embedding: np.ndarray, k: int = 5, filters: Dict[str, Any] = None) -> List[Dict]:
+        """Search for similar embeddings."""
+        return self.search_batch(query_embedding.reshape(1, -1), k=k, filters=filters)[0]
+
+    def _shard_chunks(self, shard_number: int, local_ids: List[int]) -> List[Dict]:
+        """Chunks of one shard by local position, with their global vector ids."""
+        chunks = self.shards[shard_number].call('chunks', local_ids)
+        for chunk in chunks:
+            chunk['vector_id'] = chunk['vector_id'] * self.num_shards + shard_number
+        return chunks
+
+    def search_batch(self, query_embeddings: np.ndarray, k: int = 5,
+                     filters: Dict[str, Any] = None) -> List[List[Dict]]:
+        """Search for several queries, fetching each result's chunk from its shard."""
+        scores, ids = self.search_ids(query_embeddings, k, filters=filters)
+
+        valid = ids >= 0
+        groups = self._group(ids[valid])
+        chunks = np.empty(int(valid.sum()), dtype=object)
+        results = self._map(lambda item: self._shard_chunks(item[0], item[1][1].tolist()), groups.items())
+        for (shard_number, (positions, _)), shard_chunks in zip(groups.items(), results):
+            for position, chunk in zip(positions, shard_chunks):
+                chunks[position] = chunk
+
+        all_results = []
+        position = 0
+        for query_scores, query_valid in zip(scores, valid):
+            results = []
+            for i, score in enumerate(query_scores[query_valid]):
+                result = chunks[position]
+                position += 1
+                result['similarity_score'] = float(score)
+                result['rank'] = i + 1
+                results.append(result)
+            all_results.append(results)
+        return all_results
+
+    def _shard_path(self, filepath: str, shard_number: int) -> str:
+        return f"{filepath}.shard{shard_number}"
+
+    def save(self, filepath: str):
+        """Save every shard next to filepath in parallel, then the shard layout.
+
+        Remote shards save on their own machine, under the same path;
+        ``RemoteShardFiles`` copies and deletes them there for snapshots.
+        """
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        self._map(lambda shard_number: self.shards[shard_number].call('save', self._shard_path(filepath, shard_number)),
+                  range(self.num_shards))
+
+        # Written last, like an unsharded store's settings
+        with open(f"{filepath}.metadata", 'w', encoding='utf-8') as f:
+            json.dump({
+                'embedding_dim': self.embedding_dim,
+                'num_shards': self.num_shards,
+                'num_chunks': self._counts
+            }, f)
+
+    def load(self, filepath: str):
+        """Load every shard in parallel."""
+        settings = VectorStore.read_settings(filepath)
+        if settings.get('num_shards') != self.num_shards:
+            raise ValueError(
+                f"{filepath} has {settings.get('num_shards')} shards, this store has {self.num_shards}"
+            )
+        self.embedding_dim = settings['embedding_dim']
+        self._update_stats(self._map(
+            lambda shard_number: self.shards[shard_number].call('load', self._shard_path(filepath, shard_number)),
+            range(self.num_shards)
+        ))
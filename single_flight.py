@@ -0,0 +1,194 @@
+import asyncio
+import copy
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterator, Tuple
+
+class _Flight:
+    """One in-flight call and the number of callers sharing it."""
+
+    def __init__(self, future):
+        self.future = future
+        self.callers = 1
+        self.waiting = 0
+
+class _Stream:
+    """One in-flight iteration, the items it produced so far and the callers following it."""
+
+    def __init__(self, lock, func, args):
+        self.func = func
+        self.args = args
+        self.iterator = None
+        self.items = []
+        self.done = False
+        self.error = None
+        self.pulling = False  # a caller is fetching the next item
+        self.callers = 1
+        self.following = 0
+        self.condition = threading.Condition(lock)
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one execution.
+
+    The first caller of a key runs the call; callers arriving while it is
+    in flight wait for it and get its result, or its exception. Results
+    handed to more than one caller are deep-copied so callers cannot see
+    each other's changes. Nothing is cached: a call arriving after the
+    flight finished runs again.
+
+    Threads use ``do``, or ``stream`` for iterators, and asyncio callers
+    ``ado``; asyncio flights are
+    per event loop. The shared coroutine runs in its own task, so a
+    cancelled caller does not cancel it for the others; it is only
+    cancelled when every caller waiting for it has been cancelled. Likewise
+    a shared stream is only closed when every caller stopped iterating it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}  # key -> _Flight of threaded calls
+        self._tasks = {}  # (event loop, key) -> _Flight of asyncio calls
+        self._streams = {}  # key -> _Stream of threaded iterations
+
+    def do(self, key: Hashable, func: Callable, *args) -> Tuple[Any, bool]:
+        """Run func(*args) unless the same key is in flight, returning the result and whether it was shared."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight(Future())
+            else:
+                flight.callers += 1
+        if not leader:
+            return copy.deepcopy(flight.future.result()), True
+
+        try:
+            result = func(*args)
+        except BaseException as e:
+            with self._lock:
+                del self._flights[key]
+            flight.future.set_exception(e)
+            raise
+        with self._lock:
+            del self._flights[key]
+            shared = flight.callers > 1
+        flight.future.set_result(result)
+        return (copy.deepcopy(result) if shared else result), False
+
+    async def ado(self, key: Hashable, coroutine_func: Callable[..., Awaitable], *args) -> Tuple[Any, bool]:
+        """Await coroutine_func(*args) unless the same key is in flight on this event loop.
+
+        Returns the result and whether it came from a call started by another caller.
+        """
+        loop = asyncio.get_running_loop()
+        task_key = (loop, key)
+        with self._lock:
+            flight = self._tasks.get(task_key)
+            leader = flight is None
+            if leader:
+                flight = self._tasks[task_key] = _Flight(loop.create_task(coroutine_func(*args)))
+                # Registered before any caller awaits, so the flight is gone when they resume
+                flight.future.add_done_callback(lambda _: self._finish(task_key, flight))
+            else:
+                flight.callers += 1
+            flight.waiting += 1
+
+        try:
+            result = await asyncio.shield(flight.future)
+        except asyncio.CancelledError:
+            with self._lock:
+                flight.waiting -= 1
+                abandoned = flight.waiting == 0 and not flight.future.done()
+                if abandoned:
+                    # Later callers start a new flight instead of joining a cancelled one
+                    self._remove(task_key, flight)
+            if abandoned:
+                flight.future.cancel()
+            raise
+        return (copy.deepcopy(result) if flight.callers > 1 else result), not leader
+
+    def stream(self, key: Hashable, func: Callable[..., Iterator], *args) -> Iterator[Tuple[Any, bool]]:
+        """Iterate func(*args) unless the same key is in flight, yielding each item and whether it was shared.
+
+        Callers joining a stream in flight first get the items it already
+        produced, then follow it. Whichever caller needs the next item
+        fetches it for everyone, so a caller that stops iterating does not
+        stall the others. Every item is deep-copied, as callers may still
+        join after it was handed out.
+        """
+        with self._lock:
+            flight = self._streams.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._streams[key] = _Stream(self._lock, func, args)
+            else:
+                flight.callers += 1
+            flight.following += 1
+
+        position = 0
+        try:
+            while True:
+                with self._lock:
+                    while position == len(flight.items) and not flight.done and flight.pulling:
+                        flight.condition.wait()
+                    pull = position == len(flight.items)
+                    if not pull:
+                        item = flight.items[position]
+                    elif not flight.done:
+                        flight.pulling = True
+                    elif flight.error is not None:
+                        raise flight.error
+                    else:
+                        return
+
+                if not pull:
+                    position += 1
+                    yield copy.deepcopy(item), not leader
+                    continue
+
+                try:
+                    if flight.iterator is None:
+                        flight.iterator = iter(flight.func(*flight.args))
+                    item = next(flight.iterator)
+                except StopIteration:
+                    self._end_stream(key, flight)
+                except BaseException as e:
+                    self._end_stream(key, flight, e)
+                else:
+                    with self._lock:
+                        flight.items.append(item)
+                        flight.pulling = False
+                        flight.condition.notify_all()
+        finally:
+            with self._lock:
+                flight.following -= 1
+                abandoned = flight.following == 0 and not flight.done
+                if abandoned:
+                    # Later callers start a new stream instead of joining a closed one
+                    flight.done = True
+                    if self._streams.get(key) is flight:
+                        del self._streams[key]
+            if abandoned and hasattr(flight.iterator, 'close'):
+                flight.iterator.close()
+
+    def _end_stream(self, key: Hashable, flight: _Stream, error: BaseException = None):
+        with self._lock:
+            if self._streams.get(key) is flight:
+                del self._streams[key]
+            flight.done = True
+            flight.error = error
+            flight.pulling = False
+            flight.condition.notify_all()
+
+    def _finish(self, task_key: Tuple, flight: _Flight):
+        with self._lock:
+            self._remove(task_key, flight)
+
+    def _remove(self, task_key: Tuple, flight: _Flight):
+        if self._tasks.get(task_key) is flight:
+            del self._tasks[task_key]
+
+    def in_flight(self) -> Dict[str, int]:
+        """Number of keys currently in flight, for threads (calls and streams) and asyncio."""
+        with self._lock:
+            return {'threads': len(self._flights) + len(self._streams), 'asyncio': len(self._tasks)}
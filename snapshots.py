@@ -0,0 +1,266 @@
+import json
+import os
+import shutil
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+# File prefix of a vector store inside a snapshot directory
+STORE_NAME = 'vector_store'
+
+# Written last into a snapshot directory, marking the snapshot complete
+INFO_FILE = 'snapshot.json'
+
+# Names the published snapshot; replaced atomically
+CURRENT_FILE = 'CURRENT'
+
+# Locked by the process building or compacting snapshots
+LOCK_FILE = 'build.lock'
+
+# Process building a pending snapshot, touched while it is being built
+OWNER_FILE = 'owner.json'
+
+def copy_store_files(source_path: str, target_path: str):
+    """Copy the files of a saved store to another path prefix, without temporary files and checkpoints."""
+    source_dir, source_name = os.path.split(source_path)
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    for name in os.listdir(source_dir or '.'):
+        if not name.startswith(f"{source_name}.") or name.endswith(('.tmp', '.checkpoint.json')):
+            continue
+        shutil.copy2(os.path.join(source_dir, name), target_path + name[len(source_name):])
+
+def remove_store_files(store_path: str):
+    """Delete the files of a saved store, and its directory once it is empty."""
+    directory, name = os.path.split(store_path)
+    if not os.path.isdir(directory or '.'):
+        return
+    for file_name in os.listdir(directory or '.'):
+        if file_name.startswith(f"{name}."):
+            os.remove(os.path.join(directory, file_name))
+    if directory and not os.listdir(directory):
+        os.rmdir(directory)
+
+class SnapshotManager:
+    """Versioned knowledge base snapshots under one directory.
+
+    Every build writes a new directory under ``snapshots/`` and marks it
+    complete by writing its ``snapshot.json`` last. Published snapshots are
+    never modified again, so readers can keep using an old one while a new
+    one is built. The ``CURRENT`` file names the published version and is
+    swapped with an atomic rename, so a crash leaves either the old or the
+    new version published, never a mismatched index and metadata pair.
+    Older complete snapshots are kept for rollback.
+
+    Only one process at a time builds snapshots, holding ``build_lock``.
+    A pending snapshot records the process building it, which renews its
+    lease while it works; ``abandoned`` only returns pending snapshots
+    whose owner has exited or stopped renewing for ``lease`` seconds.
+
+    Shards served from other machines keep their files there;
+    ``remote_shards`` (a ``sharded_store.RemoteShardFiles``) copies and
+    deletes them along with the snapshots.
+    """
+
+    def __init__(self, root: str, lease: float = 600.0, remote_shards=None):
+        self.root = root
+        self.snapshots_dir = os.path.join(root, 'snapshots')
+        self.lease = lease
+        self.remote_shards = remote_shards
+
+    @contextmanager
+    def build_lock(self):
+        """Hold the lock that makes builds exclusive across pipelines and processes.
+
+        The operating system releases it when the holder exits, so a
+        crashed build never leaves it locked.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, LOCK_FILE), 'a+b') as f:
+            if os.name == 'nt':
+                import msvcrt
+                f.seek(0)
+                waiting = False
+                while True:
+                    try:
+                        # Retries for about 10 seconds before giving up
+                        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        if not waiting:
+                            print("Waiting for another knowledge base build to finish...")
+                            waiting = True
+                try:
+                    yield
+                finally:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                try:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    print("Waiting for another knowledge base build to finish...")
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def store_path(self, version: str) -> str:
+        """Vector store path prefix inside a snapshot."""
+        return os.path.join(self.snapshots_dir, version, STORE_NAME)
+
+    def current(self) -> Optional[str]:
+        """The published version, or None before the first published build."""
+        try:
+            with open(os.path.join(self.root, CURRENT_FILE), 'r', encoding='utf-8') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _list(self) -> List[str]:
+        if not os.path.isdir(self.snapshots_dir):
+            return []
+        return sorted(name for name in os.listdir(self.snapshots_dir)
+                      if os.path.isdir(os.path.join(self.snapshots_dir, name)))
+
+    def versions(self) -> List[str]:
+        """Complete snapshots, oldest first."""
+        return [version for version in self._list() if os.path.exists(self._info_path(version))]
+
+    def pending(self) -> List[str]:
+        """Snapshots whose build has not completed, oldest first."""
+        return [version for version in self._list() if not os.path.exists(self._info_path(version))]
+
+    def _owner_path(self, version: str) -> str:
+        return os.path.join(self.snapshots_dir, version, OWNER_FILE)
+
+    def _write_owner(self, version: str):
+        with open(self._owner_path(version), 'w', encoding='utf-8') as f:
+            json.dump({'host': socket.gethostname(), 'pid': os.getpid()}, f)
+
+    @staticmethod
+    def _process_exists(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def is_abandoned(self, version: str) -> bool:
+        """Whether a pending snapshot's build is no longer running.
+
+        An owner on this host is checked directly (except on Windows, where
+        signalling a process would end it); otherwise the build is
+        abandoned once its lease has not been renewed for ``lease`` seconds.
+        """
+        path = self._owner_path(version)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                owner = json.load(f)
+            renewed = os.path.getmtime(path)
+        except (OSError, ValueError):
+            # Snapshots created before owners were recorded
+            owner = {}
+            renewed = os.path.getmtime(os.path.join(self.snapshots_dir, version))
+        if owner.get('host') == socket.gethostname() and os.name != 'nt':
+            return owner['pid'] == os.getpid() or not self._process_exists(owner['pid'])
+        return time.time() - renewed > self.lease
+
+    def abandoned(self) -> List[str]:
+        """Pending snapshots whose build is no longer running, oldest first; call holding ``build_lock``."""
+        return [version for version in self.pending() if self.is_abandoned(version)]
+
+    @contextmanager
+    def owned(self, version: str):
+        """Record this process as the builder of a pending snapshot, renewing its lease until the block exits."""
+        self._write_owner(version)
+        stop = threading.Event()
+
+        def renew():
+            while not stop.wait(self.lease / 4):
+                try:
+                    os.utime(self._owner_path(version))
+                except OSError:
+                    return
+
+        threading.Thread(target=renew, daemon=True).start()
+        try:
+            yield
+        finally:
+            stop.set()
+
+    def _info_path(self, version: str) -> str:
+        return os.path.join(self.snapshots_dir, version, INFO_FILE)
+
+    def info(self, version: str) -> Dict:
+        """What was recorded when the snapshot was completed."""
+        with open(self._info_path(version), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def create(self, base_store_path: str = None) -> str:
+        """Create a new snapshot directory, optionally starting from a copy of an existing store."""
+        version = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+        directory = os.path.join(self.snapshots_dir, version)
+        os.makedirs(directory)
+        self._write_owner(version)
+
+        if base_store_path is not None:
+            # Copied, not linked: builds append to the store files in place
+            copy_store_files(base_store_path, self.store_path(version))
+            if self.remote_shards is not None:
+                self.remote_shards.copy(base_store_path, self.store_path(version))
+        return version
+
+    def complete(self, version: str, info: Dict):
+        """Mark a snapshot's build complete."""
+        info = dict(info, version=version, completed_at=datetime.now(timezone.utc).isoformat())
+        tmp_path = f"{self._info_path(version)}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(info, f)
+        os.replace(tmp_path, self._info_path(version))
+        try:
+            os.remove(self._owner_path(version))
+        except FileNotFoundError:
+            pass
+
+    def publish(self, version: str):
+        """Atomically make a complete snapshot the current one."""
+        if not os.path.exists(self._info_path(version)):
+            raise ValueError(f"Snapshot {version} is not complete and cannot be published")
+        tmp_path = os.path.join(self.root, f"{CURRENT_FILE}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(version)
+        os.replace(tmp_path, os.path.join(self.root, CURRENT_FILE))
+
+    def previous(self) -> Optional[str]:
+        """The newest complete snapshot older than the current one."""
+        current = self.current()
+        older = [version for version in self.versions() if current is None or version < current]
+        return older[-1] if older else None
+
+    def discard(self, version: str):
+        """Delete a snapshot directory, and the files of its remote shards."""
+        if self.remote_shards is not None:
+            try:
+                self.remote_shards.remove(self.store_path(version))
+            except (OSError, EOFError) as e:
+                print(f"Could not delete the remote shards of snapshot {version}: {e}")
+        shutil.rmtree(os.path.join(self.snapshots_dir, version), ignore_errors=True)
+
+    def prune(self, keep: int):
+        """Delete all but the newest keep complete snapshots, never the current one.
+
+        Pipelines still reading a deleted snapshot keep working on POSIX
+        systems, where open and memory-mapped files outlive their names;
+        elsewhere the deletion is retried by a later prune.
+        """
+        current = self.current()
+        for version in self.versions()[:-keep] if keep > 0 else self.versions():
+            if version != current:
+                self.discard(version)
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+import answer_cache
+from answer_cache import AnswerCache
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(answer_cache.time, 'time', clock.time)
+    return clock
+
+@pytest.fixture
+def make_cache(tmp_path):
+    caches = []
+    def make_cache(**options):
+        caches.append(AnswerCache(str(tmp_path / 'cache' / 'answers.db'), **options))
+        return caches[-1]
+    yield make_cache
+    for cache in caches:
+        cache.close()
+
+def test_exact_hits_are_scoped_to_the_knowledge_base_version(make_cache):
+    cache = make_cache()
+    key = AnswerCache.make_key('model', 0.1, "prompt")
+    cache.put(key, "answer", kb_version='v1')
+
+    assert cache.get(key, kb_version='v1') == ("answer", 'exact')
+    assert cache.get(key, kb_version='v2') == (None, None)
+    assert cache.get(AnswerCache.make_key('model', 0.2, "prompt"), kb_version='v1') == (None, None)
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 2
+
+def test_answers_persist_across_instances(make_cache):
+    make_cache().put('key', "answer")
+    assert make_cache().get('key') == ("answer", 'exact')
+
+def test_entries_expire_after_the_ttl(make_cache, clock):
+    cache = make_cache(ttl=60)
+    cache.put('key', "answer")
+    clock.now += 59
+    assert cache.get('key') == ("answer", 'exact')
+
+    clock.now += 2
+    assert cache.get('key') == (None, None)
+    cache.invalidate(None)
+    assert len(cache) == 0
+
+def test_least_recently_used_entries_are_evicted(make_cache, clock):
+    cache = make_cache(max_entries=2)
+    cache.EVICT_EVERY = 1
+    for key in ('a', 'b'):
+        clock.now += 1
+        cache.put(key, key)
+    clock.now += 1
+    assert cache.get('a') == ('a', 'exact')
+
+    clock.now += 1
+    cache.put('c', 'c')
+    assert len(cache) == 2
+    assert cache.get('b') == (None, None)
+    assert cache.get('a') == ('a', 'exact') and cache.get('c') == ('c', 'exact')
+
+def test_invalidate_keeps_the_current_version_and_ungrounded_answers(make_cache):
+    cache = make_cache()
+    cache.put('old', "old", kb_version='v1')
+    cache.put('current', "current", kb_version='v2')
+    cache.put('ungrounded', "ungrounded")
+
+    cache.invalidate('v2')
+    assert len(cache) == 2
+    assert cache.get('old', kb_version='v1') == (None, None)
+    assert cache.get('current', kb_version='v2') == ("current", 'exact')
+    assert cache.get('ungrounded') == ("ungrounded", 'exact')
+
+    cache.invalidate(None)
+    assert len(cache) == 1
+
+def test_semantic_tier_needs_the_same_retrieval_and_a_close_question(make_cache):
+    cache = make_cache(semantic_threshold=0.9)
+    retrieval_key = AnswerCache.make_retrieval_key('model', 0.1, 'v1', [1, 2])
+    cache.put('key', "answer", kb_version='v1', retrieval_key=retrieval_key, embedding=np.array([1.0, 0.0]))
+
+    assert cache.get('other', kb_version='v1', retrieval_key=retrieval_key,
+                     embedding=np.array([1.0, 0.1])) == ("answer", 'semantic')
+    assert cache.get('other', kb_version='v1', retrieval_key=retrieval_key,
+                     embedding=np.array([0.0, 1.0])) == (None, None)
+    other_retrieval = AnswerCache.make_retrieval_key('model', 0.1, 'v1', [2, 1])
+    assert cache.get('other', kb_version='v1', retrieval_key=other_retrieval,
+                     embedding=np.array([1.0, 0.0])) == (None, None)
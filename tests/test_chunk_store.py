@@ -0,0 +1,100 @@
+import os
+import pytest
+import chunk_store
+from chunk_store import ChunkStore
+
+def make_chunk(number, **extra):
+    return dict({'content': f"Chunk number {number} ünïcode", 'source': f"doc{number % 2}.txt",
+                 'title': f"Doc {number % 2}", 'chunk_id': number}, **extra)
+
+@pytest.fixture
+def store_path(tmp_path):
+    return str(tmp_path / 'vector_store')
+
+def saved_store(store_path, chunks):
+    store = ChunkStore()
+    store.extend(chunks)
+    store.save(store_path)
+    return store
+
+def chunk_files(store_path):
+    directory, prefix = os.path.split(f"{store_path}.chunks.")
+    return sorted(name for name in os.listdir(directory) if name.startswith(prefix))
+
+def test_chunks_round_trip_with_extra_fields(store_path):
+    chunks = [make_chunk(0), make_chunk(1, tags=['a', 'b']), make_chunk(2, page=3)]
+    saved_store(store_path, chunks)
+
+    store = ChunkStore()
+    store.load(store_path)
+    assert list(store) == chunks and store[-1] == chunks[-1]
+    assert store.column('source') == ['doc0.txt', 'doc1.txt', 'doc0.txt']
+    assert store.column('tags') == [None, ['a', 'b'], None]
+
+def test_saves_after_a_load_append_and_patch_rows(store_path):
+    store = saved_store(store_path, [make_chunk(0), make_chunk(1)])
+    text_path = f"{store_path}.chunks.text"
+    text_size = os.path.getsize(text_path)
+
+    store.update(0, {'content': "Rewritten", 'tags': ['new']})
+    store.extend([make_chunk(2, source='doc9.txt')])
+    store.save(store_path)
+
+    reloaded = ChunkStore()
+    reloaded.load(store_path)
+    assert reloaded[0] == dict(make_chunk(0), content="Rewritten", tags=['new'])
+    assert reloaded[1] == make_chunk(1)
+    assert reloaded[2] == make_chunk(2, source='doc9.txt')
+    # Appended past the old text instead of rewriting it
+    assert os.path.getsize(text_path) > text_size
+
+def test_deletes_rewrite_the_store(store_path):
+    store = saved_store(store_path, [make_chunk(number) for number in range(4)])
+    store.delete([1, 2])
+    store.save(store_path)
+
+    reloaded = ChunkStore()
+    reloaded.load(store_path)
+    assert list(reloaded) == [make_chunk(0), make_chunk(3)]
+    assert not os.path.exists(f"{store_path}.chunks.text")
+
+@pytest.mark.parametrize('append', [False, True])
+def test_interrupted_saves_leave_the_previous_store(store_path, monkeypatch, append):
+    saved = [make_chunk(0), make_chunk(1)]
+    store = saved_store(store_path, saved)
+    kept = saved if append else saved[:1]
+    if not append:
+        store.delete([1])
+    store.extend([make_chunk(2)])
+
+    # Crash before the new header replaces the old one
+    def crash(source, target):
+        raise OSError("crashed")
+    replace = os.replace
+    monkeypatch.setattr(chunk_store.os, 'replace', crash)
+    with pytest.raises(OSError):
+        store.save(store_path)
+    monkeypatch.setattr(chunk_store.os, 'replace', replace)
+
+    reloaded = ChunkStore()
+    reloaded.load(store_path)
+    assert list(reloaded) == saved
+
+    # The next save completes and drops the files of the interrupted one
+    store.save(store_path)
+    reloaded.load(store_path)
+    assert list(reloaded) == kept + [make_chunk(2)]
+    header = ChunkStore._read_header(store_path)
+    assert set(chunk_files(store_path)) == {
+        os.path.basename(path) for path in ChunkStore()._paths(
+            store_path, header['generation'], header['text_generation']).values()
+    }
+
+def test_load_rejects_incomplete_stores(store_path):
+    saved_store(store_path, [make_chunk(0), make_chunk(1)])
+    with open(f"{store_path}.chunks.text", 'r+b') as f:
+        f.truncate(10)
+    with pytest.raises(ValueError, match="truncated"):
+        ChunkStore().load(store_path)
+    with pytest.raises(FileNotFoundError):
+        ChunkStore().load(f"{store_path}.missing")
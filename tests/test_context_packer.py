@@ -0,0 +1,61 @@
+import sys
+import pytest
+from context_packer import MIN_PARTIAL_TOKENS, ContextPacker, strip_overlap, tiktoken_counter
+
+def count_words(text):
+    return len(text.split())
+
+def format_passage(position, passage):
+    return f"[{position}] {passage['content']}"
+
+def words(start, stop):
+    return ' '.join(f"w{i}" for i in range(start, stop))
+
+def chunk(source, chunk_id, content, score):
+    return {'source': source, 'title': source, 'chunk_id': chunk_id, 'content': content, 'similarity_score': score}
+
+def packed_tokens(packed):
+    return sum(count_words(format_passage(position, passage)) for position, passage in enumerate(packed, 1))
+
+def test_strip_overlap_needs_enough_repeated_words():
+    assert strip_overlap(words(0, 10), words(6, 15)) == words(10, 15)
+    assert strip_overlap(words(0, 10), words(0, 5)) == words(0, 5)
+    # Two shared words are a coincidence
+    assert strip_overlap("a b c x y", "x y z") == "x y z"
+
+def test_adjacent_chunks_merge_into_passages_in_score_order():
+    chunks = [chunk('a', 1, words(6, 20), 0.5), chunk('b', 0, words(100, 110), 0.7),
+              chunk('a', 0, words(0, 10), 0.9), chunk('a', 3, words(30, 40), 0.8)]
+    passages = ContextPacker(1000, count_words).merge_adjacent(chunks)
+
+    assert [(passage['source'], passage['chunk_ids']) for passage in passages] == [('a', [0, 1]), ('a', [3]), ('b', [0])]
+    assert passages[0]['content'] == words(0, 20)
+    assert passages[0]['similarity_score'] == 0.9
+
+def test_zero_budget_packs_nothing():
+    assert ContextPacker(0, count_words).pack([chunk('a', 0, words(0, 10), 0.9)], format_passage) == []
+    assert ContextPacker(100, count_words).pack([], format_passage) == []
+
+def test_a_single_chunk_over_the_budget_is_truncated_to_fit():
+    budget = MIN_PARTIAL_TOKENS + 10
+    packed = ContextPacker(budget, count_words).pack([chunk('a', 0, words(0, 500), 0.9)], format_passage)
+    assert len(packed) == 1
+    assert packed[0]['content'] == words(0, budget - 1)
+    assert packed_tokens(packed) == budget
+
+def test_chunks_too_large_to_truncate_make_room_for_smaller_ones():
+    budget = MIN_PARTIAL_TOKENS // 2
+    chunks = [chunk('a', 0, words(0, 500), 0.9), chunk('b', 0, words(0, 10), 0.5)]
+    packed = ContextPacker(budget, count_words).pack(chunks, format_passage)
+    assert [passage['source'] for passage in packed] == ['b']
+
+@pytest.mark.parametrize('budget', [1, 20, 50, 100, 150, 400])
+def test_packs_never_exceed_the_budget(budget):
+    chunks = [chunk(f"doc{i % 3}", i, words(i * 20, i * 20 + 40), 1.0 - i / 10) for i in range(8)]
+    packed = ContextPacker(budget, count_words).pack(chunks, format_passage)
+    assert packed_tokens(packed) <= budget
+
+def test_token_counts_are_estimated_without_tiktoken(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'tiktoken', None)
+    count_tokens = tiktoken_counter('gpt-3.5-turbo')
+    assert count_tokens("") == 0 and count_tokens("abcdefgh") == 2
@@ -0,0 +1,74 @@
+from collections import Counter
+import pytest
+from benchmark_pipeline import HashingEncoder, generate_corpus
+from document_processor import DocumentProcessor
+from ingestion import IngestionPipeline
+from vector_store import VectorStore
+
+DIM = 16
+
+class Embeddings:
+    """Embedding generator stand-in counting the texts it embeds."""
+
+    def __init__(self, fail_after: int = None):
+        self.encoder = HashingEncoder(DIM)
+        self.fail_after = fail_after
+        self.num_embedded = 0
+
+    def generate_embeddings(self, texts):
+        if self.fail_after is not None and self.num_embedded >= self.fail_after:
+            raise RuntimeError("embedding failed")
+        self.num_embedded += len(texts)
+        return self.encoder.encode(texts)
+
+@pytest.fixture
+def corpus(tmp_path):
+    return generate_corpus(str(tmp_path / 'corpus'), 8, 12)
+
+def make_pipeline(embeddings=None, **options):
+    doc_processor = DocumentProcessor(chunk_size=200, chunk_overlap=20)
+    pipeline = IngestionPipeline(doc_processor, embeddings or Embeddings(), VectorStore(DIM),
+                                 queue_size=2, **options)
+    return pipeline, doc_processor
+
+def test_checkpoints_only_report_files_whose_chunks_are_all_stored(corpus):
+    pipeline, doc_processor = make_pipeline(batch_size=5, flush_every=1, flush_growth=0.0)
+    expected = Counter(chunk['source'] for chunk in doc_processor.process_documents(
+        [doc_processor.load_file(path) for path in corpus]))
+
+    flushes = []
+    def on_flush(completed, final):
+        stored = Counter(pipeline.vector_store.metadata.column('source'))
+        assert all(stored[str(path)] == expected[str(path)] for path in completed)
+        flushes.append((list(completed), final))
+
+    assert pipeline.run(corpus, on_flush) == sum(expected.values())
+    assert len(pipeline.vector_store.metadata) == sum(expected.values())
+    assert [final for _, final in flushes] == [False] * (len(flushes) - 1) + [True]
+    assert sorted(path for completed, _ in flushes for path in completed) == sorted(corpus)
+    assert {'load_documents', 'chunk', 'embed', 'index', 'checkpoint'} <= set(pipeline.timings)
+
+def test_checkpoints_are_spaced_geometrically(corpus):
+    pipeline, _ = make_pipeline(batch_size=2, flush_every=1, flush_growth=1.0)
+    sizes = []
+    pipeline.run(corpus, lambda completed, final: sizes.append(pipeline.vector_store.num_vectors))
+
+    checkpoints = sizes[:-1]
+    assert len(checkpoints) >= 3
+    assert all(later >= 2 * earlier for earlier, later in zip(checkpoints, checkpoints[1:]))
+
+def test_files_that_fail_to_load_are_not_completed(corpus, tmp_path):
+    missing = tmp_path / 'corpus' / 'missing.txt'
+    pipeline, doc_processor = make_pipeline(batch_size=50)
+    completed = []
+    pipeline.run(corpus + [missing], lambda paths, final: completed.extend(paths))
+
+    assert sorted(completed) == sorted(corpus)
+    assert [error['source'] for error in doc_processor.load_errors] == [str(missing)]
+
+def test_errors_stop_the_run_without_a_final_checkpoint(corpus):
+    pipeline, _ = make_pipeline(Embeddings(fail_after=10), batch_size=5)
+    flushes = []
+    with pytest.raises(RuntimeError, match="embedding failed"):
+        pipeline.run(corpus, lambda completed, final: flushes.append(final))
+    assert True not in flushes
@@ -0,0 +1,84 @@
+import asyncio
+import time
+import pytest
+from config import Config
+from llm_interface import AsyncLLMInterface, ERROR_PREFIX, retry_after_seconds
+from llm_stub_server import StubLLMServer
+
+@pytest.fixture
+def server():
+    server = StubLLMServer(answer="Paris is the capital of France.").start()
+    yield server
+    server.stop()
+
+def make_interface(server, **kwargs):
+    return AsyncLLMInterface(api_key='test', base_url=server.base_url, **kwargs)
+
+def test_generate_response(server):
+    interface = make_interface(server)
+    assert asyncio.run(interface.generate_response("Capital of France?")) == "Paris is the capital of France."
+    assert server.requests[0]['messages'][-1]['content'] == "Capital of France?"
+
+def test_concurrent_requests_share_a_pool(server):
+    server.latency = 0.2
+    interface = make_interface(server, max_concurrency=8)
+    
+    async def run():
+        return await asyncio.gather(*(interface.generate_response(f"Question {i}") for i in range(8)))
+    
+    start = time.perf_counter()
+    responses = asyncio.run(run())
+    assert responses == ["Paris is the capital of France."] * 8
+    # Overlapping, not one after the other
+    assert time.perf_counter() - start < 8 * 0.2
+
+def test_retry_after_is_honoured(server, monkeypatch):
+    monkeypatch.setattr(Config, 'LLM_RETRY_BASE_DELAY', 10.0)
+    server.failures = [(429, {'Retry-After': '0.3'})]
+    interface = make_interface(server, max_retries=2)
+    
+    start = time.perf_counter()
+    assert asyncio.run(interface.generate_response("Question")) == "Paris is the capital of France."
+    assert 0.3 <= time.perf_counter() - start < 5
+    assert len(server.requests) == 2
+
+def test_gives_up_after_max_retries(server, monkeypatch):
+    monkeypatch.setattr(Config, 'LLM_RETRY_BASE_DELAY', 0.01)
+    server.failures = [(503, {})] * 3
+    interface = make_interface(server, max_retries=2)
+    
+    assert asyncio.run(interface.generate_response("Question")).startswith(ERROR_PREFIX)
+    assert len(server.requests) == 3
+
+def test_client_is_closed_with_its_event_loop(server):
+    interface = make_interface(server)
+    clients = []
+    
+    async def run():
+        response = await interface.generate_response("Question")
+        clients.append(interface._loop_clients[asyncio.get_running_loop()][0])
+        return response
+    
+    asyncio.run(run())
+    asyncio.run(run())
+    assert clients[0] is not clients[1]
+    assert all(client.is_closed() for client in clients)
+    assert interface._loop_clients == {}
+
+def test_aclose(server):
+    async def run():
+        async with make_interface(server) as interface:
+            await interface.generate_response("Question")
+            client = interface._loop_clients[asyncio.get_running_loop()][0]
+        return client, interface
+    
+    client, interface = asyncio.run(run())
+    assert client.is_closed()
+    assert interface._loop_clients == {}
+
+def test_retry_after_seconds():
+    assert retry_after_seconds({'retry-after': '2'}) == 2.0
+    assert retry_after_seconds({'retry-after-ms': '1500', 'retry-after': '9'}) == 1.5
+    assert retry_after_seconds({'retry-after': 'Wed, 21 Oct 2015 07:28:00 GMT'}) == 0.0
+    assert retry_after_seconds({'retry-after': 'soon'}) is None
+    assert retry_after_seconds({}) is None
@@ -0,0 +1,44 @@
+import os
+from manifest import KnowledgeBaseManifest
+
+def write(path, text):
+    path.write_text(text, encoding='utf-8')
+    return path
+
+def test_scan_classifies_files_since_the_last_build(tmp_path):
+    kept = write(tmp_path / 'kept.txt', "kept")
+    touched = write(tmp_path / 'touched.txt', "touched")
+    changed = write(tmp_path / 'changed.txt', "changed")
+    removed = write(tmp_path / 'removed.txt', "removed")
+    manifest = KnowledgeBaseManifest()
+    assert manifest.scan([kept, touched, changed, removed])['added'] == [kept, touched, changed, removed]
+    for path in (kept, touched, changed, removed):
+        manifest.record(path)
+
+    os.utime(touched, (0, 12345))
+    write(changed, "changed again")
+    added = write(tmp_path / 'added.txt', "added")
+    changes = manifest.scan([kept, touched, changed, added])
+
+    assert changes == {'added': [added], 'changed': [changed], 'removed': [str(removed)],
+                       'unchanged': [kept, touched]}
+    # A touched file is trusted again on the next scan without rereading it
+    assert manifest.entries[str(touched)]['mtime'] == 12345
+
+def test_manifest_round_trips_entries_settings_and_chunk_ids(tmp_path):
+    first = write(tmp_path / 'first.txt', "first")
+    second = write(tmp_path / 'second.txt', "second")
+    manifest = KnowledgeBaseManifest()
+    manifest.settings = {'chunk_size': 100}
+    manifest.record(first)
+    manifest.record(second)
+    manifest.update_chunk_ids([[str(first)], [str(second)], [str(first), str(second), str(first)]])
+    manifest.save(str(tmp_path / 'store' / 'manifest.json'))
+
+    loaded = KnowledgeBaseManifest()
+    assert not loaded.load(str(tmp_path / 'missing.json'))
+    assert loaded.load(str(tmp_path / 'store' / 'manifest.json'))
+    assert loaded.settings == {'chunk_size': 100}
+    assert loaded.entries[str(first)]['chunk_ids'] == [0, 2]
+    assert loaded.entries[str(second)]['chunk_ids'] == [1, 2]
+    assert loaded.entries == manifest.entries
@@ -0,0 +1,69 @@
+import pytest
+from llm_interface import LLMInterface
+from llm_stub_server import StubLLMServer
+from metrics import InMemoryCollector, PrometheusSink, metrics
+
+@pytest.fixture
+def collector():
+    collector = metrics.add_sink(InMemoryCollector())
+    yield collector
+    metrics.remove_sink(collector)
+
+@pytest.fixture
+def server():
+    server = StubLLMServer(answer="Paris is the capital of France.").start()
+    yield server
+    server.stop()
+
+def test_span_records_timings_and_errors(collector):
+    timings = {}
+    with metrics.span('search', timings):
+        pass
+    with pytest.raises(RuntimeError):
+        with metrics.span('search', timings):
+            raise RuntimeError("boom")
+    
+    assert len(collector.observations['search_seconds']) == 2
+    assert timings['search'] == pytest.approx(sum(collector.observations['search_seconds']))
+    assert collector.counters == {'search_errors': 1}
+
+def test_no_sinks_means_no_recording(collector):
+    metrics.remove_sink(collector)
+    metrics.increment('queries')
+    with metrics.span('search'):
+        pass
+    assert collector.counters == {} and collector.observations == {}
+
+def test_generate_response_counts_tokens(collector, server):
+    interface = LLMInterface(api_key='test', base_url=server.base_url)
+    assert interface.generate_response("Capital of France?") == "Paris is the capital of France."
+    assert collector.counters['llm_completion_tokens'] == 6
+    assert collector.counters['llm_prompt_tokens'] > 0
+
+def test_stream_response_counts_tokens(collector, server):
+    interface = LLMInterface(api_key='test', base_url=server.base_url)
+    assert ''.join(interface.stream_response("Capital of France?")) == "Paris is the capital of France."
+    assert server.requests[0]['stream_options'] == {'include_usage': True}
+    assert collector.counters['llm_completion_tokens'] == 6
+    assert collector.counters['llm_prompt_tokens'] > 0
+
+def test_prometheus_rendering():
+    sink = PrometheusSink(buckets=(0.1, 1.0))
+    sink.increment('queries', 2)
+    sink.observe('search_seconds', 0.05)
+    sink.observe('search_seconds', 0.5)
+    
+    text = sink.render()
+    assert 'rag_queries_total 2' in text
+    assert 'rag_search_seconds_bucket{le="0.1"} 1' in text
+    assert 'rag_search_seconds_bucket{le="+Inf"} 2' in text
+    assert 'rag_search_seconds_count 2' in text
+
+def test_prometheus_server_listens_on_loopback():
+    sink = PrometheusSink()
+    server = sink.serve(0)
+    try:
+        assert server.server_address[0] == '127.0.0.1'
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,207 @@
+import gc
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from benchmark_pipeline import BenchmarkPipeline, generate_corpus
+from config import Config
+from ingestion import IngestionPipeline
+from llm_interface import ERROR_PREFIX, LLMInterface
+from llm_stub_server import StubLLMServer
+from rag_pipeline import RAGPipeline
+from resource_registry import ResourceRegistry
+
+ANSWER = "Paris is the capital of France."
+SOURCE = {'content': "Paris is the capital and largest city of France.", 'source': 'france.txt',
+          'title': 'France', 'chunk_id': 0, 'vector_id': 0, 'similarity_score': 0.9}
+
+@pytest.fixture
+def server():
+    server = StubLLMServer(answer=ANSWER).start()
+    yield server
+    server.stop()
+
+@pytest.fixture
+def rag(server, tmp_path, monkeypatch):
+    """Pipeline answering from one fixed source through the stub LLM, with an answer cache."""
+    monkeypatch.setattr(Config, 'VECTOR_DB_PATH', str(tmp_path / 'vector_store'))
+    monkeypatch.setattr(Config, 'ANSWER_CACHE_ENABLED', True)
+    monkeypatch.setattr(Config, 'ANSWER_CACHE_PATH', str(tmp_path / 'answers.db'))
+    monkeypatch.setattr(Config, 'SNAPSHOT_POLL_INTERVAL', None)
+    rag = RAGPipeline()
+    rag._llm_interface = LLMInterface(api_key='test', base_url=server.base_url)
+    rag._retrieve = lambda question, top_k, filters=None, timings=None: (np.ones(4, dtype='float32'), [dict(SOURCE)])
+    rag.is_indexed = True
+    yield rag
+    rag.close()
+
+def stream(rag, question):
+    events = list(rag.query_stream(question))
+    assert events[0]['type'] == 'sources' and events[-1]['type'] == 'done'
+    return ''.join(event['text'] for event in events if event['type'] == 'delta'), events[-1]
+
+def test_streamed_answers_are_cached(rag, server):
+    text, done = stream(rag, "Capital of France?")
+    assert text == ANSWER and done['response'] == ANSWER and 'error' not in done
+
+    text, done = stream(rag, "Capital of France?")
+    assert text == ANSWER and done['cached'] == 'exact'
+    assert len(server.requests) == 1
+
+def test_truncated_streams_are_not_cached(rag, server):
+    server.fail_stream_after = 3
+    text, done = stream(rag, "Capital of France?")
+    assert text.startswith("Paris is the") and ERROR_PREFIX in text
+    assert done['error'] and done['cached'] is None
+    assert len(rag.answer_cache) == 0
+
+    server.fail_stream_after = None
+    text, done = stream(rag, "Capital of France?")
+    assert text == ANSWER and done['cached'] is None
+    assert len(server.requests) == 2
+
+def test_identical_streams_share_one_llm_call(rag, server):
+    leader = rag.query_stream("Capital of France?")
+    assert next(leader)['type'] == 'sources'
+    assert next(leader)['text'] == "Paris"
+
+    text, done = stream(rag, "capital of  france?")
+    assert text == ANSWER and done['coalesced'] and done['cached'] is None
+    events = list(leader)
+    assert ''.join(event['text'] for event in events if event['type'] == 'delta') == " is the capital of France."
+    assert events[-1]['coalesced'] is False
+    assert len(server.requests) == 1
+
+@pytest.fixture
+def builds(tmp_path, monkeypatch):
+    """Offline pipeline and two corpora with different documents."""
+    monkeypatch.setattr(Config, 'VECTOR_DB_PATH', str(tmp_path / 'vector_store'))
+    monkeypatch.setattr(Config, 'EMBEDDING_CACHE_ENABLED', False)
+    monkeypatch.setattr(Config, 'ANSWER_CACHE_ENABLED', False)
+    monkeypatch.setattr(Config, 'CHUNKING_STRATEGY', 'characters')
+    monkeypatch.setattr(Config, 'SNAPSHOT_POLL_INTERVAL', None)
+    corpora = []
+    for name, num_documents in (('old', 4), ('new', 6)):
+        paths = generate_corpus(str(tmp_path / name), num_documents, 10, seed=len(corpora))
+        corpora.append((str(tmp_path / name), {os.path.basename(path) for path in paths}))
+    rag = BenchmarkPipeline(0.0, hashing_encoder=True)
+    yield rag, corpora
+    rag.close()
+
+def sources(results):
+    return {os.path.basename(result['source']) for result in results}
+
+def test_rebuilds_do_not_close_shared_sharded_stores_in_use(builds, monkeypatch):
+    monkeypatch.setattr(Config, 'VECTOR_SHARDS', 2)
+    rag, [(old_directory, old_files), (new_directory, new_files)] = builds
+    rag.registry = ResourceRegistry()
+    rag.build_knowledge_base(old_directory, incremental=False)
+    query_embedding = rag.embedding_generator.generate_query_embedding("What is said about cells?")
+
+    # A query holding the store it started with
+    old_store = rag.vector_store
+    rag.build_knowledge_base(new_directory, incremental=False)
+    assert rag.vector_store is not old_store
+    assert sources(rag.vector_store.search(query_embedding, k=3)) <= new_files
+    assert sources(old_store.search(query_embedding, k=3)) <= old_files
+
+    finalizer = old_store._finalizer
+    del old_store
+    gc.collect()
+    assert not finalizer.alive
+
+@pytest.mark.parametrize('shared_shards', [False, True])
+def test_queries_running_during_a_rebuild_finish_on_the_old_snapshot(builds, monkeypatch, shared_shards):
+    if shared_shards:
+        monkeypatch.setattr(Config, 'VECTOR_SHARDS', 2)
+    rag, [(old_directory, old_files), (new_directory, new_files)] = builds
+    if shared_shards:
+        rag.registry = ResourceRegistry()
+    rag.build_knowledge_base(old_directory, incremental=False)
+    old_version = rag._loaded_version
+
+    # Hold the query open between its start and its search
+    embedding_generator, started, resume = rag.embedding_generator, threading.Event(), threading.Event()
+    generate_query_embedding = embedding_generator.generate_query_embedding
+    def blocking_query_embedding(question):
+        started.set()
+        resume.wait()
+        return generate_query_embedding(question)
+    monkeypatch.setattr(embedding_generator, 'generate_query_embedding', blocking_query_embedding)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        running = executor.submit(rag.query, "What is said about cells?", 3)
+        assert started.wait(5)
+        rag.build_knowledge_base(new_directory, incremental=False)
+        assert rag._loaded_version != old_version
+        resume.set()
+        result = running.result()
+
+    assert result['sources'] and sources(result['sources']) <= old_files
+    assert sources(rag.query("What is said about cells?", 3)['sources']) <= new_files
+
+def live_sources(vector_store):
+    return {os.path.basename(vector_store.metadata[int(idx)]['source']) for idx in vector_store.live_positions()}
+
+def test_incremental_builds_only_embed_added_and_changed_files(builds, monkeypatch):
+    monkeypatch.setattr(Config, 'COMPACTION_DEAD_RATIO', 1.0)
+    rag, [(directory, files), _] = builds
+    rag.build_knowledge_base(directory, incremental=False)
+    assert live_sources(rag.vector_store) == files
+
+    removed, changed = sorted(files)[:2]
+    os.remove(os.path.join(directory, removed))
+    with open(os.path.join(directory, changed), 'a', encoding='utf-8') as f:
+        f.write(" Chloroplasts capture light for photosynthesis.")
+    with open(os.path.join(directory, 'added.txt'), 'w', encoding='utf-8') as f:
+        f.write("Mitochondria produce most of the energy of the cell.")
+
+    embedded = []
+    generate_embeddings = rag.embedding_generator.generate_embeddings
+    def recording_embeddings(texts):
+        embedded.extend(texts)
+        return generate_embeddings(texts)
+    monkeypatch.setattr(rag.embedding_generator, 'generate_embeddings', recording_embeddings)
+    rag.build_knowledge_base(directory, incremental=True)
+
+    assert live_sources(rag.vector_store) == files - {removed} | {'added.txt'}
+    changed_chunks = [rag.vector_store.metadata[int(idx)] for idx in rag.vector_store.live_positions()
+                      if os.path.basename(rag.vector_store.metadata[int(idx)]['source']) in (changed, 'added.txt')]
+    assert sorted(embedded) == sorted(chunk['content'] for chunk in changed_chunks)
+    assert any("Chloroplasts" in chunk['content'] for chunk in changed_chunks)
+
+def test_interrupted_streaming_builds_resume_from_their_checkpoint(builds, monkeypatch):
+    monkeypatch.setattr(Config, 'INGEST_BATCH_SIZE', 4)
+    monkeypatch.setattr(Config, 'INGEST_FLUSH_EVERY', 1)
+    monkeypatch.setattr(Config, 'INGEST_FLUSH_GROWTH', 0.0)
+    rag, [_, (directory, files)] = builds
+
+    # Crash after the second checkpoint was saved
+    run = IngestionPipeline.run
+    def crashing_run(self, file_paths, on_flush=None):
+        checkpoints = []
+        def flush(completed, final):
+            on_flush(completed, final)
+            checkpoints.append(completed)
+            if len(checkpoints) == 2:
+                raise RuntimeError("crashed")
+        return run(self, file_paths, flush)
+    monkeypatch.setattr(IngestionPipeline, 'run', crashing_run)
+    with pytest.raises(RuntimeError, match="crashed"):
+        rag.build_knowledge_base(directory, incremental=False, streaming=True)
+    assert not rag.is_indexed and len(rag.snapshots.pending()) == 1
+    monkeypatch.setattr(IngestionPipeline, 'run', run)
+
+    embedded = []
+    generate_embeddings = rag.embedding_generator.generate_embeddings
+    def recording_embeddings(texts):
+        embedded.extend(texts)
+        return generate_embeddings(texts)
+    monkeypatch.setattr(rag.embedding_generator, 'generate_embeddings', recording_embeddings)
+    num_chunks = rag.build_knowledge_base(directory, incremental=False, streaming=True)
+
+    assert rag.snapshots.pending() == [] and len(rag.snapshots.versions()) == 1
+    assert live_sources(rag.vector_store) == files
+    assert rag.vector_store.num_chunks == num_chunks
+    assert 0 < len(embedded) < num_chunks
@@ -0,0 +1,65 @@
+import threading
+import pytest
+from resource_registry import ResourceRegistry
+
+class Resource:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+def test_acquirers_share_one_resource_until_the_last_release():
+    registry, loads = ResourceRegistry(), []
+    def factory():
+        loads.append(1)
+        return Resource()
+
+    first = registry.acquire('key', factory)
+    assert registry.acquire('key', factory) is first
+    assert registry.stats() == {'key': 2} and len(loads) == 1
+
+    registry.release('key')
+    assert not first.closed
+    registry.release('key')
+    assert first.closed and registry.stats() == {}
+    assert registry.acquire('key', factory) is not first
+
+def test_concurrent_acquirers_wait_for_one_load():
+    registry, loads, started, release = ResourceRegistry(), [], threading.Event(), threading.Event()
+    def factory():
+        loads.append(1)
+        started.set()
+        release.wait()
+        return Resource()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.acquire('key', factory))) for _ in range(4)]
+    threads[0].start()
+    started.wait()
+    for thread in threads[1:]:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(loads) == 1 and len({id(result) for result in results}) == 1
+    assert registry.stats() == {'key': 4}
+
+def test_key_locks_are_dropped_with_their_resources():
+    registry = ResourceRegistry()
+    for version in range(100):
+        registry.acquire(('vector_store', version), Resource)
+        registry.release(('vector_store', version))
+    assert registry._key_locks == {}
+
+    def fail():
+        raise ValueError("load failed")
+    with pytest.raises(ValueError):
+        registry.acquire('key', fail)
+    assert registry._key_locks == {}
+
+def test_resources_in_use_by_readers_are_not_closed_on_release():
+    registry = ResourceRegistry()
+    resource = registry.acquire('key', Resource, close_on_release=False)
+    registry.release('key')
+    assert not resource.closed and registry.stats() == {}
@@ -0,0 +1,228 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from single_flight import SingleFlight
+
+def follow(flight, key, func, *args):
+    """Start a thread calling flight.do, returning its future."""
+    executor = ThreadPoolExecutor(max_workers=1)
+    future = executor.submit(flight.do, key, func, *args)
+    executor.shutdown(wait=False)
+    return future
+
+def wait_for_callers(flight, key, callers):
+    while True:
+        with flight._lock:
+            if flight._flights[key].callers == callers:
+                return
+
+def test_do_shares_one_call_and_copies_the_result():
+    flight, release, calls = SingleFlight(), threading.Event(), []
+    def call():
+        calls.append(1)
+        release.wait()
+        return {'answer': 42}
+
+    leader = follow(flight, 'key', call)
+    while flight.in_flight()['threads'] == 0:
+        pass
+    followers = [follow(flight, 'key', call) for _ in range(3)]
+    wait_for_callers(flight, 'key', 4)
+    release.set()
+
+    result, shared = leader.result()
+    assert result == {'answer': 42} and not shared
+    results = [future.result() for future in followers]
+    assert all(result == ({'answer': 42}, True) for result in results)
+    assert len({id(result) for result, _ in results}) == 3
+    assert len(calls) == 1 and flight.in_flight() == {'threads': 0, 'asyncio': 0}
+
+def test_do_raises_the_error_for_every_caller_and_runs_again():
+    flight, release = SingleFlight(), threading.Event()
+    def fail():
+        release.wait()
+        raise ValueError("boom")
+
+    leader = follow(flight, 'key', fail)
+    while flight.in_flight()['threads'] == 0:
+        pass
+    follower = follow(flight, 'key', fail)
+    wait_for_callers(flight, 'key', 2)
+    release.set()
+
+    for future in (leader, follower):
+        with pytest.raises(ValueError, match="boom"):
+            future.result()
+    assert flight.do('key', lambda: 'again') == ('again', False)
+
+def test_stream_replays_items_to_late_callers():
+    flight, produced = SingleFlight(), []
+    def numbers():
+        for number in range(4):
+            produced.append(number)
+            yield {'number': number}
+
+    leader = flight.stream('key', numbers)
+    assert next(leader) == ({'number': 0}, False)
+    assert next(leader) == ({'number': 1}, False)
+    follower = flight.stream('key', numbers)
+
+    assert [item['number'] for item, shared in follower if shared] == [0, 1, 2, 3]
+    assert [item['number'] for item, _ in leader] == [2, 3]
+    assert produced == [0, 1, 2, 3]
+    assert flight.in_flight()['threads'] == 0
+
+def test_stream_outlives_a_caller_that_stops():
+    flight, closed = SingleFlight(), []
+    def numbers():
+        try:
+            yield from range(3)
+        finally:
+            closed.append(True)
+
+    leader = flight.stream('key', numbers)
+    follower = flight.stream('key', numbers)
+    assert next(leader)[0] == 0 and next(follower)[0] == 0
+    leader.close()
+
+    assert not closed
+    assert [item for item, _ in follower] == [1, 2]
+    assert closed == [True]
+
+def test_stream_is_closed_when_every_caller_stops():
+    flight, closed = SingleFlight(), []
+    def numbers():
+        try:
+            yield from range(3)
+        finally:
+            closed.append(True)
+
+    callers = [flight.stream('key', numbers), flight.stream('key', numbers)]
+    for caller in callers:
+        next(caller)
+    callers[0].close()
+    callers[1].close()
+
+    assert closed == [True] and flight.in_flight()['threads'] == 0
+    assert [item for item, shared in flight.stream('key', numbers)] == [0, 1, 2]
+
+def test_stream_raises_the_error_for_every_caller_after_its_items():
+    flight = SingleFlight()
+    def fail():
+        yield 'partial'
+        raise ValueError("boom")
+
+    leader = flight.stream('key', fail)
+    follower = flight.stream('key', fail)
+    assert next(leader) == ('partial', False)
+    assert next(follower) == ('partial', True)
+    with pytest.raises(ValueError, match="boom"):
+        next(leader)
+    with pytest.raises(ValueError, match="boom"):
+        next(follower)
+    assert flight.in_flight()['threads'] == 0
+
+def test_stream_followers_on_other_threads_wait_for_the_fetching_caller():
+    flight, release = SingleFlight(), threading.Event()
+    def slow():
+        yield 'first'
+        release.wait()
+        yield 'second'
+
+    leader = flight.stream('key', slow)
+    assert next(leader)[0] == 'first'
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        fetching = executor.submit(next, leader)
+        follower = executor.submit(lambda: [item for item, _ in flight.stream('key', slow)])
+        release.set()
+        assert fetching.result() == ('second', False)
+        assert follower.result() == ['first', 'second']
+
+def test_ado_shares_one_call():
+    async def main():
+        flight, calls = SingleFlight(), []
+        async def call():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {'answer': 42}
+        results = await asyncio.gather(*(flight.ado('key', call) for _ in range(3)))
+        return calls, results
+
+    calls, results = asyncio.run(main())
+    assert len(calls) == 1
+    assert [shared for _, shared in results] == [False, True, True]
+    assert all(result == {'answer': 42} for result, _ in results)
+
+def test_ado_raises_the_error_for_every_caller():
+    async def main():
+        flight = SingleFlight()
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+        results = await asyncio.gather(*(flight.ado('key', fail) for _ in range(2)), return_exceptions=True)
+        return flight, results
+
+    flight, results = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flight.in_flight()['asyncio'] == 0
+
+def test_ado_leader_cancellation_does_not_cancel_followers():
+    async def main():
+        flight, started = SingleFlight(), asyncio.Event()
+        async def call():
+            started.set()
+            await asyncio.sleep(0.05)
+            return 'answer'
+        leader = asyncio.ensure_future(flight.ado('key', call))
+        await started.wait()
+        follower = asyncio.ensure_future(flight.ado('key', call))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(main()) == ('answer', True)
+
+def test_ado_follower_cancellation_does_not_cancel_the_leader():
+    async def main():
+        flight, started = SingleFlight(), asyncio.Event()
+        async def call():
+            started.set()
+            await asyncio.sleep(0.05)
+            return 'answer'
+        leader = asyncio.ensure_future(flight.ado('key', call))
+        await started.wait()
+        follower = asyncio.ensure_future(flight.ado('key', call))
+        await asyncio.sleep(0)
+        follower.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await follower
+        return await leader
+
+    assert asyncio.run(main()) == ('answer', False)
+
+def test_ado_call_is_cancelled_with_its_last_caller():
+    async def main():
+        flight, started, cancelled = SingleFlight(), asyncio.Event(), asyncio.Event()
+        async def call():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+        callers = [asyncio.ensure_future(flight.ado('key', call)) for _ in range(2)]
+        await started.wait()
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.wait_for(cancelled.wait(), 1)
+
+        async def again():
+            return 'again'
+        return flight.in_flight(), await flight.ado('key', again)
+
+    in_flight, result = asyncio.run(main())
+    assert in_flight['asyncio'] == 0 and result == ('again', False)
@@ -0,0 +1,95 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from snapshots import SnapshotManager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def set_owner(snapshots, version, **owner):
+    with open(os.path.join(snapshots.snapshots_dir, version, 'owner.json'), 'w', encoding='utf-8') as f:
+        json.dump(owner, f)
+
+def test_running_builds_are_not_abandoned(tmp_path):
+    snapshots = SnapshotManager(str(tmp_path))
+    version = snapshots.create()
+    builder = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])
+    try:
+        with open(snapshots._owner_path(version), 'r', encoding='utf-8') as f:
+            owner = json.load(f)
+        set_owner(snapshots, version, host=owner['host'], pid=builder.pid)
+        assert snapshots.abandoned() == []
+    finally:
+        builder.kill()
+        builder.wait()
+    assert snapshots.abandoned() == [version]
+
+def test_builds_on_other_hosts_expire_with_their_lease(tmp_path):
+    snapshots = SnapshotManager(str(tmp_path), lease=60)
+    version = snapshots.create()
+    set_owner(snapshots, version, host='elsewhere', pid=1)
+    assert snapshots.abandoned() == []
+    
+    expired = time.time() - 120
+    os.utime(snapshots._owner_path(version), (expired, expired))
+    assert snapshots.abandoned() == [version]
+
+def test_owned_snapshots_renew_their_lease(tmp_path):
+    snapshots = SnapshotManager(str(tmp_path), lease=0.2)
+    version = snapshots.create()
+    with snapshots.owned(version):
+        set_owner(snapshots, version, host='elsewhere', pid=1)
+        time.sleep(0.5)
+        assert snapshots.abandoned() == []
+    time.sleep(0.3)
+    assert snapshots.abandoned() == [version]
+
+def test_completed_snapshots_drop_their_owner(tmp_path):
+    snapshots = SnapshotManager(str(tmp_path))
+    version = snapshots.create()
+    snapshots.complete(version, {})
+    assert not os.path.exists(snapshots._owner_path(version))
+    assert snapshots.pending() == [] and snapshots.versions() == [version]
+
+def test_build_lock_is_exclusive_across_processes(tmp_path):
+    script = (
+        "import sys, time\n"
+        "from snapshots import SnapshotManager\n"
+        "with SnapshotManager(sys.argv[1]).build_lock():\n"
+        "    print('locked', flush=True)\n"
+        "    time.sleep(0.5)\n"
+    )
+    holder = subprocess.Popen([sys.executable, '-c', script, str(tmp_path)], cwd=ROOT,
+                              stdout=subprocess.PIPE, text=True)
+    try:
+        assert holder.stdout.readline().strip() == 'locked'
+        start = time.perf_counter()
+        with SnapshotManager(str(tmp_path)).build_lock():
+            waited = time.perf_counter() - start
+    finally:
+        holder.wait()
+    assert waited > 0.3
+
+def test_remote_shard_files_follow_snapshots(tmp_path):
+    from sharded_store import RemoteShardFiles, spawn_shard_process
+    
+    server = spawn_shard_process(b'secret')
+    try:
+        host, port = server.address
+        snapshots = SnapshotManager(str(tmp_path / 'pipeline'),
+                                    remote_shards=RemoteShardFiles([f"{host}:{port}"], b'secret'))
+        # Stands in for the shard machine's copy of the published snapshot
+        published = tmp_path / 'shard_machine' / 'vector_store'
+        published.parent.mkdir()
+        (tmp_path / 'shard_machine' / 'vector_store.shard0.faiss').write_bytes(b'index')
+        
+        version = snapshots.create(str(published))
+        copied = snapshots.store_path(version) + '.shard0.faiss'
+        with open(copied, 'rb') as f:
+            assert f.read() == b'index'
+        
+        snapshots.discard(version)
+        assert not os.path.exists(os.path.dirname(copied))
+    finally:
+        server.close()
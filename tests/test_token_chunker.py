@@ -0,0 +1,68 @@
+import re
+import pytest
+from token_chunker import TokenChunker
+
+class PieceTokenizer:
+    """Fast-tokenizer stand-in splitting words and punctuation into pieces of up to three characters."""
+
+    is_fast = True
+
+    def __call__(self, texts, **options):
+        return {'offset_mapping': [self.offsets(text) for text in texts]}
+
+    @staticmethod
+    def offsets(text):
+        return [(start, min(start + 3, match.end()))
+                for match in re.finditer(r"\w+|[^\w\s]", text)
+                for start in range(match.start(), match.end(), 3)]
+
+def count_tokens(text):
+    return len(PieceTokenizer.offsets(text))
+
+def chunk(text, max_tokens, overlap_tokens=0):
+    chunker = TokenChunker(PieceTokenizer(), max_tokens, overlap_tokens)
+    return [chunk['content'] for chunk in chunker.chunk_documents([text], [{'source': 'doc.txt', 'title': 'Doc'}])]
+
+SENTENCES = [f"Sentence number {number} talks about topic {number}." for number in range(12)]
+
+def test_chunks_pack_whole_sentences_up_to_the_limit():
+    chunks = chunk(' '.join(SENTENCES), max_tokens=30)
+    sentence_tokens = count_tokens(SENTENCES[0])
+
+    assert len(chunks) > 1 and ' '.join(chunks) == ' '.join(SENTENCES)
+    for content in chunks:
+        assert count_tokens(content) <= 30
+        assert content.startswith("Sentence") and content.endswith('.')
+        # A chunk is only closed when the next sentence would not fit
+        assert count_tokens(content) + sentence_tokens > 30
+
+def test_long_sentences_are_split_at_word_boundaries():
+    text = ' '.join(f"word{number:03d}" for number in range(40))
+    chunks = chunk(text, max_tokens=10)
+
+    assert ' '.join(chunks) == text
+    for content in chunks:
+        assert count_tokens(content) <= 10
+        assert all(re.fullmatch(r"word\d{3}", word) for word in content.split())
+
+def test_words_longer_than_the_limit_are_cut():
+    text = "x" * 40
+    chunks = chunk(text, max_tokens=4)
+    assert ''.join(chunks) == text and all(count_tokens(content) <= 4 for content in chunks)
+
+def test_consecutive_chunks_share_trailing_sentences_as_overlap():
+    sentence_tokens = count_tokens(SENTENCES[0])
+    chunks = chunk(' '.join(SENTENCES), max_tokens=3 * sentence_tokens, overlap_tokens=sentence_tokens)
+
+    for previous, current in zip(chunks, chunks[1:]):
+        last_sentence = previous.split('. ')[-1]
+        assert current.startswith(last_sentence.rstrip('.'))
+        assert count_tokens(current) <= 3 * sentence_tokens
+
+def test_overlap_leaves_room_for_new_text():
+    assert TokenChunker(PieceTokenizer(), 10, overlap_tokens=50).overlap_tokens == 5
+
+    class SlowTokenizer:
+        is_fast = False
+    with pytest.raises(ValueError, match="fast tokenizer"):
+        TokenChunker(SlowTokenizer(), 10)
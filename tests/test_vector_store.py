@@ -0,0 +1,160 @@
+import os
+import numpy as np
+import pytest
+import vector_store as vector_store_module
+from vector_store import VectorStore
+
+WORDS = "alpha beta gamma delta epsilon zeta eta theta iota kappa lambda mu nu xi omicron pi rho sigma".split()
+DIM = 16
+
+def make_chunks(count, prefix='doc'):
+    return [{'content': ' '.join(np.random.default_rng(i).choice(WORDS, 30)), 'source': f"{prefix}{i}",
+             'title': 'Title', 'chunk_id': i} for i in range(count)]
+
+def make_embeddings(count):
+    return np.random.default_rng(0).random((count, DIM)).astype('float32')
+
+@pytest.fixture
+def store_path(tmp_path):
+    return str(tmp_path / 'vector_store')
+
+def test_duplicate_index_is_loaded_not_rebuilt(store_path, monkeypatch):
+    store = VectorStore(DIM, deduplicate=True)
+    store.add_embeddings(make_embeddings(200), make_chunks(200))
+    store.save(store_path)
+
+    loaded = VectorStore(DIM, deduplicate=True)
+    loaded.load(store_path)
+    hashed = []
+    original = vector_store_module.fingerprint
+    monkeypatch.setattr(vector_store_module, 'fingerprint', lambda text: hashed.append(text) or original(text))
+
+    duplicates = [dict(chunk, source=f"copy{i}") for i, chunk in enumerate(make_chunks(3))]
+    assert loaded.add_embeddings(make_embeddings(3), duplicates) == 0
+    assert len(hashed) == 3  # only the new chunks
+    assert loaded.metadata[0]['duplicates'][0]['source'] == 'copy0'
+
+def test_duplicate_index_follows_deletes_and_compaction(store_path):
+    store = VectorStore(DIM, deduplicate=True)
+    chunks = make_chunks(50)
+    embeddings = make_embeddings(50)
+    store.add_embeddings(embeddings, chunks)
+    store.save(store_path)
+    store.load(store_path)
+
+    store.delete('doc7')
+    # The deleted chunk no longer absorbs its duplicates
+    assert store.add_embeddings(embeddings[7:8], [dict(chunks[7], source='new7')]) == 1
+    store.compact()
+    assert store.add_embeddings(embeddings[8:9], [dict(chunks[8], source='again8')]) == 0
+
+    store.save(store_path)
+    reloaded = VectorStore(DIM, deduplicate=True)
+    reloaded.load(store_path)
+    assert reloaded.add_embeddings(embeddings[7:8], [dict(chunks[7], source='again7')]) == 0
+    assert [duplicate['source'] for duplicate in reloaded.chunk(49)['duplicates']] == ['again7']
+
+def test_updated_chunks_are_patched_in_place(store_path):
+    store = VectorStore(DIM)
+    store.add_embeddings(make_embeddings(20), make_chunks(20))
+    store.save(store_path)
+    store.load(store_path)
+    text_size = os.path.getsize(f"{store_path}.chunks.text")
+
+    store.metadata.update(3, {'content': 'changed text', 'tags': ['edited']})
+    store.save(store_path)
+
+    reloaded = VectorStore(DIM)
+    reloaded.load(store_path)
+    assert reloaded.metadata[3]['content'] == 'changed text'
+    assert reloaded.metadata[3]['tags'] == ['edited']
+    assert reloaded.metadata[4] == make_chunks(20)[4]
+    # Appended to the existing text, not rewritten
+    assert os.path.getsize(f"{store_path}.chunks.text") == text_size + len('changed text')
+
+def test_delete_updates_the_metadata_index_in_place():
+    store = VectorStore(DIM, deduplicate=True)
+    chunks = [dict(chunk, tags=['even' if i % 2 == 0 else 'odd']) for i, chunk in enumerate(make_chunks(10))]
+    store.add_embeddings(make_embeddings(10), chunks)
+    # doc0 also stands for a copy under another source
+    store.add_embeddings(make_embeddings(1), [dict(chunks[0], source='copy0', tags=['copy'])])
+    index = store.metadata_index
+    assert index.match({'tags': 'copy'}).tolist() == [0]
+
+    assert store.delete(['doc0', 'doc3']) == 1
+    assert store.metadata_index is index
+    assert store.metadata[0]['source'] == 'copy0'  # promoted from its duplicate
+
+    fresh = type(index)(store.metadata)
+    for filters in ({'source': 'doc0'}, {'source': 'copy0'}, {'source': 'doc3'}, {'tags': 'odd'}, {'tags': 'copy'}):
+        live = fresh.match(filters)
+        assert index.match(filters).tolist() == live[~store.tombstones[live]].tolist(), filters
+
+def test_sharded_chunks_carry_global_vector_ids():
+    from sharded_store import ShardedVectorStore
+
+    store = ShardedVectorStore(DIM, num_shards=3)
+    store.add_embeddings(make_embeddings(30), make_chunks(30))
+    try:
+        by_position = [store.metadata[idx] for idx in range(len(store.metadata))]
+        assert [chunk['vector_id'] for chunk in store.metadata] == [chunk['vector_id'] for chunk in by_position]
+        assert len({chunk['vector_id'] for chunk in by_position}) == 30
+        for chunk in by_position:
+            assert store.get(chunk['vector_id'])['source'] == chunk['source']
+        result = store.search(make_embeddings(30)[5], k=1)[0]
+        assert store.get(result['vector_id'])['source'] == result['source']
+    finally:
+        store.close()
+
+def filter_chunks(count):
+    return [dict(chunk, tags=['even' if i % 2 == 0 else 'odd'] + (['fives'] if i % 5 == 0 else []),
+                 source=f"doc{i % 7}") for i, chunk in enumerate(make_chunks(count))]
+
+def test_metadata_index_matches_every_filter():
+    store = VectorStore(DIM)
+    store.add_embeddings(make_embeddings(40), filter_chunks(40))
+    index = store.metadata_index
+
+    assert index.match({'source': 'doc3'}).tolist() == list(range(3, 40, 7))
+    assert index.match({'source': ['doc1', 'doc2']}).tolist() == sorted(list(range(1, 40, 7)) + list(range(2, 40, 7)))
+    assert index.match({'tags': 'fives', 'source': ['doc0', 'doc5']}).tolist() == [0, 5, 35]
+    assert index.match({'tags': 'missing'}).tolist() == []
+    assert index.match({'source': 'doc0', 'tags': 'odd'}).tolist() == [7, 21, 35]
+
+@pytest.mark.parametrize('index_type', ['flat', 'hnsw', 'ivf_flat'])
+@pytest.mark.parametrize('selector', [False, True])
+def test_filtered_search_only_returns_matching_live_chunks(store_path, monkeypatch, index_type, selector):
+    if selector:
+        # Search through a FAISS id selector instead of scoring the matches exactly
+        monkeypatch.setattr(vector_store_module, 'FILTER_EXACT_MAX_IDS', 0)
+    store = VectorStore(DIM, index_type=index_type, nlist=4, nprobe=4)
+    embeddings = make_embeddings(300)
+    store.add_embeddings(embeddings, filter_chunks(300))
+    store.delete(['doc3'])
+    store.save(store_path)
+    loaded = VectorStore(DIM, index_type=index_type, nlist=4, nprobe=4)
+    loaded.load(store_path)
+
+    queries = np.random.default_rng(1).random((3, DIM)).astype('float32')
+    normalized = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    matching = np.array([i for i in range(300) if i % 7 in (2, 3) and i % 2 == 1])
+    live = matching[matching % 7 == 2]
+    for query, results in zip(queries, loaded.search_batch(queries, k=5, filters={'source': ['doc2', 'doc3'], 'tags': 'odd'})):
+        assert len(results) == 5
+        assert all(result['source'] == 'doc2' and 'odd' in result['tags'] for result in results)
+        expected = live[np.argsort(-(normalized[live] @ (query / np.linalg.norm(query))))[:5]]
+        assert [result['chunk_id'] for result in results] == expected.tolist()
+
+def test_loaded_ivf_stores_reconstruct_without_changing_the_index(store_path):
+    store = VectorStore(DIM, index_type='ivf_flat', nlist=4, nprobe=4)
+    embeddings = make_embeddings(100)
+    store.add_embeddings(embeddings, make_chunks(100))
+    store.save(store_path)
+    loaded = VectorStore(DIM, index_type='ivf_flat', nlist=4, nprobe=4)
+    loaded.load(store_path)
+    index = loaded.index
+    
+    ids = np.array([0, 42, 99])
+    normalized = embeddings[ids] / np.linalg.norm(embeddings[ids], axis=1, keepdims=True)
+    assert np.allclose(loaded.reconstruct(ids), normalized, atol=1e-6)
+    assert loaded.index is index
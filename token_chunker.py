@@ -0,0 +1,107 @@
+import re
+from bisect import bisect_left, bisect_right
+from typing import List, Dict, Tuple
+
+# Sentence ends: terminal punctuation followed by whitespace
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+
+class TokenChunker:
+    """Chunks text by the embedding model's tokens, cutting on sentence boundaries.
+
+    Texts are expected to be cleaned already and are tokenized in one batch call. Whole
+    sentences are packed into each chunk up to ``max_tokens`` word-pieces,
+    so chunks fill the model window without being truncated; a sentence
+    that is longer than the window on its own is split at word boundaries.
+    Consecutive chunks share up to ``overlap_tokens`` tokens of trailing
+    sentences.
+    """
+    
+    def __init__(self, tokenizer, max_tokens: int, overlap_tokens: int = 0):
+        if not getattr(tokenizer, 'is_fast', False):
+            raise ValueError("TokenChunker needs a fast tokenizer that returns offset mappings")
+        
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        # Overlap must leave room for new text in every chunk
+        self.overlap_tokens = min(overlap_tokens, max_tokens // 2)
+    
+    def _sentence_spans(self, text: str) -> List[Tuple[int, int]]:
+        """Character spans of the sentences in text."""
+        spans = []
+        start = 0
+        for match in SENTENCE_BOUNDARY.finditer(text):
+            spans.append((start, match.start()))
+            start = match.end()
+        if start < len(text):
+            spans.append((start, len(text)))
+        return spans
+    
+    def _split_long_sentence(self, token_starts: List[int], text: str,
+                             first: int, last: int) -> List[Tuple[int, int]]:
+        """Split the token range [first, last) into windows that end on word boundaries."""
+        windows = []
+        while last - first > self.max_tokens:
+            cut = first + self.max_tokens
+            # Move the cut back until it falls at the start of a word
+            while cut > first + 1 and not text[token_starts[cut] - 1].isspace():
+                cut -= 1
+            if cut == first + 1:
+                cut = first + self.max_tokens
+            windows.append((first, cut))
+            first = cut
+        windows.append((first, last))
+        return windows
+    
+    def _token_ranges(self, text: str, offsets: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        """Token ranges of the chunks of one document."""
+        token_starts = [start for start, _ in offsets]
+        token_ends = [end for _, end in offsets]
+        
+        # Token range of every sentence, long sentences split into windows
+        units = []
+        for start_char, end_char in self._sentence_spans(text):
+            first = bisect_left(token_ends, start_char + 1)
+            last = bisect_right(token_starts, end_char - 1)
+            if last > first:
+                units.extend(self._split_long_sentence(token_starts, text, first, last))
+        
+        ranges = []
+        current = []
+        for unit in units:
+            if current and unit[1] - current[0][0] > self.max_tokens:
+                ranges.append((current[0][0], current[-1][1]))
+                
+                # Carry trailing sentences over as overlap while there is room
+                overlap = []
+                for previous in reversed(current):
+                    if (current[-1][1] - previous[0] > self.overlap_tokens or
+                            unit[1] - previous[0] > self.max_tokens):
+                        break
+                    overlap.insert(0, previous)
+                current = overlap
+            current.append(unit)
+        
+        if current:
+            ranges.append((current[0][0], current[-1][1]))
+        return ranges
+    
+    def chunk_documents(self, texts: List[str], metadata: List[Dict[str, str]]) -> List[Dict]:
+        """Chunk cleaned document texts, tokenizing all of them in one call."""
+        encodings = self.tokenizer(
+            texts,
+            add_special_tokens=False,
+            return_offsets_mapping=True,
+            return_attention_mask=False,
+            verbose=False
+        )
+        
+        all_chunks = []
+        for text, offsets, doc_metadata in zip(texts, encodings['offset_mapping'], metadata):
+            for chunk_id, (first, last) in enumerate(self._token_ranges(text, offsets)):
+                all_chunks.append({
+                    'content': text[offsets[first][0]:offsets[last - 1][1]],
+                    'source': doc_metadata['source'],
+                    'title': doc_metadata['title'],
+                    'chunk_id': chunk_id
+                })
+        return all_chunks
@@ -0,0 +1,91 @@
+import os
+import numpy as np
+from typing import Iterable
+
+class VectorFile:
+    """Full-precision vectors in a raw float32 file, memory-mapped once saved.
+
+    Keeps exact copies of vectors whose index only stores compressed codes,
+    for re-ranking search candidates. Lookups only page in the rows they
+    touch, so the vectors do not need to stay resident in memory.
+    """
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self._mapped = np.zeros((0, dim), dtype='float32')
+        self._pending = []  # arrays of vectors added since the last load
+        self._loaded_from = None  # path whose file holds exactly the mapped vectors
+
+    def __len__(self) -> int:
+        return len(self._mapped) + sum(len(vectors) for vectors in self._pending)
+
+    def extend(self, vectors: np.ndarray):
+        """Append vectors."""
+        self._pending.append(np.asarray(vectors, dtype='float32'))
+
+    def _pending_vectors(self) -> np.ndarray:
+        """The pending vectors as one array, concatenated on first use."""
+        if len(self._pending) != 1:
+            self._pending = [np.vstack([np.zeros((0, self.dim), dtype='float32')] + self._pending)]
+        return self._pending[0]
+
+    def rows(self, ids: np.ndarray) -> np.ndarray:
+        """Return the vectors at the given positions, in the shape of ids plus the vector dimension."""
+        ids = np.asarray(ids, dtype='int64')
+        flat_ids = ids.ravel()
+        num_mapped = len(self._mapped)
+
+        vectors = np.empty((len(flat_ids), self.dim), dtype='float32')
+        mapped = flat_ids < num_mapped
+        # Read mapped rows in file order
+        order = np.argsort(flat_ids[mapped], kind='stable')
+        vectors[np.flatnonzero(mapped)[order]] = self._mapped[flat_ids[mapped][order]]
+        if not mapped.all():
+            vectors[~mapped] = self._pending_vectors()[flat_ids[~mapped] - num_mapped]
+        return vectors.reshape(ids.shape + (self.dim,))
+
+    def delete(self, positions: Iterable[int]):
+        """Remove vectors by position; later positions shift down."""
+        removed = np.array(sorted(set(int(p) for p in positions)), dtype='int64')
+        if len(removed) == 0:
+            return
+
+        keep = np.ones(len(self), dtype=bool)
+        keep[removed] = False
+        self._pending = [np.vstack([self._mapped, self._pending_vectors()])[keep]]
+        self._mapped = np.zeros((0, self.dim), dtype='float32')
+        # The file on disk no longer matches, the next save rewrites it
+        self._loaded_from = None
+
+    def save(self, filepath: str):
+        """Write the vectors and re-map them from disk.
+
+        When saving back to the file the vectors were loaded from, only the
+        vectors added since then are appended, after any rows an interrupted
+        save left past the mapped ones.
+        """
+        path = f"{filepath}.vectors"
+        if self._loaded_from == filepath:
+            with open(path, 'r+b') as f:
+                f.seek(len(self._mapped) * 4 * self.dim)
+                f.truncate()
+                f.write(self._pending_vectors().tobytes())
+        else:
+            with open(f"{path}.tmp", 'wb') as f:
+                f.write(np.asarray(self._mapped).tobytes())
+                f.write(self._pending_vectors().tobytes())
+            os.replace(f"{path}.tmp", path)
+
+        self.load(filepath)
+
+    def load(self, filepath: str, count: int = None):
+        """Memory-map a saved vector file, or its first count vectors."""
+        path = f"{filepath}.vectors"
+        if count is None:
+            count = os.path.getsize(path) // (4 * self.dim)
+        if count:
+            self._mapped = np.memmap(path, dtype='float32', mode='r', shape=(count, self.dim))
+        else:
+            self._mapped = np.zeros((0, self.dim), dtype='float32')
+        self._pending = []
+        self._loaded_from = filepath
@@ -1,42 +1,523 @@
 import faiss
 import numpy as np
-from typing import List, Dict, Tuple
-import pickle
+from typing import List, Dict, Tuple, Any, Iterable, Optional, Union
+import json
 import os
+import threading
+from chunk_store import ChunkStore
+from metadata_index import MetadataIndex
+from deduplication import DUPLICATE_FIELDS, DuplicateIndex, duplicate_entry, fingerprint
+from vector_file import VectorFile
+
+INDEX_TYPES = ('flat', 'hnsw', 'ivf_flat', 'ivf_pq')
+
+# How the index stores vectors: full floats, half floats, 8-bit scalar codes or PQ codes
+STORAGE_TYPES = ('float32', 'fp16', 'int8', 'pq')
+
+# FAISS recommends at least this many training points per IVF centroid
+MIN_POINTS_PER_CENTROID = 39
+
+# Filters matching at most this many chunks are scored exactly instead of scanning the index
+FILTER_EXACT_MAX_IDS = 4096
 
 class VectorStore:
-    """FAISS-based vector store for similarity search."""
+    """FAISS-based vector store for similarity search.
+
+    The index type is selectable: 'flat' is an exact brute-force scan,
+    'hnsw' a graph index, 'ivf_flat' and 'ivf_pq' inverted-file indexes
+    with full or product-quantized vectors. IVF indexes are trained on the
+    first batch of embeddings that is added.
     
-    def __init__(self, embedding_dim: int):
+    With a compressed ``storage`` ('fp16', 'int8' or 'pq'), or the 'ivf_pq'
+    index type, the index only holds compressed codes for the first-pass
+    scan. ``rerank_factor`` times k candidates are then re-scored exactly
+    against full-precision vectors kept in a memory-mapped file.
+    
+    With ``deduplicate``, chunks that duplicate a stored chunk (same text,
+    or MinHash-similar text with embedding similarity of at least
+    ``duplicate_threshold``) are not indexed again; their metadata is
+    recorded in the stored chunk's ``duplicates`` list instead.
+    
+    Every chunk gets a stable ``vector_id`` that survives compaction,
+    while positions (the ids FAISS and the chunk store use) shift when
+    chunks are physically removed. ``delete`` and ``upsert`` only
+    tombstone the replaced chunks, which searches skip, so no index has to
+    be rebuilt; ``compact`` reclaims their space later.
+    """
+    
+    def __init__(self, embedding_dim: int, index_type: str = 'flat',
+                 hnsw_m: int = 32, ef_construction: int = 200, ef_search: int = 64,
+                 nlist: int = 1024, nprobe: int = 16, pq_m: int = 48, pq_nbits: int = 8,
+                 storage: str = 'float32', rerank_factor: int = 4,
+                 deduplicate: bool = False, duplicate_threshold: float = 0.95):
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+        if storage not in STORAGE_TYPES:
+            raise ValueError(f"Unknown vector storage '{storage}', expected one of {STORAGE_TYPES}")
+        
         self.embedding_dim = embedding_dim
-        self.index = faiss.IndexFlatIP(embedding_dim)  # Inner product for cosine similarity
-        self.metadata = []
+        self.index_type = index_type
+        self.storage = storage
+        self.rerank_factor = rerank_factor
+        self.deduplicate = deduplicate
+        self.duplicate_threshold = duplicate_threshold
+        self.index_params = {
+            'hnsw_m': hnsw_m,
+            'ef_construction': ef_construction,
+            'ef_search': ef_search,
+            'nlist': nlist,
+            'nprobe': nprobe,
+            'pq_m': pq_m,
+            'pq_nbits': pq_nbits
+        }
+        self.index = self._create_index()
+        self.metadata = ChunkStore()
+        self.full_vectors = VectorFile(embedding_dim)
+        self.vector_ids = np.zeros(0, dtype='int64')  # stable id of the chunk at every position
+        self.tombstones = np.zeros(0, dtype=bool)  # deleted chunks still in the index
+        self._next_vector_id = 0
+        self._metadata_index = None
+        self._duplicate_index = None
+        self._live_selector = None
+        self._saved_path = None  # where the store was last saved or loaded from
+        # Searches on a shared store build the lazy indexes above concurrently
+        self._lazy_lock = threading.Lock()
+    
+    @property
+    def rerank(self) -> bool:
+        """Whether search results are re-scored against full-precision vectors."""
+        return self.storage != 'float32' or self.index_type == 'ivf_pq'
+    
+    @property
+    def num_vectors(self) -> int:
+        """Number of vectors in the index."""
+        return self.index.ntotal
+    
+    @property
+    def is_trained(self) -> bool:
+        """Whether the index is ready for vectors to be added without training."""
+        return self.index.is_trained
+    
+    @property
+    def num_chunks(self) -> int:
+        """Number of chunks that have not been deleted."""
+        return len(self.tombstones) - int(self.tombstones.sum())
+    
+    @property
+    def dead_ratio(self) -> float:
+        """Share of indexed vectors that belong to deleted chunks."""
+        return float(self.tombstones.mean()) if len(self.tombstones) else 0.0
+    
+    def live_positions(self) -> np.ndarray:
+        """Positions of the chunks that have not been deleted."""
+        return np.flatnonzero(~self.tombstones)
+    
+    def _has_full_vectors(self) -> bool:
+        """Whether a full-precision copy of every indexed vector is available."""
+        return self.rerank and len(self.full_vectors) == self.index.ntotal
+    
+    @property
+    def metadata_index(self) -> MetadataIndex:
+        """Inverted index over the chunk metadata, rebuilt after the store changes."""
+        with self._lazy_lock:
+            if self._metadata_index is None:
+                self._metadata_index = MetadataIndex(self.metadata)
+            return self._metadata_index
+    
+    @property
+    def duplicate_index(self) -> DuplicateIndex:
+        """MinHash index over the stored chunk text, memory-mapped from the saved store when it has one."""
+        with self._lazy_lock:
+            if self._duplicate_index is None:
+                duplicate_index = DuplicateIndex(similarity_threshold=self.duplicate_threshold)
+                if self._saved_path is None or not duplicate_index.load(self._saved_path, len(self.metadata)):
+                    # Stores saved without deduplication have no index to load
+                    for idx, content in enumerate(self.metadata.column('content')):
+                        duplicate_index.add(idx, fingerprint(content))
+                duplicate_index.remove(np.flatnonzero(self.tombstones))
+                self._duplicate_index = duplicate_index
+            return self._duplicate_index
+    
+    def chunk_sources(self) -> List[List[str]]:
+        """The sources every stored chunk stands for: its own and those of its merged duplicates.
+        
+        Deleted chunks stand for no source.
+        """
+        return [
+            [] if deleted else [source] + [duplicate['source'] for duplicate in duplicates or ()]
+            for source, duplicates, deleted in zip(self.metadata.column('source'),
+                                                   self.metadata.column('duplicates'), self.tombstones)
+        ]
+    
+    def _storage_description(self, num_training: int = None) -> str:
+        """FAISS factory component for the configured vector storage."""
+        params = self.index_params
+        storage = self.storage
+        if storage == 'pq' and num_training is not None and num_training < 2 ** params['pq_nbits']:
+            print(f"Only {num_training} training vectors, not enough for PQ; using int8 storage instead")
+            storage = 'int8'
+        
+        if storage == 'fp16':
+            return 'SQfp16'
+        if storage == 'int8':
+            return 'SQ8'
+        if storage == 'pq':
+            return f"PQ{params['pq_m']}x{params['pq_nbits']}"
+        return 'Flat'
+    
+    def _index_description(self, num_training: int = None) -> str:
+        """Build the FAISS index factory string for the configured index type."""
+        params = self.index_params
+        if self.index_type == 'flat':
+            return self._storage_description(num_training)
+        if self.index_type == 'hnsw':
+            if self.storage == 'float32':
+                return f"HNSW{params['hnsw_m']}"
+            return f"HNSW{params['hnsw_m']},{self._storage_description(num_training)}"
+        
+        nlist = params['nlist']
+        if num_training is not None:
+            # Too few training points for the requested number of lists
+            nlist = max(1, min(nlist, num_training // MIN_POINTS_PER_CENTROID))
+        
+        if self.index_type == 'ivf_pq':
+            if num_training is None or num_training >= 2 ** params['pq_nbits']:
+                return f"IVF{nlist},PQ{params['pq_m']}x{params['pq_nbits']}"
+            print(f"Only {num_training} training vectors, not enough for PQ; using IVF-Flat instead")
+            return f"IVF{nlist},Flat"
+        return f"IVF{nlist},{self._storage_description(num_training)}"
+    
+    def _create_index(self, num_training: int = None):
+        """Create an empty index (inner product for cosine similarity)."""
+        index = faiss.index_factory(
+            self.embedding_dim,
+            self._index_description(num_training),
+            faiss.METRIC_INNER_PRODUCT
+        )
+        if self.index_type == 'hnsw':
+            index.hnsw.efConstruction = self.index_params['ef_construction']
+        self._apply_search_params(index)
+        return index
+    
+    def _apply_search_params(self, index=None):
+        """Apply the query-time knobs (efSearch, nprobe) to the index."""
+        index = index if index is not None else self.index
+        parameter_space = faiss.ParameterSpace()
+        if self.index_type == 'hnsw':
+            parameter_space.set_index_parameter(index, 'efSearch', self.index_params['ef_search'])
+        elif self.index_type in ('ivf_flat', 'ivf_pq'):
+            parameter_space.set_index_parameter(index, 'nprobe', self.index_params['nprobe'])
     
-    def add_embeddings(self, embeddings: np.ndarray, metadata: List[Dict]):
-        """Add embeddings and metadata to the vector store."""
+    def set_search_params(self, ef_search: int = None, nprobe: int = None):
+        """Change the query-time knobs; higher values trade latency for recall."""
+        if ef_search is not None:
+            self.index_params['ef_search'] = ef_search
+        if nprobe is not None:
+            self.index_params['nprobe'] = nprobe
+        self._apply_search_params()
+    
+    def _merge_duplicates(self, embeddings: np.ndarray, metadata: List[Dict]) -> List[int]:
+        """Record chunks duplicating stored or earlier chunks on those, returning the positions to add."""
+        duplicate_index = self.duplicate_index
+        num_stored = self.index.ntotal
+        kept = []
+        
+        def vectors(ids: np.ndarray) -> np.ndarray:
+            result = np.empty((len(ids), self.embedding_dim), dtype='float32')
+            stored = ids < num_stored
+            if stored.any():
+                result[stored] = self.reconstruct(ids[stored])
+            if not stored.all():
+                result[~stored] = embeddings[[kept[idx - num_stored] for idx in ids[~stored]]]
+            return result
+        
+        for position, chunk in enumerate(metadata):
+            chunk_fingerprint = fingerprint(chunk['content'])
+            match = duplicate_index.find(chunk_fingerprint, embeddings[position], vectors)
+            if match is None:
+                duplicate_index.add(num_stored + len(kept), chunk_fingerprint)
+                kept.append(position)
+            elif match < num_stored:
+                duplicates = self.metadata[match].get('duplicates', [])
+                self.metadata.update(match, {'duplicates': duplicates + [duplicate_entry(chunk)]})
+            else:
+                representative = metadata[kept[match - num_stored]]
+                representative['duplicates'] = representative.get('duplicates', []) + [duplicate_entry(chunk)]
+        
+        if len(kept) < len(metadata):
+            print(f"Merged {len(metadata) - len(kept)} duplicate chunks")
+            self._metadata_index = None
+        return kept
+    
+    def add_embeddings(self, embeddings: np.ndarray, metadata: List[Dict]) -> int:
+        """Add embeddings and metadata to the vector store, returning the number of vectors added."""
         # Normalize embeddings for cosine similarity
         normalized_embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
-        self.index.add(normalized_embeddings.astype('float32'))
+        normalized_embeddings = normalized_embeddings.astype('float32')
+        
+        if self.deduplicate:
+            kept = self._merge_duplicates(normalized_embeddings, metadata)
+            normalized_embeddings = normalized_embeddings[kept]
+            metadata = [metadata[position] for position in kept]
+            if not metadata:
+                return 0
+        
+        if not self.index.is_trained:
+            self.index = self._create_index(len(normalized_embeddings))
+            print(f"Training {self.index_type} index on {len(normalized_embeddings)} vectors...")
+            self.index.train(normalized_embeddings)
+        
+        self._ensure_direct_map()
+        self.index.add(normalized_embeddings)
         self.metadata.extend(metadata)
+        if self.rerank:
+            self.full_vectors.extend(normalized_embeddings)
+        self.vector_ids = np.concatenate([
+            self.vector_ids, np.arange(self._next_vector_id, self._next_vector_id + len(metadata), dtype='int64')
+        ])
+        self.tombstones = np.concatenate([self.tombstones, np.zeros(len(metadata), dtype=bool)])
+        self._next_vector_id += len(metadata)
+        self._metadata_index = None
+        if not self.deduplicate:
+            self._duplicate_index = None
+        return len(metadata)
     
-    def search(self, query_embedding: np.ndarray, k: int = 5) -> List[Dict]:
-        """Search for similar embeddings."""
-        # Normalize query embedding
-        query_embedding = query_embedding / np.linalg.norm(query_embedding)
-        query_embedding = query_embedding.reshape(1, -1).astype('float32')
+    def reconstruct(self, ids: np.ndarray) -> np.ndarray:
+        """Return the stored normalized vectors for the given ids.
+        
+        Full-precision copies are returned when the store keeps them,
+        otherwise the vectors are decoded from the index.
+        """
+        if self._has_full_vectors():
+            return self.full_vectors.rows(ids)
+        
+        return self.index.reconstruct_batch(np.asarray(ids, dtype='int64'))
+    
+    def _ensure_direct_map(self):
+        """Let IVF indexes reconstruct vectors by id.
+        
+        Done whenever the index is replaced or added to, never by
+        ``reconstruct``, so searches of a shared store do not modify it.
+        """
+        ivf_index = faiss.try_extract_index_ivf(self.index)
+        if ivf_index is not None and ivf_index.direct_map.type == faiss.DirectMap.NoMap:
+            ivf_index.make_direct_map()
+    
+    def remove_ids(self, ids: List[int]):
+        """Remove embeddings by position; later positions shift down to match metadata."""
+        if len(ids) == 0:
+            return
+        
+        removed = set(ids)
+        if self.index_type != 'flat' and self.rerank and not self._has_full_vectors():
+            # Re-adding vectors decoded from lossy codes would compound the quantization error
+            raise ValueError(
+                "Cannot remove vectors from a compressed index without its full-precision vectors. "
+                "Rebuild the knowledge base to enable it."
+            )
+        # Loaded before the chunks it may have to be built from are removed
+        duplicate_index = self.duplicate_index if self.deduplicate else None
+        if self.index_type == 'flat':
+            self.index.remove_ids(np.array(sorted(removed), dtype='int64'))
+        else:
+            # HNSW cannot remove vectors and IVF does not renumber them,
+            # so rebuild from the remaining full-precision vectors, keeping
+            # any training
+            keep = np.array([i for i in range(self.index.ntotal) if i not in removed], dtype='int64')
+            vectors = self.reconstruct(keep) if len(keep) else None
+            index = faiss.clone_index(self.index)
+            index.reset()
+            self.index = index
+            self._ensure_direct_map()
+            if vectors is not None:
+                index.add(vectors)
+            self._apply_search_params()
+        
+        self.metadata.delete(removed)
+        if self.rerank:
+            self.full_vectors.delete(removed)
+        keep = np.ones(len(self.vector_ids), dtype=bool)
+        keep[list(removed)] = False
+        self.vector_ids = self.vector_ids[keep]
+        self.tombstones = self.tombstones[keep]
+        self._metadata_index = None
+        self._duplicate_index = duplicate_index.subset(np.flatnonzero(keep)) if duplicate_index else None
+        self._live_selector = None
+    
+    def delete(self, sources: Union[str, Iterable[str]]) -> int:
+        """Tombstone the chunks of one or more sources, returning the number of chunks deleted.
+        
+        A chunk that also stands for merged duplicates from other sources
+        is kept for them: it takes over the metadata of its first remaining
+        duplicate. Deleted chunks stay in the index, skipped by searches,
+        until ``compact``.
+        """
+        sources = {sources} if isinstance(sources, str) else set(sources)
+        if not sources or not len(self.metadata):
+            return 0
+        
+        deleted = []
+        metadata_index = self.metadata_index
+        for idx in metadata_index.match({'source': list(sources)}):
+            if self.tombstones[idx]:
+                continue
+            chunk = self.metadata[idx]
+            duplicates = [duplicate for duplicate in chunk.get('duplicates') or ()
+                          if duplicate['source'] not in sources]
+            if chunk['source'] not in sources:
+                changes = {'duplicates': duplicates}
+            elif duplicates:
+                promoted = {field: duplicates[0].get(field) for field in DUPLICATE_FIELDS}
+                changes = dict(promoted, duplicates=duplicates[1:])
+            else:
+                self.tombstones[idx] = True
+                deleted.append(idx)
+                metadata_index.remove(idx, chunk)
+                continue
+            self.metadata.update(idx, changes)
+            metadata_index.update(idx, chunk, dict(chunk, **changes))
+        
+        if self._duplicate_index is not None:
+            self._duplicate_index.remove(deleted)
+        self._live_selector = None
+        return len(deleted)
+    
+    def upsert(self, embeddings: np.ndarray, metadata: List[Dict]) -> int:
+        """Replace all chunks of the sources in metadata, returning the number of vectors added."""
+        self.delete({chunk['source'] for chunk in metadata})
+        return self.add_embeddings(embeddings, metadata)
+    
+    def compact(self) -> int:
+        """Physically remove deleted chunks, returning how many were removed.
+        
+        Positions of the remaining chunks shift down, their vector ids do not.
+        """
+        dead = np.flatnonzero(self.tombstones)
+        self.remove_ids(dead.tolist())
+        return len(dead)
+    
+    def chunk(self, idx: int) -> Dict:
+        """The chunk at a position, with its vector id."""
+        return dict(self.metadata[idx], vector_id=int(self.vector_ids[idx]))
+    
+    def get(self, vector_id: int) -> Optional[Dict]:
+        """The chunk with a vector id, or None if it was deleted."""
+        # Vector ids are assigned in increasing order and never reordered
+        idx = int(np.searchsorted(self.vector_ids, vector_id))
+        if idx == len(self.vector_ids) or self.vector_ids[idx] != vector_id or self.tombstones[idx]:
+            return None
+        return self.chunk(idx)
+    
+    def reset(self):
+        """Remove all embeddings and metadata; IVF indexes are retrained on the next add."""
+        self.index = self._create_index()
+        self.metadata = ChunkStore()
+        self.full_vectors = VectorFile(self.embedding_dim)
+        self.vector_ids = np.zeros(0, dtype='int64')
+        self.tombstones = np.zeros(0, dtype=bool)
+        self._metadata_index = None
+        self._duplicate_index = None
+        self._live_selector = None
+        self._saved_path = None
+    
+    def _search_parameters(self, selector):
+        """Search parameters restricting a scan to the selected ids, keeping the query-time knobs."""
+        if self.index_type == 'hnsw':
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=self.index_params['ef_search'])
+        if self.index_type in ('ivf_flat', 'ivf_pq'):
+            return faiss.SearchParametersIVF(sel=selector, nprobe=self.index_params['nprobe'])
+        return faiss.SearchParameters(sel=selector)
+    
+    def _live_search_parameters(self):
+        """Search parameters skipping deleted chunks, or None when nothing is deleted."""
+        if not self.tombstones.any():
+            return None
+        with self._lazy_lock:
+            if self._live_selector is None:
+                # The inner selector has to outlive the one wrapping it
+                dead = faiss.IDSelectorBatch(np.flatnonzero(self.tombstones).astype('int64'))
+                self._live_selector = (dead, faiss.IDSelectorNot(dead))
+            return self._search_parameters(self._live_selector[1])
+    
+    def _search_subset(self, query_embeddings: np.ndarray, ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Exactly score the queries against a small set of stored vectors."""
+        result_scores = np.full((len(query_embeddings), k), -np.inf, dtype='float32')
+        result_ids = np.full((len(query_embeddings), k), -1, dtype='int64')
+        if len(ids) == 0:
+            return result_scores, result_ids
+        
+        scores = query_embeddings @ self.reconstruct(ids).T
+        top = np.argsort(-scores, axis=1)[:, :k]
+        result_scores[:, :top.shape[1]] = np.take_along_axis(scores, top, axis=1)
+        result_ids[:, :top.shape[1]] = ids[top]
+        return result_scores, result_ids
+    
+    def _rerank(self, query_embeddings: np.ndarray, candidate_ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Re-score candidates against their full-precision vectors and keep the top k."""
+        valid = candidate_ids >= 0
+        vectors = self.full_vectors.rows(np.where(valid, candidate_ids, 0))
+        scores = np.einsum('qcd,qd->qc', vectors, query_embeddings)
+        scores[~valid] = -np.inf
+        
+        top = np.argsort(-scores, axis=1, kind='stable')[:, :k]
+        return np.take_along_axis(scores, top, axis=1), np.take_along_axis(candidate_ids, top, axis=1)
+    
+    def search_ids(self, query_embeddings: np.ndarray, k: int = 5,
+                   filters: Dict[str, Any] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return raw similarity scores and vector ids for a matrix of queries.
+        
+        With ``filters`` (field -> value or list of values, e.g.
+        ``{'source': [...], 'tags': 'finance'}``) only matching chunks are
+        considered: small matches are scored exactly, larger ones are
+        searched with a FAISS id selector so the filter applies during the
+        index scan. Deleted chunks are never returned.
+        """
+        # Normalize query embeddings
+        query_embeddings = query_embeddings / np.linalg.norm(query_embeddings, axis=1, keepdims=True)
+        query_embeddings = query_embeddings.astype('float32')
+        
+        # Over-fetch from compressed codes, then re-rank exactly
+        num_candidates = k * self.rerank_factor if self._has_full_vectors() else k
         
-        # Search
-        scores, indices = self.index.search(query_embedding, k)
+        if not filters:
+            # Search
+            params = self._live_search_parameters()
+            scores, ids = self.index.search(query_embeddings, num_candidates, params=params)
+        else:
+            matching_ids = self.metadata_index.match(filters)
+            matching_ids = matching_ids[~self.tombstones[matching_ids]]
+            if len(matching_ids) <= FILTER_EXACT_MAX_IDS:
+                return self._search_subset(query_embeddings, matching_ids, k)
+            
+            selector = faiss.IDSelectorBatch(matching_ids)
+            scores, ids = self.index.search(query_embeddings, num_candidates,
+                                            params=self._search_parameters(selector))
         
-        results = []
-        for i, (score, idx) in enumerate(zip(scores[0], indices[0])):
-            if idx != -1:  # Valid result
-                result = self.metadata[idx].copy()
-                result['similarity_score'] = float(score)
-                result['rank'] = i + 1
-                results.append(result)
+        if num_candidates == k:
+            return scores, ids
+        return self._rerank(query_embeddings, ids, k)
+    
+    def search(self, query_embedding: np.ndarray, k: int = 5, filters: Dict[str, Any] = None) -> List[Dict]:
+        """Search for similar embeddings."""
+        return self.search_batch(query_embedding.reshape(1, -1), k=k, filters=filters)[0]
+    
+    def search_batch(self, query_embeddings: np.ndarray, k: int = 5,
+                     filters: Dict[str, Any] = None) -> List[List[Dict]]:
+        """Search for similar embeddings for several queries with one index scan."""
+        scores, indices = self.search_ids(query_embeddings, k, filters=filters)
         
-        return results
+        all_results = []
+        for query_scores, query_indices in zip(scores, indices):
+            results = []
+            for i, (score, idx) in enumerate(zip(query_scores, query_indices)):
+                if idx != -1:  # Valid result
+                    result = self.chunk(idx)
+                    result['similarity_score'] = float(score)
+                    result['rank'] = i + 1
+                    results.append(result)
+            all_results.append(results)
+        
+        return all_results
     
     def save(self, filepath: str):
         """Save the vector store to disk."""
@@ -45,20 +526,85 @@ class VectorStore:
         # Save FAISS index
         faiss.write_index(self.index, f"{filepath}.faiss")
         
-        # Save metadata
-        with open(f"{filepath}.metadata", 'wb') as f:
-            pickle.dump({
-                'metadata': self.metadata,
-                'embedding_dim': self.embedding_dim
+        # Save chunk metadata in columnar form
+        self.metadata.save(filepath)
+        
+        # Save full-precision vectors for re-ranking
+        if self.rerank:
+            self.full_vectors.save(filepath)
+        
+        # Save the duplicate index, or drop one that would no longer match
+        if self.deduplicate:
+            self.duplicate_index.save(filepath)
+        else:
+            DuplicateIndex.remove_files(filepath)
+        
+        # Save vector ids and deletions
+        np.save(f"{filepath}.vector_ids.npy", self.vector_ids)
+        np.save(f"{filepath}.tombstones.npy", self.tombstones)
+        
+        # Save store settings
+        with open(f"{filepath}.metadata", 'w', encoding='utf-8') as f:
+            json.dump({
+                'embedding_dim': self.embedding_dim,
+                'index_type': self.index_type,
+                'storage': self.storage,
+                'num_full_vectors': len(self.full_vectors),
+                'next_vector_id': self._next_vector_id,
+                'index_params': self.index_params
             }, f)
+        self._saved_path = filepath
+    
+    @staticmethod
+    def read_settings(filepath: str) -> Dict:
+        """Read the settings of a saved vector store without loading it."""
+        with open(f"{filepath}.metadata", 'rb') as f:
+            raw = f.read()
+        if raw.startswith(b'\x80'):
+            raise ValueError(
+                f"{filepath}.metadata is a legacy pickled store, which is no longer loaded. "
+                "Please rebuild the knowledge base."
+            )
+        return json.loads(raw)
     
     def load(self, filepath: str):
         """Load the vector store from disk."""
+        # Load store settings
+        data = self.read_settings(filepath)
+        self.embedding_dim = data['embedding_dim']
+        self.index_type = data['index_type']
+        self.storage = data.get('storage', 'float32')
+        # Keep query-time knobs from the current configuration
+        for key in ('hnsw_m', 'ef_construction', 'nlist', 'pq_m', 'pq_nbits'):
+            self.index_params[key] = data['index_params'][key]
+        
         # Load FAISS index
         self.index = faiss.read_index(f"{filepath}.faiss")
+        self._ensure_direct_map()
+        self._apply_search_params()
         
-        # Load metadata
-        with open(f"{filepath}.metadata", 'rb') as f:
-            data = pickle.load(f)
-            self.metadata = data['metadata']
-            self.embedding_dim = data['embedding_dim']
\ No newline at end of file
+        # Memory-map chunk metadata
+        self.metadata = ChunkStore()
+        self.metadata.load(filepath)
+        self._metadata_index = None
+        self._duplicate_index = None
+        self._saved_path = filepath
+        
+        # Stores saved before vector ids existed number their chunks by position
+        if os.path.exists(f"{filepath}.vector_ids.npy"):
+            self.vector_ids = np.load(f"{filepath}.vector_ids.npy")
+            self.tombstones = np.load(f"{filepath}.tombstones.npy")
+        else:
+            self.vector_ids = np.arange(self.index.ntotal, dtype='int64')
+            self.tombstones = np.zeros(self.index.ntotal, dtype=bool)
+        self._next_vector_id = data.get('next_vector_id', len(self.vector_ids))
+        self._live_selector = None
+        
+        # Memory-map full-precision vectors
+        self.full_vectors = VectorFile(self.embedding_dim)
+        if self.rerank:
+            if os.path.exists(f"{filepath}.vectors"):
+                self.full_vectors.load(filepath, data.get('num_full_vectors'))
+            if not self._has_full_vectors():
+                print("Full-precision vectors are missing, searching without re-ranking. "
+                      "Rebuild the knowledge base to enable it.")